@@ -0,0 +1,203 @@
+import asyncio
+import functools
+import networkList
+import usbAttached
+import userLastPID
+import usersMRUList
+import utils
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+# Blocking extractions running at the same time.
+DEFAULT_CONCURRENCY = 8
+
+# Records waiting to be consumed before the collectors stop extracting more.
+DEFAULT_QUEUE_SIZE = 1024
+
+
+class Runner:
+    """
+        Runs the blocking collector functions on a thread pool, with at most
+        some of them running at the same time.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, executor=None):
+        """
+            @param concurrency: Blocking calls running at the same time.
+            @param executor: concurrent.futures executor, the default one of the loop by default.
+        """
+        self.executor = executor
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(self, function, *args):
+        """
+            Runs a blocking function on the thread pool and returns its result.
+            @param function: Blocking function.
+            @param args: Arguments of the function.
+        """
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(function, *args))
+
+    async def gather(self, function, items):
+        """
+            Runs a blocking function for every item concurrently, and yields
+            its results as they're ready.
+            @param function: Blocking function that takes an item.
+            @param items: Arguments of the function.
+        """
+        tasks = [asyncio.ensure_future(self.run(function, item)) for item in items]
+
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+
+        finally:
+            # Don't leave the pending reads behind if the consumer stops.
+            for task in tasks:
+                task.cancel()
+
+
+def _list_records(records_function, item):
+    """ Returns every record yielded by a collector, so it's read on a single thread call. """
+    return list(records_function(item))
+
+
+async def _users(runner, user_sids):
+    if user_sids is None:
+        return await runner.run(utils.users_list)
+
+    return user_sids
+
+
+async def recent_docs(user_sids=None, runner=None):
+    """
+        Yields the RecentDoc records of some users, the users are read
+        concurrently and their records are yielded as each user is done.
+        @param user_sids: User sids, every user by default.
+        @param runner: Runner shared with other collectors.
+    """
+    runner = runner or Runner()
+    read_user = functools.partial(_list_records, usersMRUList.recent_docs_records)
+
+    async for user_records in runner.gather(read_user, await _users(runner, user_sids)):
+        for record in user_records:
+            yield record
+
+
+async def last_pids(user_sids=None, runner=None):
+    """
+        Yields the LastProcess records of some users, the users are read
+        concurrently and their records are yielded as each user is done.
+        @param user_sids: User sids, every user by default.
+        @param runner: Runner shared with other collectors.
+    """
+    runner = runner or Runner()
+    read_user = functools.partial(_list_records, userLastPID.last_pid_records)
+
+    async for user_records in runner.gather(read_user, await _users(runner, user_sids)):
+        for record in user_records:
+            yield record
+
+
+async def usb_devices(runner=None):
+    """
+        Yields the UsbDevice records, the devices are read concurrently and
+        yielded as each one is done.
+        @param runner: Runner shared with other collectors.
+    """
+    runner = runner or Runner()
+
+    # The subkey indexes are built before the devices are read, so they're
+    # built once instead of once per thread.
+    indexes = dict()
+    await runner.run(usbAttached.get_index, indexes, "SYSTEM\\CurrentControlSet\\Enum\\STORAGE\\Volume")
+    await runner.run(usbAttached.get_index, indexes, "SOFTWARE\\Microsoft\\Windows Portable Devices\\Devices")
+
+    sub_keys = await runner.run(list, usbAttached.enum_usb())
+
+    def read_device(sub_key):
+        # The lazy fields are read on the thread pool, not on the event loop.
+        return usbAttached.usb_device(sub_key, indexes).resolve()
+
+    async for record in runner.gather(read_device, sub_keys):
+        yield record
+
+
+async def networks(runner=None):
+    """
+        Yields the Network records.
+        @param runner: Runner shared with other collectors.
+    """
+    runner = runner or Runner()
+
+    def read_networks():
+        return [network.resolve() for network in networkList.network_list()]
+
+    for record in await runner.run(read_networks):
+        yield record
+
+
+async def collect_all(artifacts=("networks", "usb", "mru", "lastpid"), concurrency=DEFAULT_CONCURRENCY,
+                      executor=None, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+        Runs several collectors concurrently and yields their records as they
+        are ready.
+        @param artifacts: Names of the collectors ('networks', 'usb', 'mru', 'lastpid').
+        @param concurrency: Blocking calls running at the same time.
+        @param executor: concurrent.futures executor, the default one of the loop by default.
+        @param queue_size: Records waiting to be consumed, the collectors wait while it's full.
+    """
+    runner = Runner(concurrency, executor)
+    user_sids = None
+    if "mru" in artifacts or "lastpid" in artifacts:
+        user_sids = await runner.run(utils.users_list)
+
+    generators = list()
+    if "networks" in artifacts:
+        generators.append(networks(runner))
+    if "usb" in artifacts:
+        generators.append(usb_devices(runner))
+    if "mru" in artifacts:
+        generators.append(recent_docs(user_sids, runner))
+    if "lastpid" in artifacts:
+        generators.append(last_pids(user_sids, runner))
+
+    queue = asyncio.Queue(maxsize=queue_size)
+    done = object()
+
+    async def drain(generator):
+        cancelled = False
+        try:
+            async for record in generator:
+                await queue.put(record)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # Nobody reads the queue once the tasks are cancelled, it may stay full.
+            if not cancelled:
+                await queue.put(done)
+
+    tasks = [asyncio.ensure_future(drain(generator)) for generator in generators]
+
+    try:
+        running = len(tasks)
+        while running:
+            record = await queue.get()
+            if record is done:
+                running -= 1
+            else:
+                yield record
+
+        # Raise the errors of the collectors.
+        for task in tasks:
+            task.result()
+
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,227 @@
+import argparse
+import os
+import registry
+import utils
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+# Hive file names, the machine hives are searched outside of the RegBack folders.
+MACHINE_HIVES = ("SOFTWARE", "SYSTEM")
+USER_HIVE = "NTUSER.DAT"
+
+
+def find_hives(host_path):
+    """
+        Returns the hive files of a host collection.
+        @param host_path: Directory with the hives collected from a single host.
+
+        @returns dict: {'software': path, 'system': path, 'users': {profile name: path}}.
+    """
+    hives = {"software": None, "system": None, "users": dict()}
+
+    for directory, sub_dirs, files in os.walk(host_path):
+        # Walk the tree in the same order on every run.
+        sub_dirs[:] = sorted(name for name in sub_dirs if name.lower() != "regback")
+
+        for file_name in sorted(files):
+            upper_name = file_name.upper()
+
+            if upper_name in MACHINE_HIVES and hives[upper_name.lower()] is None:
+                hives[upper_name.lower()] = os.path.join(directory, file_name)
+
+            elif upper_name == USER_HIVE:
+                # The profile directory name is the user name.
+                profile_name = os.path.basename(directory)
+                hives["users"].setdefault(profile_name, os.path.join(directory, file_name))
+
+    return hives
+
+
+def find_hosts(root):
+    """
+        Returns the host collections of a directory tree, sorted by name.
+        Every sub directory of the root is a collection of a single host.
+        @param root: Directory tree of per-host hive collections.
+    """
+    hosts = list()
+
+    for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+        if entry.is_dir():
+            hosts.append((entry.name, find_hives(entry.path)))
+
+    return hosts
+
+
+def load_host(hives):
+    """
+        Loads the hives of a host, the NTUSER.DAT hives are mounted under the
+        SID of the profile with the same user name.
+        @param hives: Hives returned by find_hives.
+
+        @returns dict: Loaded user SIDs and their profile name.
+    """
+    offline = registry.use_hives(software=hives["software"], system=hives["system"])
+    users = dict()
+
+    try:
+        for profile_name, ntuser in hives["users"].items():
+            try:
+                user_sid = utils.user2sid(profile_name)
+            except FileNotFoundError:
+                user_sid = None
+
+            if user_sid is not None:
+                offline.load(registry.HKEY_USERS, user_sid, ntuser)
+                users[user_sid] = profile_name
+
+    # The hives loaded before the failing one are unmapped.
+    except (Exception, SystemExit):
+        offline.close()
+        raise
+
+    return users
+
+
+def _recent_docs(user_sid):
+    """ Returns the recently opened files of a user, read before the hives are closed. """
+    import usersMRUList
+
+    files = dict()
+    root_last_modified_date = 0
+
+    for ext, (names, date), root_last_modified_date in usersMRUList.recent_docs(user_sid):
+        files[ext] = (list(names), date)
+
+    return files, root_last_modified_date
+
+
+def _run(errors, name, collector, *args):
+    """ Runs a collector, storing its error instead of raising it. """
+    try:
+        return collector(*args)
+
+    # Collectors exit when they can't read a key.
+    except (Exception, SystemExit) as e:
+        errors[name] = "{0}: {1}".format(type(e).__name__, e)
+        return None
+
+
+def collect_host(host, hives):
+    """
+        Runs every collector against the hives of a single host.
+        @param host: Host name.
+        @param hives: Hives returned by find_hives.
+
+        @returns dict: The collected artifacts and the errors of each collector.
+    """
+    # The collectors are imported here, so the workers load them once.
+    import networkList
+    import usbAttached
+    import userLastPID
+    import usersMRUList
+
+    result = {"host": host, "users": dict(), "networks": None, "usb": None,
+              "mru": dict(), "lastpid": dict(), "errors": dict()}
+    errors = result["errors"]
+
+    try:
+        result["users"] = load_host(hives)
+    except Exception as e:
+        errors["host"] = "{0}: {1}".format(type(e).__name__, e)
+        return result
+
+    try:
+        # The keys shared by the collectors are read once.
+        with registry.cached():
+            # The lazy fields are read before the hives are closed.
+            result["networks"] = _run(errors, "networks",
+                                      lambda: [network.resolve() for network in networkList.network_list()])
+            result["usb"] = _run(errors, "usb",
+                                 lambda: [device.resolve() for device in usbAttached.prev_attached_usb()])
+
+            for user_sid in result["users"]:
+                result["mru"][user_sid] = _run(errors, "mru " + user_sid, _recent_docs, user_sid)
+                result["lastpid"][user_sid] = _run(errors, "lastpid " + user_sid,
+                                                   userLastPID.last_pid, user_sid, False)
+
+    finally:
+        registry.get_backend().close()
+
+    return result
+
+
+def process_hosts(root, jobs=None):
+    """
+        Runs the collectors against every host collection of a directory tree,
+        one host per worker process.
+        The results are yielded in host name order, each one as soon as it and
+        the hosts before it are finished.
+        @param root: Directory tree of per-host hive collections.
+        @param jobs: Number of worker processes, the number of CPUs by default.
+    """
+    # Imported here, the single host loaders (pyreg.py --hives) don't pay for it.
+    import concurrent.futures
+
+    hosts = find_hosts(root)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(collect_host, host, hives): inx for inx, (host, hives) in enumerate(hosts)}
+
+        # Results finished before the hosts that sort first, by host index.
+        finished = dict()
+        next_inx = 0
+
+        for future in concurrent.futures.as_completed(futures):
+            inx = futures[future]
+
+            try:
+                finished[inx] = future.result()
+
+            # The worker process died.
+            except Exception as e:
+                finished[inx] = {"host": hosts[inx][0], "users": dict(), "networks": None, "usb": None,
+                                 "mru": dict(), "lastpid": dict(),
+                                 "errors": {"host": "{0}: {1}".format(type(e).__name__, e)}}
+
+            while next_inx in finished:
+                yield finished.pop(next_inx)
+                next_inx += 1
+
+
+def print_host(result):
+    print("\n[*] Host: {0}".format(result["host"]))
+
+    for network in result["networks"] or list():
+        print("\t[+] Network name: {0}\tMac address: {1}".format(network.name, network.mac_address))
+
+    for device in result["usb"] or list():
+        first_attached = utils.get_time(device.first_attached) if device.first_attached is not None else None
+        print("\t[+] USB device: {0}\tFirst date attached: {1}".format(device.device_name, first_attached))
+
+    for user_sid, profile_name in result["users"].items():
+        mru = result["mru"].get(user_sid)
+        for file_extension, (files, _) in (mru[0] if mru else dict()).items():
+            for file in files:
+                print("\t[+] {0} recent {1} file: {2}".format(profile_name, file_extension, file))
+
+        lastpid = result["lastpid"].get(user_sid)
+        for process in (lastpid[1] if lastpid else list()):
+            print("\t[+] {0} process: {1}".format(profile_name, process))
+
+    for collector, error in result["errors"].items():
+        print("\t[!!] {0} failed: {1}".format(collector, error))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to run every collector against a directory of per-host hive collections.")
+    parser.add_argument("root", action="store", help="Directory with a sub directory of hives per host.")
+    parser.add_argument("-j", dest="jobs", action="store", type=int, default=None, help="Number of worker processes.")
+
+    args = parser.parse_args()
+
+    for host_result in process_hosts(args.root, args.jobs):
+        print_host(host_result)
@@ -0,0 +1,443 @@
+import argparse
+import batch
+import collections
+import hivegen
+import json
+import networkList
+import os
+import registry
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+import usbAttached
+import userLastPID
+import usersMRUList
+import utc
+import utils
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+# Default size of the synthetic host.
+DEFAULT_SCALE = {"usb": 1000, "users": 100, "networks": 200, "extensions": 10, "files": 50, "processes": 20}
+
+# Allowed throughput and peak memory change before a result is a regression.
+DEFAULT_TOLERANCE = 0.25
+
+PYREG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pyreg.py")
+
+# Command lines of pyreg.py whose startup is measured, '{hives}' is a small synthetic host.
+STARTUP_COMMANDS = {
+    "pyreg_help": ["--help"],
+    "pyreg_networks": ["--hives", "{hives}", "networks", "--format", "jsonl"],
+    "pyreg_all": ["--hives", "{hives}", "all", "--format", "jsonl"],
+}
+
+
+def legacy_remove_chars(key_value):
+    """ The byte by byte version of utils.remove_chars, kept as a reference. """
+    filename = list()
+    for byte in key_value:
+
+        try:
+            char = chr(byte).encode('utf-8')
+            readable_char = chr(ord(char))
+
+            if not (readable_char in utils.NOT_READABLE_CHARS):
+                filename.append(readable_char)
+            else:
+                continue
+
+        except TypeError:
+            continue
+
+    return "".join(filename)
+
+
+def fat_datetime(year, month, day, hour, minute, second):
+    """ Returns an encoded FAT date and time. """
+    date = ((year - 1980) << 9) | (month << 5) | day
+    time = (hour << 11) | (minute << 5) | (second // 2)
+    return struct.pack("<HH", date, time)
+
+
+def recent_docs_value(filename, file_size=4096):
+    """
+        Returns a RecentDocs value like the ones written by the explorer: the
+        UTF-16LE file name, a file entry shell item with its 0xbeef0004
+        extension block, and the name of the shortcut.
+        @param filename: Name of the opened file.
+        @param file_size: Size of the opened file.
+    """
+    modified = fat_datetime(2021, 6, 15, 8, 9, 10)
+    short_name = filename.split(".")[0][:6].upper().encode("ascii", "replace") + b"~1.LNK\x00"
+    short_name += b"\x00" * (len(short_name) % 2)
+    lnk_name = (filename + ".lnk").encode("utf-16-le") + b"\x00\x00"
+
+    # Extension block, version 9 (Windows 8 and later).
+    extension = struct.pack("<HHI", 0, 9, 0xbeef0004) + modified + modified
+    extension += struct.pack("<HHQQHII", 0x2e, 0, 0x0001000000001234, 0, 0, 0, 0)
+    extension += lnk_name + struct.pack("<H", 20)
+    extension = struct.pack("<H", len(extension)) + extension[2:]
+
+    shell_item = struct.pack("<BBI", 0x32, 0, file_size) + modified + struct.pack("<H", 0x20)
+    shell_item += short_name + extension
+    shell_item = struct.pack("<H", len(shell_item) + 2) + shell_item
+
+    return filename.encode("utf-16-le") + b"\x00\x00" + shell_item + b"\x00\x00" + lnk_name
+
+
+def bench_remove_chars(number):
+    """
+        Times the sanitizer on realistic RecentDocs values.
+        @param number: Number of times each value is sanitized.
+
+        @returns tuple: Seconds spent by the legacy and the current versions.
+    """
+    values = [recent_docs_value("quarterly report {0}.docx".format(inx)) for inx in range(100)]
+
+    legacy = timeit.timeit(lambda: [legacy_remove_chars(value) for value in values], number=number)
+    current = timeit.timeit(lambda: [utils.remove_chars(value) for value in values], number=number)
+    return legacy, current
+
+
+class CountingRegistry:
+    """ Registry backend wrapper that counts the calls made to each function. """
+
+    FUNCTIONS = ("OpenKeyEx", "OpenKey", "CloseKey", "EnumKey", "EnumValue", "QueryValueEx", "QueryInfoKey")
+
+    def __init__(self, backend):
+        """
+            @param backend: Wrapped registry backend.
+        """
+        self.backend = backend
+        self.calls = collections.Counter()
+
+    def __getattr__(self, name):
+        function = getattr(self.backend, name)
+        if name not in self.FUNCTIONS:
+            return function
+
+        def counted(*args):
+            self.calls[name] += 1
+            return function(*args)
+
+        return counted
+
+
+def measure(function, repeat=3):
+    """
+        Runs a benchmark: the best time of some runs, then a traced run for
+        the peak memory and the registry calls.
+        @param function: Benchmark function, returns the number of processed items.
+        @param repeat: Timed runs.
+
+        @returns dict: items, seconds, items_per_second, peak_bytes and calls.
+    """
+    seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = function()
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+    counting = CountingRegistry(registry.get_backend())
+    previous = registry.set_backend(counting)
+    tracemalloc.start()
+
+    try:
+        function()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+
+    finally:
+        tracemalloc.stop()
+        registry.set_backend(previous)
+
+    return {"items": items, "seconds": seconds, "items_per_second": items / seconds if seconds else 0.0,
+            "peak_bytes": peak_bytes, "calls": sum(counting.calls.values())}
+
+
+def collector_benchmarks(user_sids):
+    """
+        Returns the collector benchmarks: name and function that returns the
+        number of processed items.
+        @param user_sids: Sids of the loaded users.
+    """
+    def recent_docs():
+        return sum(1 for user_sid in user_sids
+                   for _, (files, _), _ in usersMRUList.recent_docs(user_sid) for _ in files)
+
+    def last_pid():
+        return sum(len(userLastPID.last_pid(user_sid, False)[1]) for user_sid in user_sids)
+
+    # The lazy fields are read, as a full extraction does.
+    return [("network_list", lambda: len([network.resolve() for network in networkList.network_list()])),
+            ("prev_attached_usb", lambda: len([device.resolve() for device in usbAttached.prev_attached_usb()])),
+            ("recent_docs", recent_docs),
+            ("last_pid", last_pid)]
+
+
+def helper_benchmarks(scale):
+    """
+        Returns the helpers benchmarks, on values like the ones of the synthetic host.
+        @param scale: Size of the synthetic host.
+    """
+    mru_values = [recent_docs_value("file {0}.docx".format(inx)) for inx in range(scale["files"])] * 100
+    mru_lists = [hivegen.mru_list_ex(list(reversed(range(scale["files"]))))] * 10000
+    system_times = [hivegen.systemtime(2015 + inx % 10, 1 + inx % 12, 1 + inx % 28, inx % 24)
+                    for inx in range(10000)]
+
+    def remove_chars():
+        for value in mru_values:
+            utils.remove_chars(value)
+        return len(mru_values)
+
+    def parse_mru_inx():
+        for value in mru_lists:
+            utils.parse_mru_inx(value)
+        return len(mru_lists)
+
+    def get_utc():
+        for value in system_times:
+            utc.get_utc(value)
+        return len(system_times)
+
+    return [("remove_chars", remove_chars), ("parse_mru_inx", parse_mru_inx), ("get_utc", get_utc)]
+
+
+def run_suite(scale, hives_dir=None, repeat=3):
+    """
+        Runs every benchmark on a synthetic host.
+        @param scale: Size of the synthetic host, as DEFAULT_SCALE.
+        @param hives_dir: Directory of the synthetic host, a temporary one by default.
+            The hives are written when the directory doesn't have them.
+        @param repeat: Timed runs of each benchmark.
+
+        @returns dict: Results of each benchmark.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        hives_dir = hives_dir or temp_dir
+
+        if not os.path.exists(os.path.join(hives_dir, "SYSTEM")):
+            hivegen.generate(hives_dir, scale["usb"], scale["users"], scale["networks"], scale["extensions"],
+                             scale["files"], scale["processes"])
+
+        try:
+            previous = registry.get_backend()
+        except OSError:
+            previous = None
+
+        user_sids = list(batch.load_host(batch.find_hives(hives_dir)))
+
+        try:
+            results = dict()
+            for name, function in collector_benchmarks(user_sids) + helper_benchmarks(scale):
+                results[name] = measure(function, repeat)
+
+            return results
+
+        finally:
+            registry.get_backend().close()
+            registry.set_backend(previous)
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+        Returns the regressions of some results against a baseline.
+        The registry calls must not grow, the throughput and the peak memory
+        may change by the tolerance.
+        @param results: Results returned by run_suite.
+        @param baseline: Results of a previous run.
+        @param tolerance: Allowed change, as a fraction of the baseline.
+
+        @returns list: Regression descriptions.
+    """
+    regressions = list()
+
+    for name, expected in sorted(baseline.items()):
+        result = results.get(name)
+        if result is None:
+            regressions.append("{0}: not measured".format(name))
+            continue
+
+        if result["calls"] > expected["calls"]:
+            regressions.append("{0}: {1} registry calls, {2} on the baseline".format(
+                name, result["calls"], expected["calls"]))
+
+        if result["items_per_second"] < expected["items_per_second"] * (1 - tolerance):
+            regressions.append("{0}: {1:.0f} items/s, {2:.0f} on the baseline".format(
+                name, result["items_per_second"], expected["items_per_second"]))
+
+        if result["peak_bytes"] > expected["peak_bytes"] * (1 + tolerance):
+            regressions.append("{0}: {1} bytes of peak memory, {2} on the baseline".format(
+                name, result["peak_bytes"], expected["peak_bytes"]))
+
+    return regressions
+
+
+def parse_importtime(report):
+    """
+        Parses the -X importtime report of a process.
+        @param report: Standard error of the process.
+
+        @returns tuple: Seconds spent importing the top level modules, and the names of every imported module.
+    """
+    import_seconds = 0.0
+    modules = list()
+
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+
+        _, cumulative, name = line.split("|", 2)
+        modules.append(name.strip())
+
+        # The nested imports are indented, their time is part of the cumulative time of their parent.
+        if len(name) - len(name.lstrip()) == 1:
+            import_seconds += int(cumulative) / 1e6
+
+    return import_seconds, sorted(set(modules))
+
+
+def measure_startup(arguments, repeat=3):
+    """
+        Runs pyreg.py on a new interpreter: the best wall time and import
+        time of some runs, and the modules it imports.
+        @param arguments: Arguments of pyreg.py.
+        @param repeat: Runs.
+
+        @returns dict: seconds, import_seconds and modules.
+    """
+    seconds = import_seconds = None
+    modules = list()
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime", PYREG] + arguments, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        elapsed = time.perf_counter() - start
+
+        run_import_seconds, modules = parse_importtime(process.stderr)
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+        import_seconds = run_import_seconds if import_seconds is None else min(import_seconds, run_import_seconds)
+
+    return {"seconds": seconds, "import_seconds": import_seconds, "modules": modules}
+
+
+def startup_suite(repeat=3):
+    """
+        Measures the startup of the pyreg.py command lines, on a small synthetic host.
+        @param repeat: Runs of each command line.
+
+        @returns dict: Results of each command line.
+    """
+    with tempfile.TemporaryDirectory() as hives_dir:
+        hivegen.generate(hives_dir, 10, 2, 10, 2, 5, 5)
+
+        return {name: measure_startup([argument.format(hives=hives_dir) for argument in arguments], repeat)
+                for name, arguments in STARTUP_COMMANDS.items()}
+
+
+def compare_startup(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+        Returns the startup regressions of some results against a baseline:
+        modules that weren't imported before, and import time grown more
+        than the tolerance.
+        @param results: Results returned by startup_suite.
+        @param baseline: Results of a previous run.
+        @param tolerance: Allowed change, as a fraction of the baseline.
+
+        @returns list: Regression descriptions.
+    """
+    regressions = list()
+
+    for name, expected in sorted(baseline.items()):
+        result = results.get(name)
+        if result is None:
+            regressions.append("{0}: not measured".format(name))
+            continue
+
+        new_modules = sorted(set(result["modules"]) - set(expected["modules"]))
+        if new_modules:
+            regressions.append("{0}: imports {1}".format(name, ", ".join(new_modules)))
+
+        if result["import_seconds"] > expected["import_seconds"] * (1 + tolerance):
+            regressions.append("{0}: {1:.1f} ms of imports, {2:.1f} ms on the baseline".format(
+                name, result["import_seconds"] * 1000, expected["import_seconds"] * 1000))
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to benchmark the collectors and their helpers.")
+    parser.add_argument("-n", dest="number", action="store", type=int, default=100,
+                        help="Iterations of the remove_chars comparison.")
+    parser.add_argument("-r", dest="repeat", action="store", type=int, default=3, help="Timed runs of each benchmark.")
+    parser.add_argument("--hives", dest="hives", action="store", default=None,
+                        help="Directory of the synthetic host, it's written when it doesn't have hives.")
+    for scale_name, scale_value in DEFAULT_SCALE.items():
+        parser.add_argument("--{0}".format(scale_name), dest=scale_name, action="store", type=int,
+                            default=scale_value, help="Synthetic host {0}, {1} by default.".format(scale_name,
+                                                                                                 scale_value))
+    parser.add_argument("--save-baseline", dest="save_baseline", action="store", default=None,
+                        help="Write the results to a baseline file.")
+    parser.add_argument("--baseline", dest="baseline", action="store", default=None,
+                        help="Fail when the results regress against a baseline file.")
+    parser.add_argument("--tolerance", dest="tolerance", action="store", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed throughput and peak memory change against the baseline.")
+
+    args = parser.parse_args()
+    scale = {scale_name: getattr(args, scale_name) for scale_name in DEFAULT_SCALE}
+
+    legacy, current = bench_remove_chars(args.number)
+    values = args.number * 100
+
+    print("[*] remove_chars on {0} RecentDocs values".format(values))
+    print("\t[+] Byte by byte: {0:.3f}s ({1:.0f} values/s)".format(legacy, values / legacy))
+    print("\t[+] Translation table: {0:.3f}s ({1:.0f} values/s)".format(current, values / current))
+    print("\t[+] Speedup: {0:.1f}x".format(legacy / current))
+
+    print("\n[*] Synthetic host: {0}".format(", ".join("{0} {1}".format(value, name) for name, value in scale.items())))
+    results = run_suite(scale, args.hives, args.repeat)
+
+    for name, result in results.items():
+        print("\t[+] {0}: {1} items in {2:.3f}s ({3:.0f} items/s), peak memory {4:.1f} KiB, {5} registry calls".format(
+            name, result["items"], result["seconds"], result["items_per_second"], result["peak_bytes"] / 1024,
+            result["calls"]))
+
+    startup = startup_suite(args.repeat)
+
+    print("\n[*] pyreg.py startup")
+    for name, result in startup.items():
+        print("\t[+] {0}: {1:.3f}s, {2:.1f} ms of imports, {3} modules".format(
+            name, result["seconds"], result["import_seconds"] * 1000, len(result["modules"])))
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump({"scale": scale, "results": results, "startup": startup}, baseline_file, indent=4)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        if baseline["scale"] != scale:
+            print("[!!] The baseline was measured on another synthetic host: {0}".format(baseline["scale"]),
+                  file=sys.stderr)
+            sys.exit(2)
+
+        regressions = compare(results, baseline["results"], args.tolerance)
+        regressions.extend(compare_startup(startup, baseline.get("startup", dict()), args.tolerance))
+        for regression in regressions:
+            print("[!!] Regression: {0}".format(regression), file=sys.stderr)
+
+        if regressions:
+            sys.exit(1)
+
+        print("\n[*] No regressions against {0}".format(args.baseline))
@@ -0,0 +1,119 @@
+import argparse
+import networkList
+import output
+import registry
+import sys
+import usbAttached
+import userLastPID
+import usersMRUList
+import utils
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+# Keys read by each artifact collector: machine paths and per-user paths.
+ARTIFACTS = {
+    "networks": (networkList.KEY_PATHS, list()),
+    "usb": (usbAttached.KEY_PATHS, list()),
+    "mru": (list(), usersMRUList.KEY_PATHS + utils.USER_KEY_PATHS),
+    "lastpid": (list(), userLastPID.KEY_PATHS + utils.USER_KEY_PATHS),
+}
+
+
+def plan(user_sids, artifacts=tuple(ARTIFACTS)):
+    """
+        Returns the union of the key paths read by some collectors, sorted by
+        hive and path. Paths inside the subtree of another one are dropped.
+        @param user_sids: Sids of the users to collect.
+        @param artifacts: Names of the collectors.
+
+        @returns list: (root key, path, levels of subkeys) tuples.
+    """
+    depths = dict()
+
+    def add(root, path, depth):
+        names = tuple(name.lower() for name in path.split("\\") if name)
+        depths[(root, names)] = max(depth, depths.get((root, names), 0))
+
+    for root, path, depth in utils.KEY_PATHS:
+        add(root, path, depth)
+
+    for artifact in artifacts:
+        machine_paths, user_paths = ARTIFACTS[artifact]
+
+        for root, path, depth in machine_paths:
+            add(root, path, depth)
+
+        for user_sid in user_sids:
+            for root, path, depth in user_paths:
+                add(root, path.format(user_sid), depth)
+
+    paths = list()
+    for (root, names), depth in sorted(depths.items()):
+        covered = False
+
+        # An ancestor that reads enough levels already reads this subtree.
+        for length in range(len(names)):
+            ancestor_depth = depths.get((root, names[:length]))
+            if ancestor_depth is not None and ancestor_depth >= len(names) - length + depth:
+                covered = True
+                break
+
+        if not covered:
+            paths.append((root, "\\".join(names), depth))
+
+    return paths
+
+
+def collect_all(artifacts=tuple(ARTIFACTS)):
+    """
+        Runs several collectors reading each key a single time: the union of
+        the keys they need is read first, hive by hive, and then every
+        collector extracts its records from the cached keys.
+        @param artifacts: Names of the collectors ('networks', 'usb', 'mru', 'lastpid').
+    """
+    with registry.cached() as cache:
+        for root, path, depth in utils.KEY_PATHS:
+            cache.prefetch(root, path, depth)
+
+        user_sids = utils.users_list()
+
+        for root, path, depth in plan(user_sids, artifacts):
+            cache.prefetch(root, path, depth)
+
+        if "networks" in artifacts:
+            yield from networkList.network_list()
+
+        if "usb" in artifacts:
+            yield from usbAttached.prev_attached_usb()
+
+        for user_sid in user_sids:
+            if "mru" in artifacts:
+                yield from usersMRUList.recent_docs_records(user_sid)
+
+            if "lastpid" in artifacts:
+                yield from userLastPID.last_pid_records(user_sid)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to run several collectors reading each registry key once.")
+    parser.add_argument("artifacts", action="store", nargs="*",
+                        help="Collectors to run ({0}), all of them by default.".format(", ".join(ARTIFACTS)))
+    parser.add_argument("-o", dest="output", action="store", default=None,
+                        help="JSON Lines output file, the standard output by default.")
+    parser.add_argument("-s", dest="stats", action="store_true", help="Print the registry cache counters.")
+
+    args = parser.parse_args()
+
+    for artifact in args.artifacts:
+        if artifact not in ARTIFACTS:
+            parser.error("Unknown collector: {0}".format(artifact))
+
+    with registry.cached() as run_cache:
+        output.write_records(collect_all(tuple(args.artifacts or ARTIFACTS)), "jsonl", args.output)
+
+    if args.stats:
+        print("[*] Registry cache: {0}".format(run_cache.stats()), file=sys.stderr)
@@ -0,0 +1,398 @@
+import argparse
+import os
+import regf
+import struct
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+HBIN_SIZE = 0x1000
+
+# Subkeys of each lh list, bigger lists are split with a ri list.
+LEAF_SIZE = 500
+
+# Biggest data stored on a single cell, the rest is stored on db cells.
+BIG_DATA_SEGMENT = 16344
+
+# 2021-06-15 22:29:10 UTC.
+BASE_TIME = 132682697500000000
+
+DISK_CLASS_GUID = "{4d36e967-e325-11ce-bfc1-08002be10318}"
+VOLUME_CLASS_GUID = "{53f5630d-b6bf-11d0-94f2-00a0c91efb8b}"
+DISK_INTERFACE_GUID = "{53f56307-b6bf-11d0-94f2-00a0c91efb8b}"
+
+EXTENSIONS = (".docx", ".xlsx", ".pdf", ".txt", ".png", ".zip", ".lnk", ".pptx")
+PROCESSES = ("notepad.exe", "WINWORD.EXE", "chrome.exe", "7zFM.exe", "mspaint.exe", "EXCEL.EXE")
+
+
+class Key:
+    """ Registry key to write on a synthetic hive. """
+
+    def __init__(self, name, last_written=BASE_TIME):
+        """
+            @param name: Key name.
+            @param last_written: 64-bits Windows timestamp of the last write.
+        """
+        self.name = name
+        self.last_written = last_written
+        self.values = list()
+        self.subkeys = dict()
+
+    def key(self, path, last_written=BASE_TIME):
+        """
+            Returns a subkey, creating the missing keys of its path.
+            @param path: Backslash separated path, relative to this key.
+            @param last_written: Last write time of the created keys.
+        """
+        node = self
+        for name in path.split("\\"):
+            if name.upper() not in node.subkeys:
+                node.subkeys[name.upper()] = Key(name, last_written)
+            node = node.subkeys[name.upper()]
+
+        return node
+
+    def value(self, name, value_type, data):
+        """
+            Adds a value to the key and returns the key.
+            @param name: Value name.
+            @param value_type: REG_* type.
+            @param data: Raw value data.
+        """
+        self.values.append((name, value_type, data))
+        return self
+
+
+def _name_bytes(name):
+    """ Returns the stored name of a key or value, and whether it's ASCII. """
+    try:
+        return name.encode("ascii"), True
+    except UnicodeEncodeError:
+        return name.encode("utf-16-le"), False
+
+
+class HiveWriter:
+    """ Writes a key tree as a REGF hive file, with the layout used by Windows. """
+
+    def __init__(self):
+        self.bins = bytearray()
+        self.free = 0
+
+    def _close_bin(self):
+        if self.free:
+            # The rest of the bin is a single free cell.
+            struct.pack_into("<i", self.bins, len(self.bins) - self.free, self.free)
+            self.free = 0
+
+    def alloc(self, data):
+        """
+            Stores some data on a new cell and returns its offset.
+            @param data: Cell data, without the size.
+        """
+        size = (len(data) + 4 + 7) & ~7
+
+        if size > self.free:
+            self._close_bin()
+            start = len(self.bins)
+            bin_size = max(HBIN_SIZE, (size + 32 + HBIN_SIZE - 1) // HBIN_SIZE * HBIN_SIZE)
+            self.bins += bytes(bin_size)
+            struct.pack_into("<4sII", self.bins, start, b"hbin", start, bin_size)
+            self.free = bin_size - 32
+
+        offset = len(self.bins) - self.free
+        struct.pack_into("<i", self.bins, offset, -size)
+        self.bins[offset + 4:offset + 4 + len(data)] = data
+        self.free -= size
+        return offset
+
+    def data_cell(self, data):
+        """ Stores a value data, on db cells when it's too big for a single cell. """
+        if len(data) <= BIG_DATA_SEGMENT:
+            return self.alloc(data)
+
+        segments = [self.alloc(data[inx:inx + BIG_DATA_SEGMENT]) for inx in range(0, len(data), BIG_DATA_SEGMENT)]
+        segments_list = self.alloc(struct.pack("<{0}I".format(len(segments)), *segments))
+        return self.alloc(struct.pack("<2sHI", b"db", len(segments), segments_list))
+
+    def _leaf(self, subkeys):
+        return self.alloc(struct.pack("<2sH", b"lh", len(subkeys)) + b"".join(
+            struct.pack("<II", offset, regf.subkey_hash(key.name)) for offset, key in subkeys))
+
+    def write_key(self, key, parent=None):
+        """
+            Writes a key and its subtree, and returns the key cell offset.
+            @param key: Key to write.
+            @param parent: Offset of the parent key cell, None for the root key.
+        """
+        name, ascii_name = _name_bytes(key.name)
+        nk_offset = self.alloc(bytes(76 + len(name)))
+
+        value_offsets = list()
+        for value_name, value_type, data in key.values:
+            value_name, ascii_value_name = _name_bytes(value_name)
+
+            if len(data) <= 4:
+                data_size = len(data) | regf.DATA_INLINE
+                data_offset = struct.unpack("<I", data.ljust(4, b"\x00"))[0]
+            else:
+                data_size = len(data)
+                data_offset = self.data_cell(data)
+
+            value_offsets.append(self.alloc(struct.pack("<2sHIIIHH", b"vk", len(value_name), data_size, data_offset,
+                                                        value_type, 1 if ascii_value_name else 0, 0) + value_name))
+
+        values_list = 0xFFFFFFFF
+        if value_offsets:
+            values_list = self.alloc(struct.pack("<{0}I".format(len(value_offsets)), *value_offsets))
+
+        # The subkey lists are sorted by the upper case names.
+        subkeys = [(self.write_key(subkey, nk_offset), subkey)
+                   for _, subkey in sorted(key.subkeys.items())]
+
+        subkeys_list = 0xFFFFFFFF
+        if len(subkeys) > LEAF_SIZE:
+            leaves = [self._leaf(subkeys[inx:inx + LEAF_SIZE]) for inx in range(0, len(subkeys), LEAF_SIZE)]
+            subkeys_list = self.alloc(struct.pack("<2sH{0}I".format(len(leaves)), b"ri", len(leaves), *leaves))
+        elif subkeys:
+            subkeys_list = self._leaf(subkeys)
+
+        flags = (0x20 if ascii_name else 0) | (0x04 if parent is None else 0)
+        nk = struct.pack("<2sHQ15IHH", b"nk", flags, key.last_written, 0, parent or 0, len(subkeys), 0,
+                         subkeys_list, 0xFFFFFFFF, len(value_offsets), values_list, 0xFFFFFFFF, 0xFFFFFFFF,
+                         0, 0, 0, 0, 0, len(name), 0)
+        self.bins[nk_offset + 4:nk_offset + 4 + len(nk) + len(name)] = nk + name
+        return nk_offset
+
+    def save(self, root, path):
+        """
+            Writes a hive file.
+            @param root: Root key.
+            @param path: Hive file path.
+        """
+        root_offset = self.write_key(root)
+        self._close_bin()
+
+        base_block = bytearray(regf.HBIN_START)
+        struct.pack_into("<4sIIQIIIIIII", base_block, 0, b"regf", 1, 1, BASE_TIME, 1, 5, 0, 1,
+                         root_offset, len(self.bins), 1)
+
+        checksum = 0
+        for inx in range(0, 508, 4):
+            checksum ^= struct.unpack_from("<I", base_block, inx)[0]
+        struct.pack_into("<I", base_block, 508, checksum)
+
+        with open(path, "wb") as hive_file:
+            hive_file.write(base_block)
+            hive_file.write(self.bins)
+
+
+def reg_sz(string):
+    """ Returns the data of a REG_SZ value. """
+    return (string + "\x00").encode("utf-16-le")
+
+
+def reg_dword(number):
+    """ Returns the data of a REG_DWORD value. """
+    return struct.pack("<I", number)
+
+
+def systemtime(year, month, day, hour=0, minute=0, second=0):
+    """ Returns a SYSTEMTIME structure, as stored on the NetworkList profiles. """
+    return struct.pack("<8H", year, month, 0, day, hour, minute, second, 0)
+
+
+def mru_list_ex(indexes):
+    """ Returns a MRUListEx value: the indexes followed by the 0xFFFFFFFF terminator. """
+    return struct.pack("<{0}I".format(len(indexes) + 1), *indexes, 0xFFFFFFFF)
+
+
+def mru_value(name, pidl_name=None):
+    """
+        Returns a RecentDocs or LastVisitedPidlMRU value: the UTF-16LE name,
+        a shell item ID list with a file entry and, when given, the UTF-16LE
+        name that follows it.
+        @param name: Name at the start of the value.
+        @param pidl_name: Trailing name, None to not write it.
+    """
+    short_name = name[:8].upper().encode("ascii", "replace") + b"\x00"
+    short_name += b"\x00" * (len(short_name) % 2)
+    shell_item = struct.pack("<BBIHHH", 0x32, 0, 4096, 0x52cf, 0x4125, 0x20) + short_name
+    id_list = struct.pack("<H", len(shell_item) + 2) + shell_item + b"\x00\x00"
+
+    value = reg_sz(name) + id_list
+    if pidl_name is not None:
+        value += reg_sz(pidl_name)
+
+    return value
+
+
+def software_hive(sids, networks, usb_devices):
+    """
+        Returns the root key of a SOFTWARE hive.
+        @param sids: Dict that maps the user sids to their names.
+        @param networks: Number of NetworkList signatures.
+        @param usb_devices: Number of portable devices.
+    """
+    root = Key("ROOT")
+
+    profile_list = root.key("Microsoft\\Windows NT\\CurrentVersion\\ProfileList")
+    profile_list.key("S-1-5-18").value("ProfileImagePath", regf.REG_EXPAND_SZ,
+                                       reg_sz("%systemroot%\\system32\\config\\systemprofile"))
+    for user_sid, user_name in sids.items():
+        profile_list.key(user_sid).value("ProfileImagePath", regf.REG_EXPAND_SZ, reg_sz("C:\\Users\\" + user_name))
+
+    network_list = root.key("Microsoft\\Windows NT\\CurrentVersion\\NetworkList")
+    for inx in range(networks):
+        profile_guid = "{{{0:08X}-0000-4000-8000-000000000000}}".format(inx)
+
+        network_list.key("Signatures\\Unmanaged\\{0:040X}".format(inx)) \
+            .value("ProfileGuid", regf.REG_SZ, reg_sz(profile_guid)) \
+            .value("Description", regf.REG_SZ, reg_sz("Network {0}".format(inx))) \
+            .value("DefaultGatewayMac", regf.REG_BINARY, struct.pack(">HI", 0x00aa, inx))
+
+        network_list.key("Profiles\\" + profile_guid) \
+            .value("ProfileName", regf.REG_SZ, reg_sz("Network {0}".format(inx))) \
+            .value("DateCreated", regf.REG_BINARY, systemtime(2019 + inx % 3, 1 + inx % 12, 1 + inx % 28)) \
+            .value("DateLastConnected", regf.REG_BINARY, systemtime(2021, 1 + inx % 12, 1 + inx % 28, inx % 24))
+
+    devices = root.key("Microsoft\\Windows Portable Devices\\Devices")
+    for inx in range(usb_devices):
+        devices.key("WPDBUSENUMROOT#UMB#2&37C186B&0&STORAGE#VOLUME#_??_USBSTOR#{0}#{1}&0#".format(
+            _usb_product(inx).upper(), _usb_serial(inx))) \
+            .value("FriendlyName", regf.REG_SZ, reg_sz("E:\\ drive {0}".format(inx)))
+
+    return root
+
+
+def _usb_product(inx):
+    return "Disk&Ven_Generic&Prod_Flash_{0}&Rev_1.00".format(inx % 16)
+
+
+def _usb_serial(inx):
+    return "{0:012X}".format(0x1000 + inx)
+
+
+def system_hive(usb_devices):
+    """
+        Returns the root key of a SYSTEM hive.
+        @param usb_devices: Number of USB storage devices.
+    """
+    root = Key("ROOT")
+    root.key("Select").value("Current", regf.REG_DWORD, reg_dword(1))
+    control_set = root.key("ControlSet001")
+
+    for inx in range(usb_devices):
+        product, serial = _usb_product(inx), _usb_serial(inx)
+
+        device = control_set.key("Enum\\USBSTOR\\{0}\\{1}&0".format(product, serial))
+        device.value("FriendlyName", regf.REG_SZ, reg_sz("Generic Flash {0} USB Device".format(inx))) \
+            .value("ContainerID", regf.REG_SZ, reg_sz("{{c0000000-0000-4000-8000-{0:012x}}}".format(inx))) \
+            .value("ClassGUID", regf.REG_SZ, reg_sz(DISK_CLASS_GUID)) \
+            .value("Mfg", regf.REG_SZ, reg_sz("@disk.inf,%genmanufacturer%;(Standard disk drives)")) \
+            .value("Driver", regf.REG_SZ, reg_sz("{0}\\{1:04}".format(DISK_CLASS_GUID, inx)))
+        device.key("Device Parameters\\Partmgr") \
+            .value("DiskId", regf.REG_SZ, reg_sz("{{d0000000-0000-4000-8000-{0:012x}}}".format(inx)))
+
+        control_set.key("Enum\\STORAGE\\Volume\\_??_USBSTOR#{0}#{1}&0#{2}".format(product, serial,
+                                                                                 DISK_INTERFACE_GUID))
+        control_set.key("Control\\DeviceClasses\\{0}\\##?#STORAGE#Volume#_??_USBSTOR#{1}#{2}&0#{0}#{3}".format(
+            DISK_INTERFACE_GUID, product, serial, VOLUME_CLASS_GUID), BASE_TIME + inx * 600000000)
+
+    return root
+
+
+def ntuser_hive(extensions, recent_files, processes):
+    """
+        Returns the root key of a NTUSER.DAT hive.
+        @param extensions: Number of RecentDocs extension subkeys.
+        @param recent_files: Number of files of each extension.
+        @param processes: Number of LastVisitedPidlMRU values.
+    """
+    root = Key("ROOT")
+    explorer = root.key("Software\\Microsoft\\Windows\\CurrentVersion\\Explorer")
+
+    recent_docs = explorer.key("RecentDocs")
+    for ext_inx in range(extensions):
+        extension = EXTENSIONS[ext_inx % len(EXTENSIONS)]
+        if ext_inx >= len(EXTENSIONS):
+            extension += str(ext_inx // len(EXTENSIONS))
+
+        extension_key = recent_docs.key(extension, BASE_TIME + ext_inx * 10000000)
+        for file_inx in range(recent_files):
+            filename = "file {0}{1}".format(file_inx, extension)
+            extension_key.value(str(file_inx), regf.REG_BINARY, mru_value(filename, filename + ".lnk"))
+        extension_key.value("MRUListEx", regf.REG_BINARY, mru_list_ex(list(reversed(range(recent_files)))))
+
+    last_visited = explorer.key("ComDlg32\\LastVisitedPidlMRU")
+    for inx in range(processes):
+        last_visited.value(str(inx), regf.REG_BINARY, mru_value(PROCESSES[inx % len(PROCESSES)]))
+    last_visited.value("MRUListEx", regf.REG_BINARY, mru_list_ex(list(reversed(range(processes)))))
+
+    return root
+
+
+def generate(out_dir, usb_devices=100, users=10, networks=50, extensions=8, recent_files=20, processes=10):
+    """
+        Writes a synthetic host: SOFTWARE and SYSTEM hives and the
+        Users\\<name>\\NTUSER.DAT hives, with the layout read by batch.find_hives.
+        @param out_dir: Host directory.
+        @param usb_devices: Number of USB storage devices.
+        @param users: Number of user profiles.
+        @param networks: Number of NetworkList signatures.
+        @param extensions: Number of RecentDocs extensions of each user.
+        @param recent_files: Number of recent files of each extension.
+        @param processes: Number of LastVisitedPidlMRU values of each user.
+
+        @returns dict: Hive paths, as taken by registry.use_hives.
+    """
+    sids = {"S-1-5-21-1004336348-1177238915-682003330-{0}".format(1000 + inx): "user{0}".format(inx)
+            for inx in range(users)}
+    hives = {"software": os.path.join(out_dir, "SOFTWARE"), "system": os.path.join(out_dir, "SYSTEM"),
+             "users": dict()}
+
+    os.makedirs(out_dir, exist_ok=True)
+    HiveWriter().save(software_hive(sids, networks, usb_devices), hives["software"])
+    HiveWriter().save(system_hive(usb_devices), hives["system"])
+
+    # Every user has the same artifacts, the hive is written once and copied.
+    ntuser = HiveWriter()
+    ntuser.save(ntuser_hive(extensions, recent_files, processes), os.path.join(out_dir, "NTUSER.DAT"))
+    with open(os.path.join(out_dir, "NTUSER.DAT"), "rb") as ntuser_file:
+        ntuser_data = ntuser_file.read()
+    os.remove(os.path.join(out_dir, "NTUSER.DAT"))
+
+    for user_sid, user_name in sids.items():
+        user_dir = os.path.join(out_dir, "Users", user_name)
+        os.makedirs(user_dir, exist_ok=True)
+
+        hives["users"][user_sid] = os.path.join(user_dir, "NTUSER.DAT")
+        with open(hives["users"][user_sid], "wb") as ntuser_file:
+            ntuser_file.write(ntuser_data)
+
+    return hives
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to write synthetic hives of a host.")
+    parser.add_argument("output", action="store", help="Host directory.")
+    parser.add_argument("--usb", dest="usb", action="store", type=int, default=100, help="USB storage devices.")
+    parser.add_argument("--users", dest="users", action="store", type=int, default=10, help="User profiles.")
+    parser.add_argument("--networks", dest="networks", action="store", type=int, default=50,
+                        help="NetworkList signatures.")
+    parser.add_argument("--extensions", dest="extensions", action="store", type=int, default=8,
+                        help="RecentDocs extensions of each user.")
+    parser.add_argument("--files", dest="files", action="store", type=int, default=20,
+                        help="Recent files of each extension.")
+    parser.add_argument("--processes", dest="processes", action="store", type=int, default=10,
+                        help="LastVisitedPidlMRU values of each user.")
+
+    args = parser.parse_args()
+
+    hives = generate(args.output, args.usb, args.users, args.networks, args.extensions, args.files, args.processes)
+    print("[*] Hives written on {0}".format(args.output))
+    print("\t[+] SOFTWARE: {0}".format(hives["software"]))
+    print("\t[+] SYSTEM: {0}".format(hives["system"]))
+    print("\t[+] NTUSER.DAT: {0} users".format(len(hives["users"])))
@@ -0,0 +1,356 @@
+import argparse
+import batch
+import collections
+import json
+import networkList
+import os
+import output
+import records
+import registry
+import sqlite3
+import sys
+import usbAttached
+import userLastPID
+import usersMRUList
+import utils
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+ARTIFACTS = ("networks", "usb", "mru", "lastpid")
+
+# Fields that tell apart the records of a scope.
+IDENTITY_FIELDS = {
+    "Network": ("name",),
+    "UsbDevice": (),
+    "RecentDoc": ("filename",),
+    "LastProcess": ("process_name",),
+}
+
+USBSTOR_PATH = "SYSTEM\\CurrentControlSet\\Enum\\USBSTOR"
+RECENT_DOCS_PATH = "{0}\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\RecentDocs"
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS scopes (host TEXT, scope TEXT, PRIMARY KEY (host, scope));
+    CREATE TABLE IF NOT EXISTS keys (host TEXT, scope TEXT, path TEXT, last_written INTEGER,
+                                     PRIMARY KEY (host, scope, path));
+    CREATE TABLE IF NOT EXISTS records (host TEXT, scope TEXT, identity TEXT, type TEXT, data TEXT,
+                                        PRIMARY KEY (host, scope, identity));
+"""
+
+# A group of records extracted together, and the keys they are read from.
+#   name: Unique name of the scope.
+#   parent: Name of a scope whose changes also change this one, or None.
+#   keys: Dict that maps the key paths to their last write time.
+#   extract: Function that returns the records of the scope.
+Scope = collections.namedtuple("Scope", ("name", "parent", "keys", "extract"))
+
+# status: 'added', 'changed', 'removed' or 'unchanged'.
+Change = collections.namedtuple("Change", ("status", "scope", "record", "previous"))
+
+
+def record_to_json(record):
+    """ Returns the JSON version of a record, with its raw field values. """
+    fields = list()
+    for field_type, value in zip(record.TYPES, record):
+        if field_type == "systemtime" and value is not None:
+            value = bytes(value).hex()
+        elif field_type == "strlist" and value is not None:
+            value = list(value)
+        fields.append(value)
+
+    return json.dumps(fields, ensure_ascii=False)
+
+
+def record_from_json(type_name, data):
+    """ Returns the record stored by record_to_json. """
+    record_type = getattr(records, type_name)
+
+    fields = list()
+    for field_type, value in zip(record_type.TYPES, json.loads(data)):
+        if field_type == "systemtime" and value is not None:
+            value = bytes.fromhex(value)
+        fields.append(value)
+
+    return record_type(*fields)
+
+
+def record_identities(extracted):
+    """
+        Returns a dict that maps the identity of each record to the record.
+        Records with the same identity fields are told apart by their order.
+        @param extracted: Records of a scope.
+    """
+    identities = dict()
+    seen = collections.Counter()
+
+    for record in extracted:
+        identity = json.dumps([getattr(record, name) for name in IDENTITY_FIELDS[type(record).__name__]],
+                              ensure_ascii=False)
+        seen[identity] += 1
+        if seen[identity] > 1:
+            identity += "#{0}".format(seen[identity])
+
+        identities[identity] = record
+
+    return identities
+
+
+class StateStore:
+    """ SQLite file with the key last write times and the records of the previous sweeps. """
+
+    def __init__(self, path):
+        """
+            @param path: SQLite database path.
+        """
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def scopes(self, host):
+        """ Returns the names of the stored scopes of a host. """
+        return {row[0] for row in self.db.execute("SELECT scope FROM scopes WHERE host = ?", (host,))}
+
+    def keys(self, host, scope):
+        """ Returns the stored key last write times of a scope. """
+        return dict(self.db.execute("SELECT path, last_written FROM keys WHERE host = ? AND scope = ?",
+                                    (host, scope)))
+
+    def records(self, host, scope):
+        """ Returns a dict that maps the identities of the stored records of a scope to the records. """
+        rows = self.db.execute("SELECT identity, type, data FROM records WHERE host = ? AND scope = ?",
+                               (host, scope))
+        return {identity: record_from_json(type_name, data) for identity, type_name, data in rows}
+
+    def delete(self, host, scope):
+        """ Removes a scope, its keys and its records. """
+        for table in ("scopes", "keys", "records"):
+            self.db.execute("DELETE FROM {0} WHERE host = ? AND scope = ?".format(table), (host, scope))
+
+    def save(self, host, scope, keys, identities):
+        """
+            Replaces the stored keys and records of a scope.
+            @param host: Host name.
+            @param scope: Scope name.
+            @param keys: Dict that maps the key paths to their last write time.
+            @param identities: Dict that maps the record identities to the records.
+        """
+        self.delete(host, scope)
+        self.db.execute("INSERT INTO scopes VALUES (?, ?)", (host, scope))
+        self.db.executemany("INSERT INTO keys VALUES (?, ?, ?, ?)",
+                            ((host, scope, path, last_written) for path, last_written in keys.items()))
+        self.db.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?)",
+                            ((host, scope, identity, type(record).__name__, record_to_json(record))
+                             for identity, record in identities.items()))
+
+    def commit(self):
+        self.db.commit()
+
+
+def key_times(root, path, depth=0):
+    """
+        Returns the last write time of a key and of its subkeys, without
+        reading any value.
+        @param root: Predefined key.
+        @param path: Key path.
+        @param depth: Levels of subkeys to read, 0 to read only the key.
+
+        @returns dict: Key paths and their last write time, empty if the key doesn't exist.
+    """
+    times = dict()
+
+    def walk(key, key_path, levels):
+        num_subkeys, _, last_written = registry.QueryInfoKey(key)
+        times[key_path] = last_written
+
+        if levels == 0:
+            return
+
+        for inx in range(num_subkeys):
+            name = registry.EnumKey(key, inx)
+            with registry.OpenKeyEx(key, name) as sub_key:
+                walk(sub_key, "{0}\\{1}".format(key_path, name), levels - 1)
+
+    try:
+        with registry.OpenKeyEx(root, path) as key:
+            walk(key, path, depth)
+    except FileNotFoundError:
+        pass
+
+    return times
+
+
+def paths_times(key_paths, user_sid=None):
+    """
+        Returns the last write time of the keys read by a collector.
+        @param key_paths: (root key, path, levels of subkeys) tuples, like the collectors KEY_PATHS.
+        @param user_sid: Sid the user key paths are formatted with.
+    """
+    times = dict()
+    for root, path, depth in key_paths:
+        times.update(key_times(root, path if user_sid is None else path.format(user_sid), depth))
+    return times
+
+
+def _recent_docs(user_sid, file_extension):
+    """ Returns the RecentDoc records of a single extension. """
+    try:
+        with registry.OpenKeyEx(registry.HKEY_USERS, RECENT_DOCS_PATH.format(user_sid)) as mru_key:
+            return [records.RecentDoc(user_sid, file_extension, position, filename, last_accessed_date)
+                    for position, (filename, last_accessed_date)
+                    in enumerate(usersMRUList.get_recent_docs(mru_key, file_extension))]
+    except FileNotFoundError:
+        return list()
+
+
+def list_scopes(user_sids, artifacts=ARTIFACTS):
+    """
+        Walks the key metadata of the collectors and yields their scopes.
+        @param user_sids: Sids of the users to collect.
+        @param artifacts: Names of the collectors.
+    """
+    if "networks" in artifacts:
+        yield Scope("networks", None, paths_times(networkList.KEY_PATHS), lambda: list(networkList.network_list()))
+
+    if "usb" in artifacts:
+        # The keys searched by every device are a scope of their own.
+        yield Scope("usb", None, paths_times(usbAttached.KEY_PATHS[1:]), lambda: list())
+
+        indexes = dict()
+        try:
+            sub_keys = list(usbAttached.enum_usb())
+        except FileNotFoundError:
+            sub_keys = list()
+
+        for sub_key in sub_keys:
+            yield Scope("usb\\" + sub_key[len(USBSTOR_PATH) + 1:], "usb",
+                        key_times(registry.HKEY_LOCAL_MACHINE, sub_key, 2),
+                        lambda sub_key=sub_key: [usbAttached.usb_device(sub_key, indexes)])
+
+    for user_sid in user_sids:
+        if "mru" in artifacts:
+            times = key_times(registry.HKEY_USERS, RECENT_DOCS_PATH.format(user_sid), 1)
+
+            for path, last_written in times.items():
+                file_extension = path[len(RECENT_DOCS_PATH.format(user_sid)) + 1:]
+
+                # Skip the root and the folder subkey.
+                if "\\" in file_extension or file_extension in ("", "Folder"):
+                    continue
+
+                yield Scope("mru\\{0}\\{1}".format(user_sid, file_extension), None, {path: last_written},
+                            lambda user_sid=user_sid, file_extension=file_extension:
+                                _recent_docs(user_sid, file_extension))
+
+        if "lastpid" in artifacts:
+            yield Scope("lastpid\\" + user_sid, None, paths_times(userLastPID.KEY_PATHS, user_sid),
+                        lambda user_sid=user_sid: list(userLastPID.last_pid_records(user_sid)))
+
+
+def sweep(store, host="localhost", artifacts=ARTIFACTS, include_unchanged=False):
+    """
+        Collects the records that changed since the previous sweep of a host.
+        Only the scopes whose keys have a different last write time are
+        extracted again, the rest of the sweep just reads the key metadata.
+        @param store: StateStore of the previous sweeps.
+        @param host: Host name, the state of each host is stored apart.
+        @param artifacts: Names of the collectors.
+        @param include_unchanged: Also yield the stored records that didn't change.
+
+        @returns generator: Change tuples.
+    """
+    stored_scopes = store.scopes(host)
+    seen_scopes = set()
+    changed_scopes = set()
+
+    with registry.cached():
+        user_sids = utils.users_list() if "mru" in artifacts or "lastpid" in artifacts else list()
+
+        for scope in list_scopes(user_sids, artifacts):
+            seen_scopes.add(scope.name)
+
+            # The stored records are only decoded when they are compared or written.
+            if scope.name in stored_scopes and scope.parent not in changed_scopes and \
+                    store.keys(host, scope.name) == scope.keys:
+                if include_unchanged:
+                    for record in store.records(host, scope.name).values():
+                        yield Change("unchanged", scope.name, record, record)
+                continue
+
+            changed_scopes.add(scope.name)
+            previous = store.records(host, scope.name) if scope.name in stored_scopes else dict()
+            current = record_identities(scope.extract())
+
+            for identity, record in current.items():
+                if identity not in previous:
+                    yield Change("added", scope.name, record, None)
+                elif previous[identity] != record:
+                    yield Change("changed", scope.name, record, previous[identity])
+                elif include_unchanged:
+                    yield Change("unchanged", scope.name, record, record)
+
+            for identity, record in previous.items():
+                if identity not in current:
+                    yield Change("removed", scope.name, record, record)
+
+            store.save(host, scope.name, scope.keys, current)
+
+    # The scopes of the selected collectors that weren't found anymore.
+    prefixes = tuple(artifact if artifact in ("networks", "usb") else artifact + "\\" for artifact in artifacts)
+    for scope_name in sorted(stored_scopes - seen_scopes):
+        if scope_name.startswith(prefixes):
+            for record in store.records(host, scope_name).values():
+                yield Change("removed", scope_name, record, record)
+            store.delete(host, scope_name)
+
+    store.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to collect the records changed since the last run.")
+    parser.add_argument("state", action="store", help="SQLite file with the state of the previous runs.")
+    parser.add_argument("artifacts", action="store", nargs="*",
+                        help="Collectors to run ({0}), all of them by default.".format(", ".join(ARTIFACTS)))
+    parser.add_argument("--hives", dest="hives", action="store", default=None,
+                        help="Directory with the hives collected from a host, the live registry by default.")
+    parser.add_argument("--host", dest="host", action="store", default=None,
+                        help="Host name of the state, the hives directory name or 'localhost' by default.")
+    parser.add_argument("--all", dest="all", action="store_true", help="Also write the unchanged records.")
+    parser.add_argument("-o", dest="output", action="store", default=None,
+                        help="JSON Lines output file, the standard output by default.")
+
+    args = parser.parse_args()
+
+    for artifact in args.artifacts:
+        if artifact not in ARTIFACTS:
+            parser.error("Unknown collector: {0}".format(artifact))
+
+    host = args.host or "localhost"
+    if args.hives is not None:
+        batch.load_host(batch.find_hives(args.hives))
+        host = args.host or os.path.basename(os.path.normpath(args.hives))
+
+    state = StateStore(args.state)
+    stream = open(args.output, "w", encoding="utf-8") if args.output is not None else sys.stdout
+    counts = collections.Counter()
+
+    try:
+        writer = output.JsonLinesWriter(stream)
+        for change in sweep(state, host, tuple(args.artifacts or ARTIFACTS), args.all):
+            counts[change.status] += 1
+            writer.write(change.record, {"change": change.status, "scope": change.scope})
+        writer.close()
+
+    finally:
+        state.close()
+        if args.output is not None:
+            stream.close()
+
+    print("[*] {0}: {1}".format(host, ", ".join("{0} {1}".format(counts[status], status)
+                                                for status in ("added", "changed", "removed", "unchanged"))),
+          file=sys.stderr)
@@ -0,0 +1,57 @@
+import argparse
+import batch
+import regf
+import sys
+import time
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+def index_hive(path):
+    """
+        Writes the key index sidecar of a hive file, unless it already has an
+        up to date one.
+        @param path: Path to the hive file.
+
+        @returns int: Number of indexed keys, None if the index was up to date.
+    """
+    with regf.Hive(path) as hive:
+        if hive.index is not None:
+            return None
+
+        if hive.replayed:
+            raise ValueError("{0} is dirty, its transaction logs can't be indexed.".format(path))
+
+        return regf.write_index(hive)
+
+
+def host_hives(root):
+    """ Returns the hive files of a host collection directory. """
+    hives = batch.find_hives(root)
+    return [path for path in (hives["software"], hives["system"]) if path is not None] + list(hives["users"].values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to write the key index sidecar of some hives.")
+    parser.add_argument("paths", action="store", nargs="+", help="Hive files, or directories with the hives of a host.")
+    parser.add_argument("-d", dest="directories", action="store_true", help="The paths are host collection directories.")
+
+    args = parser.parse_args()
+    hive_paths = [path for root in args.paths for path in host_hives(root)] if args.directories else args.paths
+
+    for hive_path in hive_paths:
+        start = time.perf_counter()
+
+        try:
+            indexed_keys = index_hive(hive_path)
+        except (OSError, ValueError) as e:
+            print("[!!] {0}: {1}".format(hive_path, e), file=sys.stderr)
+            continue
+
+        if indexed_keys is None:
+            print("[*] {0}: the index is up to date".format(hive_path))
+        else:
+            print("[+] {0}: {1} keys indexed in {2:.3f}s".format(hive_path, indexed_keys, time.perf_counter() - start))
@@ -1,12 +1,22 @@
+import argparse
+import output
+import query
+import records
+import registry as reg
 import sys
 import utc
-import winreg as reg
+import utils
 
 __author__ = "pacmanator"
 __email__ = "mrpacmanator at gmail dot com"
 __version__ = "v1.1"
 
 
+# Keys read by the collector: (root key, path, levels of subkeys).
+KEY_PATHS = [(reg.HKEY_LOCAL_MACHINE, "SOFTWARE\\Microsoft\\Windows NT\\CurrentVersion\\NetworkList\\Signatures\\Unmanaged", 1),
+             (reg.HKEY_LOCAL_MACHINE, "SOFTWARE\\Microsoft\\Windows NT\\CurrentVersion\\NetworkList\\Profiles", 1)]
+
+
 def decode_mac_address(encoded_mac_address):
     """ Returns a readable MAC Address. """
     return ":".join(["{:02x}".format(ch) for ch in encoded_mac_address])
@@ -14,9 +24,8 @@ def decode_mac_address(encoded_mac_address):
 
 def get_connected_dates(guid):
     """
-        This function returns a readable UTC type time, specifying
-        when was the last time that some network connection was used
-        and the date when it was created.
+        This function returns the encoded dates of when some network
+        connection was created and when was the last time that it was used.
         @param guid: Connection Guid.
     """
     path = "SOFTWARE\\Microsoft\\Windows NT\\CurrentVersion\\NetworkList\\Profiles\\{0}".format(guid)
@@ -24,16 +33,21 @@ def get_connected_dates(guid):
         last_connected_date = reg.QueryValueEx(key, "DateLastConnected")[0]
         first_connected_date = reg.QueryValueEx(key, "DateCreated")[0]
 
-        return utc.get_utc(last_connected_date), utc.get_utc(first_connected_date)
+        return first_connected_date, last_connected_date
 
 
-def network_list():
+def network_list(fields=None, where=None, seen=None):
     """
         Crawls the windows registry, to find a list of
         the previously connected networks.
+        @param fields: Names of the fields to read, every field by default.
+        @param where: Dict that maps field names to conditions (see query.Query).
+        @param seen: Set of the network names already found, a new set by
+            default. A utils.BloomFilter bounds its memory on huge lists.
     """
     path = "SOFTWARE\\Microsoft\\Windows NT\\CurrentVersion\\NetworkList\\Signatures\\Unmanaged"
-    names = list()
+    seen = set() if seen is None else seen
+    network_query = query.Query(records.Network, fields, where)
 
     try:
         # Reads the HKLM with the specified path.
@@ -47,27 +61,62 @@ def network_list():
 
                     name = reg.QueryValueEx(sub_key, "Description")[0]
 
-                    if name in names:
+                    # The rest of the keys aren't read for the filtered out or repeated names.
+                    if name in seen or not network_query.accepts("name", name):
                         continue
 
-                    guid = reg.QueryValueEx(sub_key, "ProfileGuid")[0]
-                    mac_address = reg.QueryValueEx(sub_key, "DefaultGatewayMac")[0]
+                    mac_address = None
+                    if network_query.wants("mac_address"):
+                        mac_address = reg.QueryValueEx(sub_key, "DefaultGatewayMac")[0]
+                        mac_address = decode_mac_address(mac_address) if mac_address is not None else None
+
+                        if not network_query.accepts("mac_address", mac_address):
+                            continue
 
-                    first_conx, last_conx = get_connected_dates(guid)
+                    first_conx = last_conx = None
+                    if network_query.wants("first_connected") or network_query.wants("last_connected"):
+                        guid = reg.QueryValueEx(sub_key, "ProfileGuid")[0]
 
-                    names.append(name)
-                    mac_address = decode_mac_address(mac_address) if mac_address is not None else None
+                        # The Profiles key is read when a date is first needed.
+                        dates = records.Lazy(get_connected_dates, guid)
+                        first_conx, last_conx = dates.item(0), dates.item(1)
 
-                    yield name, mac_address, first_conx, last_conx
+                    network = records.Network(name, mac_address, first_conx, last_conx)
+
+                    # Only the names of the yielded networks are repeated.
+                    if network_query.match(network):
+                        seen.add(name)
+                        yield network
 
     except PermissionError:
         print("You need to have admin privileges to open the network lists key")
         sys.exit(5)
 
 
+def print_networks(seen=None):
+    """
+        Prints the previously connected networks.
+        @param seen: Set of the network names already found, see network_list.
+    """
+    for value in network_list(seen=seen):
+        print("[*] Network name: {0}".format(value.name))
+        print("\t[+] Mac address: {0}".format(value.mac_address))
+        print("\t[+] First date connection: {0}".format(utc.get_utc(value.first_connected)))
+        print("\t[+] Last date connection: {0}\n".format(utc.get_utc(value.last_connected)))
+
+
 if __name__ == '__main__':
-    for value in network_list():
-        print("[*] Network name: {0}".format(value[0]))
-        print("\t[+] Mac address: {0}".format(value[1]))
-        print("\t[+] First date connection: {0}".format(value[2]))
-        print("\t[+] Last date connection: {0}\n".format(value[3]))
+    parser = argparse.ArgumentParser(description="Python script to print a list of the previously connected networks.")
+    parser.add_argument("--bloom", dest="bloom", action="store", type=int, default=None,
+                        help="Find the repeated names with a Bloom filter sized for this many networks, its memory "
+                             "doesn't grow but a few networks may be skipped.")
+    output.add_arguments(parser)
+
+    args = parser.parse_args()
+    seen_names = utils.BloomFilter(args.bloom) if args.bloom is not None else None
+
+    if args.format is not None:
+        output.write_records(network_list(query.parse_fields(args.fields), query.parse_where(args.where), seen_names), args.format, args.output)
+        sys.exit()
+
+    print_networks(seen_names)
@@ -0,0 +1,377 @@
+import array
+import csv
+import io
+import json
+import struct
+import sys
+import utc
+import utils
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+FORMATS = ("jsonl", "csv", "columnar")
+
+# Records kept in memory before they're written in a single call.
+BUFFER_SIZE = 1024
+
+# Rows of each columnar row group.
+ROW_GROUP_SIZE = 65536
+
+COLUMNAR_MAGIC = b"PYRC"
+COLUMNAR_VERSION = 1
+
+_ROW_GROUP = struct.Struct("<2sI")
+_COLUMN_SIZE = struct.Struct("<I")
+
+
+def to_filetime(value, field_type):
+    """
+        Returns the 64-bits Windows timestamp of a time field, or None.
+        @param value: Field value.
+        @param field_type: 'filetime' or 'systemtime'.
+    """
+    if value is None:
+        return None
+
+    return utc.get_filetime(value) if field_type == "systemtime" else value
+
+
+def format_field(value, field_type):
+    """
+        Returns a JSON friendly version of a record field.
+        The timestamps are returned as ISO 8601 UTC strings.
+        @param value: Field value.
+        @param field_type: Record field type.
+    """
+    if value is None:
+        return None
+
+    if field_type in ("filetime", "systemtime"):
+        return utils.get_iso_time(to_filetime(value, field_type))
+
+    if field_type == "strlist":
+        return list(value)
+
+    return value
+
+
+class JsonLinesWriter:
+    """ Writes a JSON object per record. """
+
+    def __init__(self, stream, buffer_size=BUFFER_SIZE):
+        """
+            @param stream: Text stream.
+            @param buffer_size: Records kept in memory between writes.
+        """
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self._lines = list()
+
+    def write(self, record, extra=None):
+        """
+            @param record: Record to write.
+            @param extra: Dict of other fields written before the record ones.
+        """
+        line = {"record": type(record).__name__}
+        line.update(extra or dict())
+        for name, field_type, value in zip(record._fields, record.TYPES, record):
+            line[name] = format_field(value, field_type)
+
+        self._lines.append(json.dumps(line, ensure_ascii=False))
+
+        if len(self._lines) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self._lines.append("")
+            self.stream.write("\n".join(self._lines))
+            self._lines = list()
+
+    def close(self):
+        self.flush()
+        self.stream.flush()
+
+
+class CsvWriter:
+    """
+        Writes a row per record, the header is taken from the first one.
+        Every record must be of the same type.
+    """
+
+    def __init__(self, stream, buffer_size=BUFFER_SIZE):
+        """
+            @param stream: Text stream.
+            @param buffer_size: Records kept in memory between writes.
+        """
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.record_type = None
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer)
+        self._rows = 0
+
+    def write(self, record):
+        if self.record_type is None:
+            self.record_type = type(record)
+            self._csv.writerow(record._fields)
+
+        elif type(record) is not self.record_type:
+            raise ValueError("Can't write {0} records on a {1} CSV file.".format(
+                type(record).__name__, self.record_type.__name__))
+
+        row = list()
+        for field_type, value in zip(record.TYPES, record):
+            value = format_field(value, field_type)
+            row.append(";".join(value) if field_type == "strlist" else value)
+
+        self._csv.writerow(row)
+        self._rows += 1
+
+        if self._rows >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.stream.write(self._buffer.getvalue())
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._rows = 0
+
+    def close(self):
+        self.flush()
+        self.stream.flush()
+
+
+def _little_endian(values):
+    """ Returns the bytes of an array, in little endian order. """
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_column(values, field_type):
+    """
+        Encodes a column: a validity bitmap followed by the values.
+        Numbers and timestamps are stored as int64, the other types as
+        int32 lengths followed by the UTF-8 (or raw) data.
+        @param values: Column values.
+        @param field_type: Record field type.
+    """
+    bitmap = bytearray((len(values) + 7) // 8)
+    for inx, value in enumerate(values):
+        if value is not None:
+            bitmap[inx // 8] |= 1 << (inx % 8)
+
+    if field_type == "systemtime":
+        # Decode the whole column in a single pass.
+        encoded_dates = b"".join(bytes(value[:16]).ljust(16, b"\x00") if value is not None else bytes(16)
+                                for value in values)
+        numbers = array.array("q", utc.systemtimes_to_filetimes(encoded_dates))
+        return bytes(bitmap) + _little_endian(numbers)
+
+    if field_type in ("int", "filetime"):
+        numbers = array.array("q", (value or 0 for value in values))
+        return bytes(bitmap) + _little_endian(numbers)
+
+    blobs = list()
+    for value in values:
+        if value is None:
+            blobs.append(b"")
+        elif field_type == "strlist":
+            blobs.append(json.dumps(list(value), ensure_ascii=False).encode("utf-8"))
+        elif isinstance(value, str):
+            blobs.append(value.encode("utf-8"))
+        else:
+            blobs.append(bytes(value))
+
+    lengths = array.array("i", (len(blob) for blob in blobs))
+    return bytes(bitmap) + _little_endian(lengths) + b"".join(blobs)
+
+
+class ColumnarWriter:
+    """
+        Writes the records as typed columns, grouped in row groups.
+        Layout:
+            'PYRC', uint16 version, uint32 schema size, JSON schema.
+            Row groups: 'RG', uint32 rows, then per column an uint32 size
+            and the encoded column.
+            An empty row group ends the file.
+        The timestamps are stored as raw 64-bits FILETIMEs.
+    """
+
+    def __init__(self, stream, row_group_size=ROW_GROUP_SIZE):
+        """
+            @param stream: Binary stream.
+            @param row_group_size: Rows kept in memory between writes.
+        """
+        self.stream = stream
+        self.row_group_size = row_group_size
+        self.record_type = None
+        self._columns = None
+        self._rows = 0
+
+    def write(self, record):
+        if self.record_type is None:
+            self.record_type = type(record)
+            self._columns = [list() for _ in record._fields]
+
+            schema = json.dumps({"record": self.record_type.__name__,
+                                 "fields": list(record._fields),
+                                 "types": list(record.TYPES)}).encode("utf-8")
+            self.stream.write(COLUMNAR_MAGIC + struct.pack("<HI", COLUMNAR_VERSION, len(schema)) + schema)
+
+        elif type(record) is not self.record_type:
+            raise ValueError("Can't write {0} records on a {1} columnar file.".format(
+                type(record).__name__, self.record_type.__name__))
+
+        for column, value in zip(self._columns, record):
+            column.append(value)
+
+        self._rows += 1
+        if self._rows >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self._rows == 0:
+            return
+
+        chunks = [_ROW_GROUP.pack(b"RG", self._rows)]
+        for column, field_type in zip(self._columns, self.record_type.TYPES):
+            encoded = _encode_column(column, field_type)
+            chunks.append(_COLUMN_SIZE.pack(len(encoded)))
+            chunks.append(encoded)
+            column.clear()
+
+        self.stream.write(b"".join(chunks))
+        self._rows = 0
+
+    def close(self):
+        self.flush()
+
+        if self.record_type is not None:
+            self.stream.write(_ROW_GROUP.pack(b"RG", 0))
+
+        self.stream.flush()
+
+
+def _decode_column(data, rows, field_type):
+    """ Decodes a column written by ColumnarWriter. """
+    bitmap_size = (rows + 7) // 8
+    bitmap, data = data[:bitmap_size], data[bitmap_size:]
+    valid = [bool(bitmap[inx // 8] & (1 << (inx % 8))) for inx in range(rows)]
+
+    if field_type in ("int", "filetime", "systemtime"):
+        numbers = array.array("q", data[:rows * 8])
+        if sys.byteorder == "big":
+            numbers.byteswap()
+        return [number if is_valid else None for number, is_valid in zip(numbers, valid)]
+
+    lengths = array.array("i", data[:rows * 4])
+    if sys.byteorder == "big":
+        lengths.byteswap()
+
+    values = list()
+    position = rows * 4
+    for length, is_valid in zip(lengths, valid):
+        blob = data[position:position + length]
+        position += length
+
+        if not is_valid:
+            values.append(None)
+        elif field_type == "strlist":
+            values.append(json.loads(blob.decode("utf-8")))
+        elif field_type == "str":
+            values.append(blob.decode("utf-8"))
+        else:
+            values.append(bytes(blob))
+
+    return values
+
+
+def read_columnar(stream):
+    """
+        Yields the rows of a columnar file as dicts.
+        @param stream: Binary stream.
+    """
+    header = stream.read(10)
+    if header[:4] != COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar records file.")
+
+    schema_size = struct.unpack("<HI", header[4:])[1]
+    schema = json.loads(stream.read(schema_size).decode("utf-8"))
+
+    while True:
+        rows = _ROW_GROUP.unpack(stream.read(_ROW_GROUP.size))[1]
+        if rows == 0:
+            break
+
+        columns = list()
+        for field_type in schema["types"]:
+            size = _COLUMN_SIZE.unpack(stream.read(_COLUMN_SIZE.size))[0]
+            columns.append(_decode_column(stream.read(size), rows, field_type))
+
+        for row in zip(*columns):
+            yield dict(zip(schema["fields"], row))
+
+
+def get_writer(output_format, stream=None):
+    """
+        Returns a writer of the requested format.
+        @param output_format: 'jsonl', 'csv' or 'columnar'.
+        @param stream: Output stream, the standard output by default.
+    """
+    if output_format == "jsonl":
+        return JsonLinesWriter(stream or sys.stdout)
+
+    if output_format == "csv":
+        return CsvWriter(stream or sys.stdout)
+
+    if output_format == "columnar":
+        return ColumnarWriter(stream or sys.stdout.buffer)
+
+    raise ValueError("Unknown output format: {0}".format(output_format))
+
+
+def write_records(records, output_format, output_file=None):
+    """
+        Streams some records to a file or to the standard output.
+        @param records: Iterable of records.
+        @param output_format: 'jsonl', 'csv' or 'columnar'.
+        @param output_file: Output file path, the standard output by default.
+    """
+    stream = None
+    if output_file is not None:
+        if output_format == "columnar":
+            stream = open(output_file, "wb")
+        else:
+            stream = open(output_file, "w", encoding="utf-8", newline="")
+
+    try:
+        writer = get_writer(output_format, stream)
+        for record in records:
+            writer.write(record)
+        writer.close()
+
+    finally:
+        if stream is not None:
+            stream.close()
+
+
+def add_arguments(parser):
+    """
+        Adds the output arguments to a script argument parser.
+        @param parser: argparse.ArgumentParser.
+    """
+    parser.add_argument("--format", dest="format", action="store", choices=FORMATS, default=None,
+                        help="Write the records in a machine readable format.")
+    parser.add_argument("-o", dest="output", action="store", default=None,
+                        help="Output file of the records, the standard output by default.")
+    parser.add_argument("--fields", dest="fields", action="store", default=None,
+                        help="Comma separated fields to write, the other fields aren't read.")
+    parser.add_argument("--where", dest="where", action="append", default=None,
+                        help="Condition of a field: field=glob, field=a,b,c, field>=value or field<value. "
+                             "Can be repeated.")
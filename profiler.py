@@ -0,0 +1,278 @@
+import argparse
+import batch
+import contextlib
+import json
+import networkList
+import os
+import registry
+import sys
+import threading
+import time
+import usbAttached
+import userLastPID
+import usersMRUList
+import utils
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+ARTIFACTS = ("networks", "usb", "mru", "lastpid")
+
+# Registry functions counted and timed.
+FUNCTIONS = ("OpenKeyEx", "OpenKey", "EnumKey", "EnumValue", "QueryValueEx", "QueryInfoKey")
+
+# Collector functions kept on each call path, from the innermost one.
+DEFAULT_DEPTH = 8
+
+# Hot paths shown by the report.
+DEFAULT_LIMIT = 10
+
+# Modules that make the registry calls on behalf of the collectors, they aren't reported as callers.
+_PLUMBING = ("registry", "regf", "records", "profiler")
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _label(frame):
+    """ Returns the name of the collector function of a frame, None for the plumbing and foreign code. """
+    file_name = os.path.abspath(frame.f_code.co_filename)
+    if os.path.dirname(file_name) != _ROOT:
+        return None
+
+    module_name = frame.f_globals.get("__name__", "")
+    if module_name == "__main__":
+        module_name = os.path.splitext(os.path.basename(file_name))[0]
+
+    if module_name in _PLUMBING:
+        return None
+
+    return "{0}.{1}".format(module_name, frame.f_code.co_name)
+
+
+class ProfilingRegistry:
+    """
+        Registry backend wrapper that counts and times the calls to each
+        function, attributed to the collector function that made them. It's
+        only installed while profiling, the other runs call the backend
+        directly.
+    """
+
+    def __init__(self, backend, depth=DEFAULT_DEPTH):
+        """
+            @param backend: Wrapped registry backend.
+            @param depth: Collector functions kept on each call path.
+        """
+        self.backend = backend
+        self.depth = depth
+        self.elapsed = 0.0
+
+        # Calls and nanoseconds of each (caller, function) and (call path, function).
+        self.calls = dict()
+        self.paths = dict()
+
+        # Label of each code object, None for the frames that aren't reported.
+        self._labels = dict()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        function = getattr(self.backend, name)
+        if name not in FUNCTIONS:
+            return function
+
+        def timed(*args):
+            start = time.perf_counter_ns()
+            try:
+                return function(*args)
+            finally:
+                self._add(name, time.perf_counter_ns() - start, sys._getframe(1))
+
+        # Later lookups find the wrapper without calling __getattr__.
+        setattr(self, name, timed)
+        return timed
+
+    def _callers(self, frame):
+        """ Returns the collector functions of a call stack, from the innermost one. """
+        callers = list()
+
+        while frame is not None and len(callers) < self.depth:
+            label = self._labels.get(frame.f_code, False)
+            if label is False:
+                label = self._labels[frame.f_code] = _label(frame)
+
+            if label is not None:
+                callers.append(label)
+            frame = frame.f_back
+
+        return callers
+
+    def _add(self, name, nanoseconds, frame):
+        """ Adds a call to the counters of its caller and call path. """
+        callers = self._callers(frame)
+        caller = callers[0] if callers else "<unknown>"
+        path = " > ".join(reversed(callers)) or "<unknown>"
+
+        with self._lock:
+            for counters in (self.calls.setdefault((caller, name), [0, 0]),
+                             self.paths.setdefault((path, name), [0, 0])):
+                counters[0] += 1
+                counters[1] += nanoseconds
+
+    def summary(self):
+        """
+            Returns the counters of the run:
+                calls, seconds: Registry calls and the time spent on them.
+                elapsed: Duration of the profiled run.
+                functions: Calls and seconds of each registry function.
+                callers: Calls and seconds of each collector function, and of each registry function it called.
+        """
+        functions = dict()
+        callers = dict()
+
+        for (caller, name), (calls, nanoseconds) in self.calls.items():
+            for counters in (functions.setdefault(name, {"calls": 0, "seconds": 0.0}),
+                             callers.setdefault(caller, {"calls": 0, "seconds": 0.0, "functions": dict()}),
+                             callers[caller]["functions"].setdefault(name, {"calls": 0, "seconds": 0.0})):
+                counters["calls"] += calls
+                counters["seconds"] += nanoseconds / 1e9
+
+        return {
+            "calls": sum(counters["calls"] for counters in functions.values()),
+            "seconds": sum(counters["seconds"] for counters in functions.values()),
+            "elapsed": self.elapsed,
+            "functions": functions,
+            "callers": dict(sorted(callers.items(), key=lambda item: -item[1]["seconds"])),
+        }
+
+    def hot_paths(self, limit=DEFAULT_LIMIT):
+        """
+            Returns the call paths that spent the most time on registry calls.
+            @param limit: Number of paths, None for all of them.
+
+            @returns list: Dicts with the path, its calls and seconds, and the calls of each function.
+        """
+        paths = dict()
+
+        for (path, name), (calls, nanoseconds) in self.paths.items():
+            counters = paths.setdefault(path, {"path": path, "calls": 0, "seconds": 0.0, "functions": dict()})
+            counters["calls"] += calls
+            counters["seconds"] += nanoseconds / 1e9
+            counters["functions"][name] = calls
+
+        return sorted(paths.values(), key=lambda counters: -counters["seconds"])[:limit]
+
+    def export(self, path, limit=None):
+        """
+            Writes the summary and the hot paths to a JSON file.
+            @param path: Output file path.
+            @param limit: Number of hot paths, None for all of them.
+        """
+        with open(path, "w", encoding="utf-8") as profile_file:
+            json.dump({"summary": self.summary(), "hot_paths": self.hot_paths(limit)}, profile_file, indent=4)
+
+
+@contextlib.contextmanager
+def profiled(depth=DEFAULT_DEPTH):
+    """
+        Counts and times the registry calls made until the end of the block.
+        @param depth: Collector functions kept on each call path.
+
+        @returns ProfilingRegistry: The profiler, with its counters.
+    """
+    profiler = ProfilingRegistry(registry.get_backend(), depth)
+    previous = registry.set_backend(profiler)
+    start = time.perf_counter()
+
+    try:
+        yield profiler
+    finally:
+        profiler.elapsed = time.perf_counter() - start
+        registry.set_backend(previous)
+
+
+def run_collectors(artifacts=ARTIFACTS):
+    """
+        Runs some collectors, reading every field of their records.
+        @param artifacts: Names of the collectors.
+
+        @returns int: Number of records.
+    """
+    collectors = list()
+
+    if "networks" in artifacts:
+        collectors.append(networkList.network_list())
+    if "usb" in artifacts:
+        collectors.append(usbAttached.prev_attached_usb())
+
+    if "mru" in artifacts or "lastpid" in artifacts:
+        for user_sid in utils.users_list():
+            if "mru" in artifacts:
+                collectors.append(usersMRUList.recent_docs_records(user_sid))
+            if "lastpid" in artifacts:
+                collectors.append(userLastPID.last_pid_records(user_sid))
+
+    found = 0
+    for collector in collectors:
+        for record in collector:
+            record.resolve()
+            found += 1
+
+    return found
+
+
+def print_report(profiler, limit=DEFAULT_LIMIT):
+    """
+        Prints the summary and the hot paths of a run.
+        @param profiler: ProfilingRegistry.
+        @param limit: Number of collector functions and hot paths.
+    """
+    summary = profiler.summary()
+    total = summary["seconds"] or 1.0
+
+    print("[*] Registry calls: {0} in {1:.3f}s, run time {2:.3f}s".format(summary["calls"], summary["seconds"],
+                                                                       summary["elapsed"]))
+    for name, counters in sorted(summary["functions"].items(), key=lambda item: -item[1]["seconds"]):
+        print("\t[+] {0}: {1} calls, {2:.3f}s".format(name, counters["calls"], counters["seconds"]))
+
+    print("\n[*] Collector functions:")
+    for caller, counters in list(summary["callers"].items())[:limit]:
+        print("\t[+] {0}: {1} calls, {2:.3f}s ({3:.1f}%)".format(caller, counters["calls"], counters["seconds"],
+                                                                 100 * counters["seconds"] / total))
+
+    print("\n[*] Hot paths:")
+    for counters in profiler.hot_paths(limit):
+        print("\t[+] {0:.3f}s, {1} calls: {2}".format(counters["seconds"], counters["calls"], counters["path"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to profile the registry calls of the collectors.")
+    parser.add_argument("artifacts", action="store", nargs="*",
+                        help="Collectors to run ({0}), all of them by default.".format(", ".join(ARTIFACTS)))
+    parser.add_argument("--hives", dest="hives", action="store", default=None,
+                        help="Directory with the hives collected from a host, the live registry by default.")
+    parser.add_argument("--depth", dest="depth", action="store", type=int, default=DEFAULT_DEPTH,
+                        help="Collector functions kept on each call path.")
+    parser.add_argument("--top", dest="top", action="store", type=int, default=DEFAULT_LIMIT,
+                        help="Collector functions and hot paths shown.")
+    parser.add_argument("-o", dest="output", action="store", default=None,
+                        help="JSON file where the summary and every hot path are written.")
+
+    args = parser.parse_args()
+
+    for artifact in args.artifacts:
+        if artifact not in ARTIFACTS:
+            parser.error("Unknown collector: {0}".format(artifact))
+
+    if args.hives is not None:
+        batch.load_host(batch.find_hives(args.hives))
+
+    with profiled(args.depth) as run_profiler:
+        records_found = run_collectors(tuple(args.artifacts or ARTIFACTS))
+
+    print("[*] Records: {0}\n".format(records_found))
+    print_report(run_profiler, args.top)
+
+    if args.output is not None:
+        run_profiler.export(args.output)
@@ -0,0 +1,257 @@
+import os
+import sys
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+# The collector modules, and the registry modules they import, are imported by
+# the subcommand that runs them, so the interpreter startup only pays for the
+# argument parser. benchmark.py tracks the import time of this script.
+
+# Subcommands run by 'all', in this order.
+COMMANDS = ("networks", "usb", "mru", "lastpid")
+
+
+def _query(args):
+    """ Returns the fields and the conditions of the records to write. """
+    import query
+
+    return query.parse_fields(args.fields), query.parse_where(args.where)
+
+
+def run_networks(args, user_sids=None):
+    """
+        Runs the networks subcommand.
+        @param args: Parsed arguments.
+        @param user_sids: Not used, every subcommand takes the listed users.
+
+        @returns generator: The records to write, or None when they were printed.
+    """
+    import networkList
+    import utils
+
+    seen = utils.BloomFilter(args.bloom) if args.bloom is not None else None
+
+    if args.format is None:
+        networkList.print_networks(seen)
+        return None
+
+    return networkList.network_list(*_query(args), seen)
+
+
+def run_usb(args, user_sids=None):
+    """ Runs the usb subcommand, see run_networks. """
+    import usbAttached
+
+    if args.format is None:
+        usbAttached.print_usb_devices()
+        return None
+
+    return usbAttached.prev_attached_usb(*_query(args))
+
+
+def run_mru(args, user_sids=None):
+    """
+        Runs the mru subcommand, see run_networks.
+        @param user_sids: Sids of every user, when they were already listed.
+    """
+    import usersMRUList
+
+    if args.format is not None:
+        return usersMRUList.user_records(args.user, *_query(args), args.limit, user_sids)
+
+    if args.user is None:
+        usersMRUList.print_all_users_mru(args.limit, user_sids)
+    else:
+        usersMRUList.print_single_user_mru(args.user, args.limit)
+
+    return None
+
+
+def run_lastpid(args, user_sids=None):
+    """
+        Runs the lastpid subcommand, see run_networks.
+        @param user_sids: Sids of every user, when they were already listed.
+    """
+    import userLastPID
+
+    if args.format is not None:
+        return userLastPID.user_records(args.user, *_query(args), args.limit, user_sids)
+
+    if args.user is None:
+        userLastPID.print_all_users_lpids(args.verbose, args.limit, user_sids)
+    else:
+        userLastPID.print_single_user_lpd(args.user, args.verbose, args.limit)
+
+    return None
+
+
+RUNNERS = {"networks": run_networks, "usb": run_usb, "mru": run_mru, "lastpid": run_lastpid}
+
+
+def run_command(command, args, user_sids=None, output_file=None):
+    """
+        Runs a subcommand, and writes its records when a format was given.
+        @param command: Subcommand name.
+        @param args: Parsed arguments.
+        @param user_sids: Sids of every user, when they were already listed.
+        @param output_file: Output file of the records, the -o argument by default.
+    """
+    found = RUNNERS[command](args, user_sids)
+
+    if found is not None:
+        import output
+        output.write_records(found, args.format, output_file or args.output)
+
+
+def run_all(args):
+    """
+        Runs several subcommands in a single process: the registry keys are
+        opened once for all of them and the users are listed once.
+        @param args: Parsed arguments of the all subcommand.
+
+        @returns dict: Error of each failed subcommand.
+    """
+    import registry
+    import utils
+
+    commands = [command for command in COMMANDS if command in (args.commands or COMMANDS)]
+    errors = dict()
+
+    if args.format is not None and args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+
+    with registry.cached():
+        user_sids = None
+        if "mru" in commands or "lastpid" in commands:
+            user_sids = utils.users_list()
+
+        for command in commands:
+            output_file = None
+            if args.format is not None and args.output is not None:
+                output_file = os.path.join(args.output, "{0}.{1}".format(command, args.format))
+
+            try:
+                run_command(command, args, user_sids, output_file)
+
+            # Collectors exit when they can't read a key.
+            except (Exception, SystemExit) as e:
+                errors[command] = "{0}: {1}".format(type(e).__name__, e)
+
+    return errors
+
+
+def build_parser():
+    """ Returns the argument parser of the subcommands. """
+    import argparse
+
+    # The output arguments of output.add_arguments, without importing it.
+    formats = ("jsonl", "csv", "columnar")
+
+    def add_output_arguments(parser, records=True):
+        parser.add_argument("--format", dest="format", action="store", choices=formats, default=None,
+                            help="Write the records in a machine readable format.")
+        if not records:
+            parser.add_argument("-o", dest="output", action="store", default=None,
+                                help="Directory where each subcommand writes <subcommand>.<format>, "
+                                     "the standard output by default (jsonl only).")
+            return
+
+        parser.add_argument("-o", dest="output", action="store", default=None,
+                            help="Output file of the records, the standard output by default.")
+        parser.add_argument("--fields", dest="fields", action="store", default=None,
+                            help="Comma separated fields to write, the other fields aren't read.")
+        parser.add_argument("--where", dest="where", action="append", default=None,
+                            help="Condition of a field: field=glob, field=a,b,c, field>=value or field<value. "
+                                 "Can be repeated.")
+
+    def add_limit_argument(parser):
+        parser.add_argument("--limit", dest="limit", action="store", type=int, default=None,
+                            help="Number of the most recent entries read, all of them by default.")
+
+    parser = argparse.ArgumentParser(prog="pyreg", description="Registry artifacts collector.")
+    parser.add_argument("--hives", dest="hives", action="store", default=None,
+                        help="Directory with the hives collected from a host, the live registry by default.")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    networks = commands.add_parser("networks", help="Previously connected networks.")
+    networks.add_argument("--bloom", dest="bloom", action="store", type=int, default=None,
+                          help="Find the repeated names with a Bloom filter sized for this many networks.")
+    add_output_arguments(networks)
+
+    usb = commands.add_parser("usb", help="Previously attached usb devices.")
+    add_output_arguments(usb)
+
+    mru = commands.add_parser("mru", help="Most recent opened files of the users.")
+    mru.add_argument("user", action="store", nargs="?", default=None, help="User name, every user by default.")
+    add_limit_argument(mru)
+    add_output_arguments(mru)
+
+    lastpid = commands.add_parser("lastpid", help="Last processes executed by the users.")
+    lastpid.add_argument("-u", dest="user", action="store", default=None, help="User name, every user by default.")
+    lastpid.add_argument("-v", dest="verbose", action="store_true", help="Print a raw version of the key value.")
+    add_limit_argument(lastpid)
+    add_output_arguments(lastpid)
+
+    run_all_parser = commands.add_parser("all", help="Several subcommands in a single process.")
+    run_all_parser.add_argument("commands", action="store", nargs="*",
+                                help="Subcommands to run ({0}), all of them by default.".format(", ".join(COMMANDS)))
+    run_all_parser.add_argument("-v", dest="verbose", action="store_true", help="Print a raw version of the key values.")
+    add_limit_argument(run_all_parser)
+    add_output_arguments(run_all_parser, records=False)
+    run_all_parser.set_defaults(user=None, fields=None, where=None, bloom=None)
+
+    return parser
+
+
+def main(argv=None):
+    """
+        Runs the subcommand of some arguments.
+        @param argv: Arguments, the command line ones by default.
+
+        @returns int: Exit status.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.where:
+        import query
+
+        try:
+            query.parse_where(args.where)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.command == "all":
+        for command in args.commands:
+            if command not in COMMANDS:
+                parser.error("Unknown subcommand: {0}".format(command))
+
+        if args.format not in (None, "jsonl") and args.output is None:
+            parser.error("The {0} format needs an output directory.".format(args.format))
+
+    if args.hives is not None:
+        import batch
+        batch.load_host(batch.find_hives(args.hives))
+
+    if args.command != "all":
+        import registry
+
+        # The profile keys are read once for every user.
+        with registry.cached():
+            run_command(args.command, args)
+        return 0
+
+    errors = run_all(args)
+    for command, error in errors.items():
+        print("[!!] {0} failed: {1}".format(command, error), file=sys.stderr)
+
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
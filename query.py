@@ -0,0 +1,191 @@
+import datetime
+import fnmatch
+import utc
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+class Range:
+    """
+        Values from 'after' (included) to 'before' (excluded). The bounds of
+        the time fields can be datetimes, ISO 8601 strings or 64-bits Windows
+        timestamps.
+    """
+
+    def __init__(self, after=None, before=None):
+        """
+            @param after: Lowest value, None for no bound.
+            @param before: Value after the highest one, None for no bound.
+        """
+        self.after = after
+        self.before = before
+
+    def converted(self, convert):
+        """ Returns the range with both bounds converted. """
+        return Range(None if self.after is None else convert(self.after),
+                     None if self.before is None else convert(self.before))
+
+    def __contains__(self, value):
+        if value is None:
+            return False
+
+        return (self.after is None or value >= self.after) and (self.before is None or value < self.before)
+
+    def __repr__(self):
+        return "Range({0!r}, {1!r})".format(self.after, self.before)
+
+
+def to_filetime(value):
+    """
+        Converts a time to a 64-bits Windows timestamp.
+        @param value: Datetime (naive ones are UTC), ISO 8601 string or Windows timestamp.
+    """
+    if isinstance(value, int):
+        return value
+
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc)
+
+    seconds = ((utc.days_from_civil(value.year, value.month, value.day) * 24 + value.hour) * 60
+               + value.minute) * 60 + value.second
+    return (seconds * 1000000 + value.microsecond) * 10 + utc.EPOCH_AS_FILETIME
+
+
+def _condition(condition, field_type):
+    """
+        Returns the predicate of a field condition:
+            Callable: Used as it is.
+            Range: Range of numbers or times.
+            String: Case insensitive glob pattern.
+            Set, list or tuple: Allowed values, strings are compared without case.
+            Anything else: Equal value.
+    """
+    if callable(condition):
+        return condition
+
+    # The command line conditions of the number fields are strings.
+    if field_type == "int" and isinstance(condition, str):
+        condition = int(condition)
+    elif field_type == "int" and isinstance(condition, (set, frozenset, list, tuple)):
+        condition = {int(item) for item in condition}
+
+    if isinstance(condition, Range):
+        if field_type in ("filetime", "systemtime"):
+            condition = condition.converted(to_filetime)
+        elif field_type == "int":
+            condition = condition.converted(int)
+
+        if field_type == "systemtime":
+            return lambda value: value is not None and utc.get_filetime(value) in condition
+
+        return lambda value: value in condition
+
+    if isinstance(condition, str):
+        pattern = condition.lower()
+
+        if field_type == "strlist":
+            return lambda value: any(fnmatch.fnmatchcase(item.lower(), pattern) for item in value or list())
+
+        return lambda value: value is not None and fnmatch.fnmatchcase(str(value).lower(), pattern)
+
+    if isinstance(condition, (set, frozenset, list, tuple)):
+        allowed = {item.lower() if isinstance(item, str) else item for item in condition}
+        return lambda value: (value.lower() if isinstance(value, str) else value) in allowed
+
+    return lambda value: value == condition
+
+
+class Query:
+    """
+        Fields and conditions requested to a collector. The collectors read
+        only the values of the requested fields and check each condition as
+        soon as its field is read, so the rejected records skip the rest of
+        their keys.
+    """
+
+    def __init__(self, record_type, fields=None, where=None):
+        """
+            @param record_type: Record class yielded by the collector.
+            @param fields: Names of the fields to read, every field by default.
+                The other fields are None.
+            @param where: Dict that maps field names to conditions.
+        """
+        types = dict(zip(record_type._fields, record_type.TYPES))
+
+        for name in list(fields or list()) + list(where or dict()):
+            if name not in types:
+                raise ValueError("{0} doesn't have the field '{1}'.".format(record_type.__name__, name))
+
+        self.record_type = record_type
+        self.fields = tuple(fields) if fields else record_type._fields
+        self.conditions = {name: _condition(condition, types[name]) for name, condition in (where or dict()).items()}
+        self.needed = set(self.fields) | set(self.conditions)
+
+    def wants(self, name):
+        """ Returns whether a field has to be read. """
+        return name in self.needed
+
+    def accepts(self, name, value):
+        """ Returns whether a field value meets its condition. """
+        condition = self.conditions.get(name)
+        return condition is None or condition(value)
+
+    def match(self, record):
+        """ Returns whether a record meets every condition, the lazy fields are read last. """
+        names = sorted(self.conditions, key=lambda name: not record.is_resolved(name))
+        return all(self.conditions[name](getattr(record, name)) for name in names)
+
+
+def parse_where(expressions):
+    """
+        Parses the command line conditions:
+            field=pattern    Glob pattern.
+            field=a,b,c      Set of values.
+            field>=value     Values from 'value', included.
+            field<value      Values before 'value'.
+
+        @param expressions: List of conditions.
+        @returns dict: Conditions of each field.
+    """
+    where = dict()
+
+    for expression in expressions or list():
+        # The first operator splits the condition, the value may contain the others.
+        found = [(expression.find(operator), operator) for operator in (">=", "<", "=") if operator in expression]
+        if not found:
+            raise ValueError("Invalid condition: {0}".format(expression))
+
+        position, operator = min(found)
+        name, value = expression[:position], expression[position + len(operator):]
+
+        name = name.strip()
+        previous = where.get(name)
+
+        # A field is either matched with '=' or bounded by a range, not both.
+        if previous is not None and isinstance(previous, Range) != (operator != "="):
+            raise ValueError("Condition mixes '=' with '>=' or '<' on the field {0}: {1}".format(name, expression))
+
+        if operator == ">=":
+            where[name] = Range(value, previous.before if previous is not None else None)
+        elif operator == "<":
+            where[name] = Range(previous.after if previous is not None else None, value)
+        elif "," in value:
+            where[name] = set(value.split(","))
+        else:
+            where[name] = value
+
+    return where
+
+
+def parse_fields(fields):
+    """ Parses a comma separated list of fields. """
+    return [name.strip() for name in fields.split(",")] if fields else None
@@ -0,0 +1,206 @@
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+# Field types:
+#   str: Text, or None.
+#   int: 64-bits integer.
+#   filetime: 64-bits Windows timestamp, as stored on the registry.
+#   systemtime: 16 bytes SYSTEMTIME structure, as stored on the NetworkList keys.
+#   strlist: List of strings.
+
+
+class Lazy:
+    """
+        A field value read the first time it's accessed. The result is kept,
+        so the registry is read once even if it's shared by several fields.
+    """
+    __slots__ = ("function", "args", "value", "resolved")
+
+    def __init__(self, function, *args):
+        """
+            @param function: Function that reads the value.
+            @param args: Arguments of the function.
+        """
+        self.function = function
+        self.args = args
+        self.value = None
+        self.resolved = False
+
+    def resolve(self):
+        """ Returns the value, reading it the first time. """
+        if not self.resolved:
+            self.value = self.function(*self.args)
+            self.resolved = True
+            self.function = self.args = None
+
+        return self.value
+
+    def item(self, index):
+        """ Returns a lazy value of an item of this value. """
+        return Lazy(lambda: self.resolve()[index])
+
+
+def _slots(fields):
+    """ Returns the slots of a record class: a private slot per field. """
+    return tuple("_" + name for name in fields)
+
+
+def _field(slot):
+    """ Returns the property of a record field, which resolves the lazy values. """
+    def get(record):
+        value = getattr(record, slot)
+        if type(value) is Lazy:
+            value = value.resolve()
+            setattr(record, slot, value)
+        return value
+
+    return property(get)
+
+
+class Record:
+    """
+        Base class of the records yielded by the collectors. The fields are
+        stored on slots, and the ones given as Lazy values are read on their
+        first access. The records behave like the tuples they replaced:
+        they can be indexed, iterated and compared.
+    """
+    __slots__ = ()
+    _fields = ()
+    TYPES = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in cls._fields:
+            setattr(cls, name, _field("_" + name))
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > len(self._fields):
+            raise TypeError("{0} takes {1} fields, {2} given.".format(type(self).__name__, len(self._fields),
+                                                                      len(args)))
+
+        for name, value in zip(self._fields, args):
+            setattr(self, "_" + name, value)
+
+        for name in self._fields[len(args):]:
+            if name not in kwargs:
+                raise TypeError("{0} is missing the '{1}' field.".format(type(self).__name__, name))
+            setattr(self, "_" + name, kwargs.pop(name))
+
+        if kwargs:
+            raise TypeError("{0} doesn't have the fields {1}.".format(type(self).__name__, ", ".join(kwargs)))
+
+    def is_resolved(self, name):
+        """ Returns whether a field was already read. """
+        return type(getattr(self, "_" + name)) is not Lazy
+
+    def resolve(self):
+        """ Reads every lazy field, and returns the record. """
+        for name in self._fields:
+            getattr(self, name)
+        return self
+
+    def _asdict(self):
+        return {name: getattr(self, name) for name in self._fields}
+
+    def _replace(self, **kwargs):
+        fields = {name: getattr(self, "_" + name) for name in self._fields}
+        fields.update(kwargs)
+        return type(self)(**fields)
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        return getattr(self, self._fields[index])
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __reduce__(self):
+        # The lazy values can't be pickled, they are read first.
+        return type(self), tuple(self)
+
+    def __repr__(self):
+        return "{0}({1})".format(type(self).__name__, ", ".join(
+            "{0}={1!r}".format(name, getattr(self, name)) for name in self._fields))
+
+
+class Network(Record):
+    """ A previously connected network. """
+    _fields = ("name", "mac_address", "first_connected", "last_connected")
+    __slots__ = _slots(_fields)
+    TYPES = ("str", "str", "systemtime", "systemtime")
+
+
+class UsbDevice(Record):
+    """ A previously attached USB storage device. """
+    _fields = ("device_name", "first_attached", "friendly_name", "container_id", "class_guid", "disk_id",
+               "device_class_guid", "mfg", "driver", "extra")
+    __slots__ = _slots(_fields)
+    TYPES = ("str", "filetime", "str", "str", "str", "str", "str", "str", "str", "strlist")
+
+
+class RecentDoc(Record):
+    """ A recently opened file, position 0 is the most recent one. """
+    _fields = ("user_sid", "extension", "position", "filename", "last_accessed")
+    __slots__ = _slots(_fields)
+    TYPES = ("str", "str", "int", "str", "filetime")
+
+
+class LastProcess(Record):
+    """
+        A process of the LastVisitedPidlMRU key and the last folder it visited,
+        position 0 is the most recent one.
+    """
+    _fields = ("user_sid", "position", "process_name", "folder", "data", "last_written")
+    __slots__ = _slots(_fields)
+    TYPES = ("str", "int", "str", "str", "str", "filetime")
+
+
+class TimelineEvent(Record):
+    """ A timestamped event of a timeline, merged from every artifact. """
+    _fields = ("timestamp", "host", "user", "artifact", "detail")
+    __slots__ = _slots(_fields)
+    TYPES = ("filetime", "str", "str", "str", "str")
+
+
+class RecordPresence(Record):
+    """
+        A record found on some versions of a hive, and the first and last
+        versions where it was found.
+    """
+    _fields = ("collector", "record", "first_seen", "last_seen", "versions", "data")
+    __slots__ = _slots(_fields)
+    TYPES = ("str", "str", "str", "str", "strlist", "str")
+
+
+class SearchHit(Record):
+    """
+        A pattern found on a hive: on a key name, a value name or a value
+        data, at some offset of it.
+    """
+    _fields = ("pattern", "encoding", "hive", "key_path", "value_name", "location", "offset", "last_written")
+    __slots__ = _slots(_fields)
+    TYPES = ("str", "str", "str", "str", "str", "str", "int", "filetime")
+
+
+class HostRecord(Record):
+    """
+        A record collected from a host of a sweep: the collector that found
+        it, its record type and the JSON version of its fields.
+    """
+    _fields = ("host", "collector", "record", "data")
+    __slots__ = _slots(_fields)
+    TYPES = ("str", "str", "str", "str")
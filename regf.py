@@ -0,0 +1,1050 @@
+import array
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+# Predefined keys and access rights, same values as the winreg module.
+HKEY_CLASSES_ROOT = 0x80000000
+HKEY_CURRENT_USER = 0x80000001
+HKEY_LOCAL_MACHINE = 0x80000002
+HKEY_USERS = 0x80000003
+KEY_READ = 0x20019
+
+# Value types.
+REG_NONE = 0
+REG_SZ = 1
+REG_EXPAND_SZ = 2
+REG_BINARY = 3
+REG_DWORD = 4
+REG_DWORD_BIG_ENDIAN = 5
+REG_LINK = 6
+REG_MULTI_SZ = 7
+REG_RESOURCE_LIST = 8
+REG_FULL_RESOURCE_DESCRIPTOR = 9
+REG_RESOURCE_REQUIREMENTS_LIST = 10
+REG_QWORD = 11
+
+# Cell offsets are relative to the first hive bin.
+HBIN_START = 0x1000
+
+# Size of the pages hashed to compare versions of a hive.
+PAGE_SIZE = 0x1000
+
+# Size of the base block area checked by its checksum, and of the base block of the transaction logs.
+BASE_BLOCK_SIZE = 512
+
+# Seed of the Marvin32 hashes that validate the transaction log entries.
+MARVIN32_SEED = 0x82EF4D887A4E55C5
+
+# Key index sidecar files: suffix, signature and version.
+INDEX_SUFFIX = ".idx"
+INDEX_SIGNATURE = b"PYREGIDX"
+INDEX_VERSION = 1
+
+# Biggest data chunk stored in a single cell, bigger values use a 'db' cell.
+BIG_DATA_SEGMENT_SIZE = 16344
+
+KEY_COMP_NAME = 0x0020
+VALUE_COMP_NAME = 0x0001
+DATA_INLINE = 0x80000000
+
+_BASE_BLOCK = struct.Struct("<4sIIQIIIIII")
+_KEY_NODE = struct.Struct("<2sHQ15IHH")
+_KEY_VALUE = struct.Struct("<2sHIIIHH")
+_BIG_DATA = struct.Struct("<2sHI")
+_LIST_HEADER = struct.Struct("<2sH")
+_INT32 = struct.Struct("<i")
+_UINT32 = struct.Struct("<I")
+_LOG_ENTRY = struct.Struct("<4sIIIIIQQ")
+_DIRTY_PAGE = struct.Struct("<II")
+_INDEX_HEADER = struct.Struct("<8sIIIQQ16sII")
+
+
+def _not_found():
+    return FileNotFoundError(2, "The system cannot find the file specified")
+
+
+def _no_more_data():
+    return OSError(259, "No more data is available")
+
+
+def subkey_hash(name):
+    """
+        Returns the hash stored on the 'lh' subkey lists.
+        @param name: Key name.
+    """
+    name_hash = 0
+    for char in name.upper():
+        name_hash = (name_hash * 37 + ord(char)) & 0xFFFFFFFF
+
+    return name_hash
+
+
+def decode_value(data, value_type):
+    """
+        Converts the raw data of a value to the type returned by winreg.
+        @param data: Raw value data.
+        @param value_type: Registry value type.
+    """
+    if value_type in (REG_SZ, REG_EXPAND_SZ):
+        return bytes(data[:len(data) & ~1]).decode("utf-16-le", "replace").split("\x00", 1)[0]
+
+    if value_type == REG_MULTI_SZ:
+        strings = bytes(data[:len(data) & ~1]).decode("utf-16-le", "replace").split("\x00")
+        while strings and strings[-1] == "":
+            strings.pop()
+        return strings
+
+    if value_type == REG_DWORD:
+        return _UINT32.unpack(bytes(data[:4]).ljust(4, b"\x00"))[0]
+
+    if value_type == REG_DWORD_BIG_ENDIAN:
+        return struct.unpack(">I", bytes(data[:4]).rjust(4, b"\x00"))[0]
+
+    if value_type == REG_QWORD:
+        return struct.unpack("<Q", bytes(data[:8]).ljust(8, b"\x00"))[0]
+
+    return bytes(data) if len(data) > 0 else None
+
+
+def _unmap(data, mapped):
+    """ Releases a view of a memory map and closes the map. """
+    data.release()
+    try:
+        mapped.close()
+
+    # A cell view is still alive, the map is released when it's collected.
+    except BufferError:
+        pass
+
+
+def _marvin32_block(low, high):
+    high ^= low
+    low = ((low << 20) | (low >> 12)) & 0xFFFFFFFF
+    low = (low + high) & 0xFFFFFFFF
+    high = ((high << 9) | (high >> 23)) & 0xFFFFFFFF
+    high ^= low
+    low = ((low << 27) | (low >> 5)) & 0xFFFFFFFF
+    low = (low + high) & 0xFFFFFFFF
+    high = ((high << 19) | (high >> 13)) & 0xFFFFFFFF
+    return low, high
+
+
+def marvin32(data, seed=MARVIN32_SEED):
+    """
+        Returns the 64-bits Marvin32 hash of some data.
+        @param data: Bytes or view.
+        @param seed: 64-bits seed.
+    """
+    data = bytes(data)
+    tail = len(data) & 3
+    low, high = seed & 0xFFFFFFFF, seed >> 32
+
+    for word, in _UINT32.iter_unpack(data[:len(data) - tail]):
+        low, high = _marvin32_block((low + word) & 0xFFFFFFFF, high)
+
+    # The last bytes are padded with a 0x80 byte.
+    final = int.from_bytes(data[len(data) - tail:], "little") | (0x80 << (8 * tail))
+    low, high = _marvin32_block((low + final) & 0xFFFFFFFF, high)
+    low, high = _marvin32_block(low, high)
+
+    return (high << 32) | low
+
+
+def base_block_checksum(data):
+    """
+        Returns the checksum of a base block: the XOR of its first 127 double words.
+        @param data: Base block view.
+    """
+    checksum = 0
+    for word, in _UINT32.iter_unpack(bytes(data[:BASE_BLOCK_SIZE - 4])):
+        checksum ^= word
+
+    if checksum == 0xFFFFFFFF:
+        return 0xFFFFFFFE
+
+    return checksum or 1
+
+
+def find_logs(path):
+    """
+        Returns the transaction logs stored next to a hive, the .LOG1 and .LOG2
+        files with the same name in any case.
+        @param path: Path to the hive file.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    names = {(name + ".log1").lower(), (name + ".log2").lower()}
+
+    try:
+        return sorted(os.path.join(directory, entry) for entry in os.listdir(directory) if entry.lower() in names)
+    except OSError:
+        return list()
+
+
+def log_entries(data):
+    """
+        Yields the 'HvLE' entries of a transaction log, until the first one
+        that is damaged, out of sequence or partially written.
+        @param data: View of the log file, its base block included.
+
+        @returns generator: Sequence number, hive bins size and a list of
+            (page number, page view) tuples of each entry. The pages are
+            views of the log data, they aren't copied.
+    """
+    position = BASE_BLOCK_SIZE
+    expected = None
+
+    while position + _LOG_ENTRY.size <= len(data):
+        signature, size, _, sequence, hive_bins_size, page_count, data_hash, header_hash = \
+            _LOG_ENTRY.unpack_from(data, position)
+        pages_start = _LOG_ENTRY.size + page_count * _DIRTY_PAGE.size
+
+        if signature != b"HvLE" or size % BASE_BLOCK_SIZE or size < pages_start or position + size > len(data):
+            return
+
+        if expected is not None and sequence != expected:
+            return
+
+        entry = data[position:position + size]
+        if marvin32(entry[:32]) != header_hash or marvin32(entry[_LOG_ENTRY.size:]) != data_hash:
+            return
+
+        pages = list()
+        for offset, pages_size in _DIRTY_PAGE.iter_unpack(entry[_LOG_ENTRY.size:pages_start]):
+            if offset % PAGE_SIZE or pages_size % PAGE_SIZE or pages_start + pages_size > size:
+                return
+
+            for page in range((HBIN_START + offset) // PAGE_SIZE, (HBIN_START + offset + pages_size) // PAGE_SIZE):
+                pages.append((page, entry[pages_start:pages_start + PAGE_SIZE]))
+                pages_start += PAGE_SIZE
+
+        yield sequence, hive_bins_size, pages
+
+        expected = sequence + 1
+        position += size
+
+
+def _array(data, type_code):
+    """ Returns a view of an array of little endian integers, copied only on big endian hosts. """
+    view = data.cast(type_code)
+    if sys.byteorder == "little":
+        return view
+
+    values = array.array(type_code, view)
+    values.byteswap()
+    return values
+
+
+def _aligned(size):
+    return (size + 7) & ~7
+
+
+class KeyIndex:
+    """
+        Sorted index of the key paths of a hive, stored on a sidecar file
+        next to it. The file is memory mapped and every path is found with a
+        binary search, instead of walking the keys from the root.
+
+        File layout, little endian:
+            Header: signature, version, hive sequence numbers, hive size,
+                hive last write time, digest of the base block, number of keys
+                and size of the paths.
+            Key node offsets, value list offsets and path offsets (uint32),
+            last write times (uint64), and the UTF-8 paths sorted without case.
+    """
+
+    def __init__(self, path):
+        """
+            @param path: Path to the index file.
+        """
+        self.path = path
+
+        with open(path, "rb") as index_file:
+            self._mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._data = memoryview(self._mmap)
+
+        try:
+            signature, version, self.primary_sequence, self.secondary_sequence, self.hive_size, \
+                self.last_written, self.base_digest, self.count, paths_size = _INDEX_HEADER.unpack_from(self._data)
+        except struct.error:
+            signature = version = None
+
+        if signature != INDEX_SIGNATURE or version != INDEX_VERSION:
+            self.close()
+            raise ValueError("{0} is not a key index file.".format(path))
+
+        position = _aligned(_INDEX_HEADER.size)
+        sections = list()
+        for type_code, count in (("I", self.count), ("I", self.count), ("I", self.count + 1), ("Q", self.count)):
+            size = count * (8 if type_code == "Q" else 4)
+            sections.append(_array(self._data[position:position + size], type_code))
+            position = _aligned(position + size)
+
+        self.key_offsets, self.values_offsets, self._path_offsets, self.times = sections
+        self._paths = self._data[position:position + paths_size]
+
+    def close(self):
+        """ Unmaps the index file. """
+        self.key_offsets = self.values_offsets = self._path_offsets = self.times = self._paths = None
+        _unmap(self._data, self._mmap)
+
+    def matches(self, hive):
+        """ Returns whether the index was written for the current version of a hive. """
+        return (self.primary_sequence, self.secondary_sequence, self.hive_size, self.last_written,
+                self.base_digest) == (hive.primary_sequence, hive.secondary_sequence, len(hive._data),
+                                      hive.last_written, hive.page_digest(0))
+
+    def key_path(self, inx):
+        """ Returns the path of the key at some index. """
+        return bytes(self._paths[self._path_offsets[inx]:self._path_offsets[inx + 1]]).decode("utf-8")
+
+    def find(self, path):
+        """
+            Returns the index of a key path, or None if the hive doesn't have it.
+            @param path: Backslash separated path from the root key (case insensitive).
+        """
+        target = path.upper()
+        low, high = 0, self.count
+
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_path(middle).upper() < target:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.count and self.key_path(low).upper() == target:
+            return low
+
+        return None
+
+
+def write_index(hive, path=None):
+    """
+        Writes the key index sidecar of a hive, see KeyIndex.
+        @param hive: regf.Hive.
+        @param path: Index file path, the hive path plus INDEX_SUFFIX by default.
+
+        @returns int: Number of indexed keys.
+    """
+    path = hive.path + INDEX_SUFFIX if path is None else path
+    entries = list()
+    keys = [hive.root]
+
+    while keys:
+        key = keys.pop()
+        if key.path:
+            entries.append((key.path.upper(), key.path, key.offset, key.values_offset, key.last_written))
+
+        if key.num_subkeys:
+            for offset in hive.iter_subkey_offsets(key.subkeys_offset):
+                sub_key = KeyNode(hive, offset, "")
+                sub_key.path = "{0}\\{1}".format(key.path, sub_key.name) if key.path else sub_key.name
+                keys.append(sub_key)
+
+    entries.sort()
+
+    paths = [entry[1].encode("utf-8") for entry in entries]
+    path_offsets = array.array("I", [0])
+    for key_path in paths:
+        path_offsets.append(path_offsets[-1] + len(key_path))
+
+    sections = [array.array("I", [entry[2] for entry in entries]),
+                array.array("I", [entry[3] for entry in entries]),
+                path_offsets,
+                array.array("Q", [entry[4] for entry in entries])]
+
+    if sys.byteorder != "little":
+        for section in sections:
+            section.byteswap()
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as index_file:
+        header = _INDEX_HEADER.pack(INDEX_SIGNATURE, INDEX_VERSION, hive.primary_sequence, hive.secondary_sequence,
+                                    len(hive._data), hive.last_written, hive.page_digest(0), len(entries),
+                                    path_offsets[-1])
+        index_file.write(header.ljust(_aligned(len(header)), b"\x00"))
+
+        for section in sections:
+            data = section.tobytes()
+            index_file.write(data.ljust(_aligned(len(data)), b"\x00"))
+
+        index_file.write(b"".join(paths))
+
+    os.replace(temp_path, path)
+    return len(entries)
+
+
+class KeyNode:
+    """
+        An open key of a hive file. It mimics the winreg handles, so it can
+        be used with the 'with' statement.
+    """
+    __slots__ = ("hive", "offset", "path", "name", "flags", "last_written",
+                 "num_subkeys", "subkeys_offset", "num_values", "values_offset")
+
+    def __init__(self, hive, offset, path):
+        self.hive = hive
+        self.offset = offset
+        self.path = path
+
+        cell = hive.cell(offset)
+        fields = _KEY_NODE.unpack_from(cell)
+
+        if fields[0] != b"nk":
+            raise ValueError("Cell at offset {0:#x} is not a key node.".format(offset))
+
+        self.flags = fields[1]
+        self.last_written = fields[2]
+        self.num_subkeys = fields[5]
+        self.subkeys_offset = fields[7]
+        self.num_values = fields[9]
+        self.values_offset = fields[10]
+
+        name = cell[_KEY_NODE.size:_KEY_NODE.size + fields[18]]
+        self.name = hive.decode_name(name, self.flags & KEY_COMP_NAME)
+
+    def Close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def __repr__(self):
+        return "<KeyNode {0!r} at {1:#x}>".format(self.path, self.offset)
+
+
+class Hive:
+    """
+        Read only parser of a REGF hive file.
+        The file is memory mapped and the cells are read on demand, so only
+        the pages of the visited keys are loaded from disk.
+    """
+
+    def __init__(self, path, logs=None, index=None):
+        """
+            @param path: Path to the hive file (SYSTEM, SOFTWARE, NTUSER.DAT...).
+            @param logs: Transaction logs replayed when the hive is dirty, the
+                .LOG1 and .LOG2 files next to the hive by default.
+            @param index: Key index file, the sidecar next to the hive by
+                default, False to walk the keys. It's used only if it was
+                written for this version of the hive.
+        """
+        self.path = path
+
+        # Pages written by the transaction logs, by page number, the mapped
+        # logs and the key index, set before close() may be called.
+        self._overlay = dict()
+        self._logs = list()
+        self.replayed = 0
+        self.index = None
+
+        with open(path, "rb") as hive_file:
+            self._mmap = mmap.mmap(hive_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._data = memoryview(self._mmap)
+
+        if len(self._data) < HBIN_START:
+            self.close()
+            raise ValueError("{0} is not a registry hive file.".format(path))
+
+        signature, self.primary_sequence, self.secondary_sequence, self.last_written,\
+            self.major_version, self.minor_version, _, _, self.root_offset,\
+            self.hive_bins_size = _BASE_BLOCK.unpack_from(self._data)
+
+        if signature != b"regf":
+            self.close()
+            raise ValueError("{0} is not a registry hive file.".format(path))
+
+        # Pages of the file read by cell(), when it's a set.
+        self.pages = None
+        self._page_digests = dict()
+
+        if self.is_dirty():
+            self.replay(find_logs(path) if logs is None else logs)
+
+        # The index doesn't have the keys written by the transaction logs.
+        if index is not False and not self.replayed:
+            self.index = self._open_index(path + INDEX_SUFFIX if index is None else index)
+
+        # Root level key names that point to another key, like 'CurrentControlSet'.
+        self.aliases = dict()
+        self._resolve_current_control_set()
+
+    def _open_index(self, path):
+        """ Returns the key index of a file, or None if it doesn't exist or it's outdated. """
+        try:
+            index = KeyIndex(path)
+        except (OSError, ValueError):
+            return None
+
+        if not index.matches(self):
+            index.close()
+            return None
+
+        return index
+
+    def close(self):
+        """ Unmaps the hive file, its transaction logs and its index. """
+        if self.index is not None:
+            self.index.close()
+
+        self._overlay.clear()
+        for log_map, log_data in self._logs:
+            _unmap(log_data, log_map)
+
+        _unmap(self._data, self._mmap)
+
+    def is_dirty(self):
+        """ Returns whether the last write of the hive wasn't completed, so its logs have newer data. """
+        return self.primary_sequence != self.secondary_sequence or \
+            base_block_checksum(self._data) != _UINT32.unpack_from(self._data, BASE_BLOCK_SIZE - 4)[0]
+
+    def replay(self, logs):
+        """
+            Applies the transaction log entries newer than the hive. The dirty
+            pages aren't copied to the hive: they're views of the mapped logs,
+            which cell() reads instead of the hive pages.
+            @param logs: Paths of the .LOG1 and .LOG2 files.
+
+            @returns int: Number of applied log entries.
+        """
+        entries = list()
+
+        for log_path in logs:
+            with open(log_path, "rb") as log_file:
+                try:
+                    log_map = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+                # Empty log.
+                except ValueError:
+                    continue
+
+            log_data = memoryview(log_map)
+            self._logs.append((log_map, log_data))
+
+            if len(log_data) >= BASE_BLOCK_SIZE and log_data[:4] == b"regf" and \
+                    base_block_checksum(log_data) == _UINT32.unpack_from(log_data, BASE_BLOCK_SIZE - 4)[0]:
+                entries.extend(log_entries(log_data))
+
+        # The entries of both logs make a single sequence, starting at the last completed write.
+        expected = self.secondary_sequence
+        for sequence, hive_bins_size, pages in sorted(entries, key=lambda entry: entry[0]):
+            if sequence < expected:
+                continue
+            if self.replayed and sequence != expected:
+                break
+
+            self._overlay.update(pages)
+            self.hive_bins_size = hive_bins_size
+            self.replayed += 1
+            expected = sequence + 1
+
+        if self.replayed:
+            self.primary_sequence = self.secondary_sequence = expected
+            self._page_digests.clear()
+
+        return self.replayed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def cell(self, offset):
+        """
+            Returns a view of the data of the cell stored at some offset.
+            @param offset: Cell offset, relative to the first hive bin.
+        """
+        position = HBIN_START + offset
+        if self._overlay:
+            size = abs(_INT32.unpack(self._read(position, position + 4))[0])
+        else:
+            size = abs(_INT32.unpack_from(self._data, position)[0])
+
+        if self.pages is not None:
+            self.pages.update(range(position // PAGE_SIZE, (position + max(size, 4) - 1) // PAGE_SIZE + 1))
+
+        # Allocated cells have a negative size.
+        if self._overlay:
+            return self._read(position + 4, position + size)
+
+        return self._data[position + 4:position + size]
+
+    def _read(self, start, end):
+        """
+            Returns a view of a range of the file, with the pages written by
+            the transaction logs. Only the ranges that cross a replayed page
+            boundary are copied.
+        """
+        first, last = start // PAGE_SIZE, max(start, end - 1) // PAGE_SIZE
+
+        if first == last:
+            page = self._overlay.get(first)
+            if page is not None:
+                return page[start - first * PAGE_SIZE:end - first * PAGE_SIZE]
+
+        elif any(page in self._overlay for page in range(first, last + 1)):
+            data = b"".join(self._overlay.get(page, self._data[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])
+                            for page in range(first, last + 1))
+            return memoryview(data)[start - first * PAGE_SIZE:end - first * PAGE_SIZE]
+
+        return self._data[start:end]
+
+    def page_digest(self, page):
+        """
+            Returns the digest of a page of the file, the digests are computed
+            once and only for the requested pages.
+            @param page: Page number, the base block is the page 0.
+        """
+        digest = self._page_digests.get(page)
+
+        if digest is None:
+            digest = hashlib.blake2b(self._read(page * PAGE_SIZE, (page + 1) * PAGE_SIZE), digest_size=16).digest()
+            self._page_digests[page] = digest
+
+        return digest
+
+    @staticmethod
+    def decode_name(name, compressed):
+        """
+            Decodes a key or value name.
+            @param name: Raw name.
+            @param compressed: The name is stored as an ASCII (latin-1) string.
+        """
+        return bytes(name).decode("latin-1" if compressed else "utf-16-le", "replace")
+
+    @property
+    def root(self):
+        """ Returns the root key of the hive. """
+        return KeyNode(self, self.root_offset, "")
+
+    def _resolve_current_control_set(self):
+        """ Maps the 'CurrentControlSet' volatile key to the control set in use. """
+        root = self.root
+        if self.find_subkey(root, "CurrentControlSet") is not None:
+            return
+
+        select_offset = self.find_subkey(root, "Select")
+        if select_offset is None:
+            return
+
+        try:
+            current = self.query_value(KeyNode(self, select_offset, "Select"), "Current")[0]
+        except FileNotFoundError:
+            return
+
+        self.aliases["currentcontrolset"] = "ControlSet{0:03d}".format(current)
+
+    def iter_subkey_offsets(self, list_offset):
+        """
+            Yields the key node offsets stored on a subkey list.
+            @param list_offset: Offset of a lf, lh, li or ri cell.
+        """
+        cell = self.cell(list_offset)
+        signature, count = _LIST_HEADER.unpack_from(cell)
+
+        if signature in (b"lf", b"lh"):
+            for inx in range(count):
+                yield _UINT32.unpack_from(cell, 4 + inx * 8)[0]
+
+        elif signature == b"li":
+            for inx in range(count):
+                yield _UINT32.unpack_from(cell, 4 + inx * 4)[0]
+
+        elif signature == b"ri":
+            for inx in range(count):
+                yield from self.iter_subkey_offsets(_UINT32.unpack_from(cell, 4 + inx * 4)[0])
+
+        else:
+            raise ValueError("Unknown subkey list at offset {0:#x}.".format(list_offset))
+
+    def subkey_offset(self, key, index):
+        """
+            Returns the key node offset of the subkey at some index.
+            @param key: Parent KeyNode.
+            @param index: Subkey index.
+        """
+        if index < 0 or index >= key.num_subkeys:
+            raise _no_more_data()
+
+        list_offset = key.subkeys_offset
+        while True:
+            cell = self.cell(list_offset)
+            signature, count = _LIST_HEADER.unpack_from(cell)
+
+            if signature in (b"lf", b"lh"):
+                return _UINT32.unpack_from(cell, 4 + index * 8)[0]
+
+            if signature == b"li":
+                return _UINT32.unpack_from(cell, 4 + index * 4)[0]
+
+            if signature != b"ri":
+                raise ValueError("Unknown subkey list at offset {0:#x}.".format(list_offset))
+
+            # Index root, find the leaf that holds the requested index.
+            for inx in range(count):
+                leaf_offset = _UINT32.unpack_from(cell, 4 + inx * 4)[0]
+                leaf_count = _LIST_HEADER.unpack_from(self.cell(leaf_offset))[1]
+
+                if index < leaf_count:
+                    list_offset = leaf_offset
+                    break
+
+                index -= leaf_count
+            else:
+                raise _no_more_data()
+
+    def key_name_data(self, offset):
+        """
+            Returns the raw name of the key node stored at some offset.
+            @param offset: Key node offset.
+
+            @returns tuple: Name bytes, and whether they're an ASCII (compressed) name instead of UTF-16LE.
+        """
+        cell = self.cell(offset)
+        flags = _LIST_HEADER.unpack_from(cell)[1]
+        name_length = _KEY_NODE.unpack_from(cell)[18]
+        return cell[_KEY_NODE.size:_KEY_NODE.size + name_length], bool(flags & KEY_COMP_NAME)
+
+    def key_name(self, offset):
+        """
+            Returns the name of the key node stored at some offset.
+            @param offset: Key node offset.
+        """
+        return self.decode_name(*self.key_name_data(offset))
+
+    def find_subkey(self, key, name):
+        """
+            Returns the offset of a subkey, or None if it doesn't exist.
+            The hints of the lf/lh lists are checked before reading any key node.
+            @param key: Parent KeyNode.
+            @param name: Subkey name (case insensitive).
+        """
+        if key.num_subkeys == 0:
+            return None
+
+        upper_name = name.upper()
+        ascii_name = upper_name.isascii()
+        name_hash = subkey_hash(name)
+        hint = upper_name[:4].encode("latin-1", "replace").ljust(4, b"\x00")
+
+        return self._find_in_list(key.subkeys_offset, upper_name, ascii_name, name_hash, hint)
+
+    def _find_in_list(self, list_offset, upper_name, ascii_name, name_hash, hint):
+        cell = self.cell(list_offset)
+        signature, count = _LIST_HEADER.unpack_from(cell)
+
+        if signature == b"ri":
+            for inx in range(count):
+                offset = self._find_in_list(_UINT32.unpack_from(cell, 4 + inx * 4)[0],
+                                            upper_name, ascii_name, name_hash, hint)
+                if offset is not None:
+                    return offset
+            return None
+
+        step = 4 if signature == b"li" else 8
+        for inx in range(count):
+            position = 4 + inx * step
+
+            # Non ASCII names may use a different upper case table, so
+            # the hints are only trusted for ASCII names.
+            if ascii_name and signature == b"lh":
+                if _UINT32.unpack_from(cell, position + 4)[0] != name_hash:
+                    continue
+
+            elif ascii_name and signature == b"lf":
+                if bytes(cell[position + 4:position + 8]).upper() != hint:
+                    continue
+
+            offset = _UINT32.unpack_from(cell, position)[0]
+            if self.key_name(offset).upper() == upper_name:
+                return offset
+
+        return None
+
+    def open_key(self, path, key=None):
+        """
+            Opens a key of the hive.
+            @param path: Backslash separated path, relative to 'key'.
+            @param key: Parent KeyNode, the root key by default.
+        """
+        key = self.root if key is None else key
+        names = [name for name in path.split("\\") if name]
+
+        if self.index is not None and names:
+            return self._find_indexed(key, names)
+
+        for name in names:
+            if key.offset == self.root_offset:
+                name = self.aliases.get(name.lower(), name)
+
+            offset = self.find_subkey(key, name)
+            if offset is None:
+                raise _not_found()
+
+            parent_path, key = key.path, KeyNode(self, offset, "")
+            key.path = "{0}\\{1}".format(parent_path, key.name) if parent_path else key.name
+
+        return key
+
+    def _find_indexed(self, key, names):
+        """ Opens a key finding its full path on the key index. """
+        if key.offset == self.root_offset:
+            names[0] = self.aliases.get(names[0].lower(), names[0])
+
+        inx = self.index.find("\\".join([key.path] + names if key.path else names))
+        if inx is None:
+            raise _not_found()
+
+        return KeyNode(self, self.index.key_offsets[inx], self.index.key_path(inx))
+
+    def iter_value_offsets(self, key):
+        """
+            Yields the offsets of the 'vk' cells of a key.
+            @param key: KeyNode.
+        """
+        if key.num_values == 0:
+            return
+
+        cell = self.cell(key.values_offset)
+        for inx in range(key.num_values):
+            yield _UINT32.unpack_from(cell, inx * 4)[0]
+
+    def value_offset(self, key, index):
+        """
+            Returns the offset of the 'vk' cell at some index.
+            @param key: KeyNode.
+            @param index: Value index.
+        """
+        return _UINT32.unpack_from(self.cell(key.values_offset), index * 4)[0]
+
+    def value_name_data(self, offset):
+        """
+            Returns the raw name of the key value stored at some offset.
+            @param offset: Offset of a 'vk' cell.
+
+            @returns tuple: Name bytes, and whether they're an ASCII (compressed) name instead of UTF-16LE.
+        """
+        cell = self.cell(offset)
+        fields = _KEY_VALUE.unpack_from(cell)
+
+        if fields[0] != b"vk":
+            raise ValueError("Cell at offset {0:#x} is not a key value.".format(offset))
+
+        return cell[_KEY_VALUE.size:_KEY_VALUE.size + fields[1]], bool(fields[5] & VALUE_COMP_NAME)
+
+    def value_name(self, offset):
+        """
+            Returns the name of the key value stored at some offset.
+            @param offset: Offset of a 'vk' cell.
+        """
+        return self.decode_name(*self.value_name_data(offset))
+
+    def value_data(self, offset):
+        """
+            Returns the raw data and the type of a key value.
+            @param offset: Offset of a 'vk' cell.
+        """
+        cell = self.cell(offset)
+        _, _, size, data_offset, value_type, _, _ = _KEY_VALUE.unpack_from(cell)
+
+        # Small values are stored in the data offset field.
+        if size & DATA_INLINE:
+            return cell[8:8 + min(size & ~DATA_INLINE, 4)], value_type
+
+        if size == 0:
+            return cell[0:0], value_type
+
+        if size > BIG_DATA_SEGMENT_SIZE and self.minor_version > 3:
+            return self._big_data(data_offset, size), value_type
+
+        return self.cell(data_offset)[:size], value_type
+
+    def _big_data(self, offset, size):
+        """
+            Joins the segments of a 'db' cell.
+            @param offset: Offset of the 'db' cell.
+            @param size: Value data size.
+        """
+        signature, num_segments, segments_offset = _BIG_DATA.unpack_from(self.cell(offset))
+
+        if signature != b"db":
+            return self.cell(offset)[:size]
+
+        segments = self.cell(segments_offset)
+        data = bytearray()
+        for inx in range(num_segments):
+            segment_offset = _UINT32.unpack_from(segments, inx * 4)[0]
+            data += self.cell(segment_offset)[:min(BIG_DATA_SEGMENT_SIZE, size - len(data))]
+
+        return bytes(data)
+
+    def find_value(self, key, name):
+        """
+            Returns the 'vk' offset of a key value, or None if it doesn't exist.
+            @param key: KeyNode.
+            @param name: Value name (case insensitive), '' for the default value.
+        """
+        upper_name = name.upper()
+        for offset in self.iter_value_offsets(key):
+            if self.value_name(offset).upper() == upper_name:
+                return offset
+
+        return None
+
+    def query_value(self, key, name):
+        """
+            Returns the decoded value and its type, like winreg.QueryValueEx.
+            @param key: KeyNode.
+            @param name: Value name.
+        """
+        offset = self.find_value(key, name)
+        if offset is None:
+            raise _not_found()
+
+        data, value_type = self.value_data(offset)
+        return decode_value(data, value_type), value_type
+
+
+class RootKey:
+    """ A predefined key (HKLM, HKU...) whose subkeys are loaded hives. """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.hives = dict()
+
+    def names(self):
+        return sorted(self.hives)
+
+    def Close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class OfflineRegistry:
+    """
+        Offline registry made of hive files, mounted under the predefined
+        keys. It exposes the winreg functions used by the collectors.
+    """
+
+    def __init__(self):
+        self.roots = {handle: RootKey(handle) for handle in
+                      (HKEY_CLASSES_ROOT, HKEY_CURRENT_USER, HKEY_LOCAL_MACHINE, HKEY_USERS)}
+
+    def load(self, root, name, path, logs=None, index=None):
+        """
+            Mounts a hive file.
+            @param root: Predefined key, i.e. HKEY_LOCAL_MACHINE.
+            @param name: Mount point name, i.e. 'SOFTWARE' or an user SID.
+            @param path: Path to the hive file.
+            @param logs: Transaction logs of a dirty hive, the ones next to it by default.
+            @param index: Key index file, the sidecar next to the hive by default, False to walk the keys.
+        """
+        hive = Hive(path, logs, index)
+        self.unload(root, name)
+        self.roots[root].hives[name.upper()] = (name, hive)
+        return hive
+
+    def unload(self, root, name):
+        """
+            Unmounts a hive file.
+            @param root: Predefined key.
+            @param name: Mount point name.
+        """
+        mounted = self.roots[root].hives.pop(name.upper(), None)
+        if mounted is not None:
+            mounted[1].close()
+
+    def close(self):
+        """ Unmounts every hive. """
+        for root in self.roots.values():
+            for name in list(root.hives):
+                self.unload(root.handle, name)
+
+    def _key(self, key):
+        if isinstance(key, (KeyNode, RootKey)):
+            return key
+
+        try:
+            return self.roots[key]
+        except (KeyError, TypeError):
+            raise OSError(6, "The handle is invalid")
+
+    def OpenKeyEx(self, key, sub_key, reserved=0, access=KEY_READ):
+        key = self._key(key)
+
+        if isinstance(key, KeyNode):
+            return key.hive.open_key(sub_key, key)
+
+        mount_name, _, path = sub_key.strip("\\").partition("\\")
+        if not mount_name:
+            return key
+
+        try:
+            hive = key.hives[mount_name.upper()][1]
+        except KeyError:
+            raise _not_found()
+
+        return hive.open_key(path)
+
+    OpenKey = OpenKeyEx
+
+    def CloseKey(self, key):
+        pass
+
+    def EnumKey(self, key, index):
+        key = self._key(key)
+
+        if isinstance(key, RootKey):
+            names = key.names()
+            if index < 0 or index >= len(names):
+                raise _no_more_data()
+            return key.hives[names[index]][0]
+
+        return key.hive.key_name(key.hive.subkey_offset(key, index))
+
+    def EnumValue(self, key, index):
+        key = self._key(key)
+
+        if isinstance(key, RootKey) or index < 0 or index >= key.num_values:
+            raise _no_more_data()
+
+        offset = key.hive.value_offset(key, index)
+        data, value_type = key.hive.value_data(offset)
+        return key.hive.value_name(offset), decode_value(data, value_type), value_type
+
+    def QueryValueEx(self, key, value_name):
+        key = self._key(key)
+
+        if isinstance(key, RootKey):
+            raise _not_found()
+
+        return key.hive.query_value(key, value_name or "")
+
+    def QueryInfoKey(self, key):
+        key = self._key(key)
+
+        if isinstance(key, RootKey):
+            return len(key.hives), 0, 0
+
+        return key.num_subkeys, key.num_values, key.last_written
@@ -0,0 +1,361 @@
+import collections
+import contextlib
+import regf
+import threading
+
+try:
+    import winreg
+except ImportError:
+    winreg = None
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+HKEY_CLASSES_ROOT = regf.HKEY_CLASSES_ROOT
+HKEY_CURRENT_USER = regf.HKEY_CURRENT_USER
+HKEY_LOCAL_MACHINE = regf.HKEY_LOCAL_MACHINE
+HKEY_USERS = regf.HKEY_USERS
+KEY_READ = regf.KEY_READ
+
+# Entries kept by the per-run cache.
+DEFAULT_CACHE_SIZE = 65536
+
+# Object (or module) that implements the winreg functions.
+_backend = winreg
+
+
+def get_backend():
+    """ Returns the backend in use. """
+    if _backend is None:
+        raise OSError("There is no live registry, load some hive files with registry.use_hives().")
+
+    return _backend
+
+
+def set_backend(backend):
+    """
+        Replaces the backend in use and returns the previous one.
+        @param backend: Object that implements the winreg functions.
+    """
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
+
+
+def use_live():
+    """ Reads the registry of the running system. """
+    if isinstance(_backend, regf.OfflineRegistry):
+        _backend.close()
+
+    set_backend(winreg)
+
+
+def use_hives(software=None, system=None, users=None):
+    """
+        Reads the registry from exported hive files.
+        @param software: Path to the SOFTWARE hive.
+        @param system: Path to the SYSTEM hive.
+        @param users: Dict that maps user SIDs to their NTUSER.DAT path.
+
+        @returns OfflineRegistry: The registry made of the loaded hives.
+    """
+    offline = regf.OfflineRegistry()
+
+    try:
+        if software is not None:
+            offline.load(HKEY_LOCAL_MACHINE, "SOFTWARE", software)
+
+        if system is not None:
+            offline.load(HKEY_LOCAL_MACHINE, "SYSTEM", system)
+
+        for user_sid, ntuser in (users or dict()).items():
+            offline.load(HKEY_USERS, user_sid, ntuser)
+
+    # The hives loaded before the failing one are unmapped.
+    except Exception:
+        offline.close()
+        raise
+
+    if isinstance(_backend, regf.OfflineRegistry):
+        _backend.close()
+
+    set_backend(offline)
+    return offline
+
+
+class CachedKey:
+    """
+        Key returned by the CachedRegistry. It's identified by its root key
+        and its lower case path, so every handle of the same key shares the
+        cached reads.
+    """
+    __slots__ = ("root", "path")
+
+    def __init__(self, root, path):
+        self.root = root
+        self.path = path
+
+    def Close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def __repr__(self):
+        return "<CachedKey {0:#x}\\{1}>".format(self.root, self.path)
+
+
+class CachedRegistry:
+    """
+        Backend that memoizes the opened keys, the enumerations and the value
+        reads of another backend, evicting the least recently used entries.
+        Missing keys and values are cached too. The backend key handles stay
+        open until close(), a handle evicted from the cache may still be in use.
+    """
+
+    def __init__(self, backend, maxsize=DEFAULT_CACHE_SIZE):
+        """
+            @param backend: Object that implements the winreg functions.
+            @param maxsize: Maximum number of cached entries.
+        """
+        self.backend = backend
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+        # Keys whose values were all cached by prefetch.
+        self._complete_values = set()
+        # Backend handle of every opened key, by (root, path), reused when an evicted key is opened again.
+        self._handles = dict()
+
+    def stats(self):
+        """ Returns the cache counters. """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": len(self._entries)}
+
+    def close(self):
+        """ Closes the key handles and empties the cache. """
+        with self._lock:
+            while self._entries:
+                self._evict()
+            self._complete_values.clear()
+
+            for handle in self._handles.values():
+                handle.Close()
+            self._handles.clear()
+
+    def _evict(self):
+        entry, _ = self._entries.popitem(last=False)
+        if entry[0] == "value":
+            self._complete_values.discard(entry[1:3])
+
+    def _open(self, root, path, parent, sub_key):
+        """
+            Opens a key of the backend, or returns its handle when it was opened before.
+            @param root: Predefined key of the cached key.
+            @param path: Lower case path of the cached key.
+            @param parent: Backend key the sub key is opened from.
+            @param sub_key: Path of the key from the parent.
+        """
+        with self._lock:
+            handle = self._handles.get((root, path))
+        if handle is not None:
+            return handle
+
+        handle = self.backend.OpenKeyEx(parent, sub_key, 0, KEY_READ)
+
+        with self._lock:
+            # Another thread may have opened it meanwhile.
+            if (root, path) in self._handles:
+                handle.Close()
+            return self._handles.setdefault((root, path), handle)
+
+    def _put(self, entry, error, result):
+        with self._lock:
+            self._entries[entry] = (error, result)
+            self._entries.move_to_end(entry)
+            while len(self._entries) > self.maxsize:
+                self.evictions += 1
+                self._evict()
+
+    def _get(self, entry, read):
+        """
+            Returns a cached result, calling 'read' on a miss.
+            The exceptions raised by 'read' are cached and raised again.
+        """
+        with self._lock:
+            cached_result = self._entries.get(entry)
+
+            if cached_result is not None:
+                self.hits += 1
+                self._entries.move_to_end(entry)
+            else:
+                self.misses += 1
+
+        # The backend is read without holding the lock.
+        if cached_result is None:
+            try:
+                cached_result = (None, read())
+            except OSError as e:
+                cached_result = (e, None)
+
+            self._put(entry, *cached_result)
+
+        error, result = cached_result
+        if error is not None:
+            raise type(error)(*error.args)
+
+        return result
+
+    def _handle(self, key):
+        """ Returns the handle of the backend for a CachedKey. """
+        if not key.path:
+            return key.root
+
+        return self._get(("key", key.root, key.path), lambda: self._open(key.root, key.path, key.root, key.path))
+
+    def prefetch(self, root, path, depth=0):
+        """
+            Reads a subtree a single time, caching its keys, subkey names and
+            values, so the collectors that read it later don't touch the backend.
+            @param root: Predefined key.
+            @param path: Path of the subtree root key.
+            @param depth: Levels of subkeys to read, 0 to read only the key.
+        """
+        key = CachedKey(root, "\\".join(name for name in path.lower().split("\\") if name))
+
+        try:
+            handle = self._handle(key)
+        except OSError:
+            return
+
+        self._prefetch(key, handle, depth)
+
+    def _prefetch(self, key, handle, depth):
+        info = self._get(("info", key.root, key.path), lambda: self.backend.QueryInfoKey(handle))
+
+        for index in range(info[1]):
+            name, value, value_type = self._get(("enumvalue", key.root, key.path, index),
+                                                lambda: self.backend.EnumValue(handle, index))
+            self._put(("value", key.root, key.path, name.lower()), None, (value, value_type))
+
+        with self._lock:
+            self._complete_values.add((key.root, key.path))
+
+        if depth <= 0:
+            return
+
+        for index in range(info[0]):
+            name = self._get(("enum", key.root, key.path, index), lambda: self.backend.EnumKey(handle, index))
+            sub_key = CachedKey(key.root, "{0}\\{1}".format(key.path, name.lower()) if key.path else name.lower())
+
+            # Subkeys are opened from their parent, not from the root key.
+            try:
+                sub_handle = self._get(("key", sub_key.root, sub_key.path),
+                                       lambda: self._open(sub_key.root, sub_key.path, handle, name))
+            except OSError:
+                continue
+
+            self._prefetch(sub_key, sub_handle, depth - 1)
+
+    def _cached_key(self, key):
+        if isinstance(key, CachedKey):
+            return key
+
+        return CachedKey(key, "")
+
+    def OpenKeyEx(self, key, sub_key, reserved=0, access=KEY_READ):
+        parent = self._cached_key(key)
+        names = [name for name in parent.path.split("\\") + sub_key.lower().split("\\") if name]
+
+        cached_key = CachedKey(parent.root, "\\".join(names))
+        self._handle(cached_key)
+        return cached_key
+
+    OpenKey = OpenKeyEx
+
+    def CloseKey(self, key):
+        pass
+
+    def EnumKey(self, key, index):
+        key = self._cached_key(key)
+        return self._get(("enum", key.root, key.path, index),
+                         lambda: self.backend.EnumKey(self._handle(key), index))
+
+    def EnumValue(self, key, index):
+        key = self._cached_key(key)
+        return self._get(("enumvalue", key.root, key.path, index),
+                         lambda: self.backend.EnumValue(self._handle(key), index))
+
+    def QueryValueEx(self, key, value_name):
+        key = self._cached_key(key)
+
+        def read():
+            # Every value of a prefetched key is cached, so this one doesn't exist.
+            if (key.root, key.path) in self._complete_values:
+                raise FileNotFoundError(2, "The system cannot find the file specified")
+
+            return self.backend.QueryValueEx(self._handle(key), value_name)
+
+        return self._get(("value", key.root, key.path, (value_name or "").lower()), read)
+
+    def QueryInfoKey(self, key):
+        key = self._cached_key(key)
+        return self._get(("info", key.root, key.path),
+                         lambda: self.backend.QueryInfoKey(self._handle(key)))
+
+
+@contextlib.contextmanager
+def cached(maxsize=DEFAULT_CACHE_SIZE):
+    """
+        Caches the registry reads until the end of the block, so the keys
+        read by several collectors are only read once.
+        @param maxsize: Maximum number of cached entries.
+
+        @returns CachedRegistry: The cache, with its hit and miss counters.
+    """
+    if isinstance(_backend, CachedRegistry):
+        yield _backend
+        return
+
+    cache = CachedRegistry(get_backend(), maxsize)
+    previous = set_backend(cache)
+
+    try:
+        yield cache
+    finally:
+        set_backend(previous)
+        cache.close()
+
+
+def OpenKeyEx(key, sub_key, reserved=0, access=KEY_READ):
+    return get_backend().OpenKeyEx(key, sub_key, reserved, access)
+
+
+def CloseKey(key):
+    return get_backend().CloseKey(key)
+
+
+def EnumKey(key, index):
+    return get_backend().EnumKey(key, index)
+
+
+def EnumValue(key, index):
+    return get_backend().EnumValue(key, index)
+
+
+def QueryValueEx(key, value_name):
+    return get_backend().QueryValueEx(key, value_name)
+
+
+def QueryInfoKey(key):
+    return get_backend().QueryInfoKey(key)
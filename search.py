@@ -0,0 +1,238 @@
+import argparse
+import collections
+import output
+import records
+import regf
+import utils
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+# Encodings searched for the text patterns.
+TEXT_ENCODINGS = ("ascii", "utf-16le")
+
+
+class Automaton:
+    """
+        Aho-Corasick automaton of many byte patterns. The text is read a
+        single time whatever the number of patterns, each byte costs a
+        transition and the failure links followed on mismatches.
+    """
+
+    def __init__(self, patterns):
+        """
+            @param patterns: Iterable of (pattern bytes, label) tuples.
+        """
+        # Transitions, failure link and matched (length, label) tuples of each state.
+        self.goto = [dict()]
+        self.fail = [0]
+        self.matches = [()]
+
+        for needle, label in patterns:
+            state = 0
+            for byte in needle:
+                next_state = self.goto[state].get(byte)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto.append(dict())
+                    self.fail.append(0)
+                    self.matches.append(())
+                    self.goto[state][byte] = next_state
+                state = next_state
+
+            self.matches[state] += ((len(needle), label),)
+
+        # The failure links are set breadth first, from the shortest prefixes.
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+
+            for byte, next_state in self.goto[state].items():
+                queue.append(next_state)
+
+                fallback = self.fail[state]
+                while fallback and byte not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+
+                self.fail[next_state] = self.goto[fallback].get(byte, 0)
+                self.matches[next_state] += self.matches[self.fail[next_state]]
+
+    def __len__(self):
+        return len(self.goto) - 1
+
+    def search(self, data):
+        """
+            Yields the start offset and the label of every pattern found on
+            some data, overlapping ones included.
+            @param data: Bytes or view.
+        """
+        goto, fail, matches = self.goto, self.fail, self.matches
+        state = 0
+
+        for position, byte in enumerate(data):
+            next_state = goto[state].get(byte)
+
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto[state].get(byte)
+
+            state = next_state or 0
+
+            if matches[state]:
+                for length, label in matches[state]:
+                    yield position + 1 - length, label
+
+
+def build_automata(patterns):
+    """
+        Returns the automata of some patterns: text patterns are searched as
+        ASCII and UTF-16LE, ignoring the case of the ASCII letters, and byte
+        patterns are searched as they are.
+        @param patterns: Strings and bytes.
+
+        @returns tuple: Automaton of the lower case text patterns, and of the
+            byte patterns (None if there isn't any).
+    """
+    text_patterns = list()
+    byte_patterns = list()
+
+    for pattern in patterns:
+        if not pattern:
+            raise ValueError("Empty search pattern.")
+
+        if isinstance(pattern, str):
+            for encoding in TEXT_ENCODINGS:
+                # Non ASCII text is searched as UTF-8 instead of ASCII.
+                codec = "utf-8" if encoding == "ascii" and not pattern.isascii() else encoding
+                text_patterns.append((pattern.encode(codec).lower(), (pattern, codec)))
+        else:
+            byte_patterns.append((bytes(pattern), (bytes(pattern).hex(), "bytes")))
+
+    return Automaton(text_patterns), Automaton(byte_patterns) if byte_patterns else None
+
+
+def iter_items(hive):
+    """
+        Walks every key of a hive and yields the stored bytes of its name,
+        of the name of its values and of their data, each one a single time.
+        The names are yielded as they're stored: ASCII or UTF-16LE.
+        @param hive: regf.Hive.
+
+        @returns generator: (key, location, value offset, data) tuples, location
+            is 'key_name', 'value_name' or 'value_data', and the value offset
+            is None on the key names.
+    """
+    keys = [hive.root]
+
+    while keys:
+        key = keys.pop()
+        yield key, "key_name", None, hive.key_name_data(key.offset)[0]
+
+        for offset in hive.iter_value_offsets(key):
+            yield key, "value_name", offset, hive.value_name_data(offset)[0]
+            yield key, "value_data", offset, hive.value_data(offset)[0]
+
+        if key.num_subkeys:
+            for offset in hive.iter_subkey_offsets(key.subkeys_offset):
+                sub_key = regf.KeyNode(hive, offset, "")
+                sub_key.path = "{0}\\{1}".format(key.path, sub_key.name) if key.path else sub_key.name
+                keys.append(sub_key)
+
+
+def search_hive(path, patterns, automata=None):
+    """
+        Searches many patterns on the key names, value names and value data
+        of a hive file, in a single pass over its cells.
+        @param path: Path to the hive file.
+        @param patterns: Strings and bytes, see build_automata.
+        @param automata: Automata returned by build_automata, to search several hives.
+
+        @returns generator: SearchHit records, the key names and values are
+            yielded in the order they're walked. The offsets are into the
+            stored bytes of the names and data.
+    """
+    text_automaton, bytes_automaton = automata or build_automata(patterns)
+
+    with regf.Hive(path) as hive:
+        for key, location, value_offset, data in iter_items(hive):
+            found = list(text_automaton.search(bytes(data).lower()))
+            if bytes_automaton is not None:
+                found.extend(bytes_automaton.search(data))
+
+            if not found:
+                continue
+
+            # The value names are only decoded for the hits.
+            value_name = hive.value_name(value_offset) if value_offset is not None else None
+
+            for offset, (pattern, encoding) in found:
+                yield records.SearchHit(pattern, encoding, path, key.path,
+                                        value_name, location, offset, key.last_written)
+
+
+def search_hives(paths, patterns):
+    """
+        Searches many patterns on several hive files, see search_hive.
+        @param paths: Paths to the hive files.
+        @param patterns: Strings and bytes.
+    """
+    automata = build_automata(patterns)
+
+    for path in paths:
+        yield from search_hive(path, patterns, automata)
+
+
+def read_patterns(path):
+    """
+        Reads a patterns file: a pattern per line, 'hex:' prefixes a byte
+        pattern. The empty lines and the lines starting with '#' are skipped.
+    """
+    patterns = list()
+
+    with open(path, encoding="utf-8") as patterns_file:
+        for line in patterns_file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                patterns.append(bytes.fromhex(line[4:]) if line.lower().startswith("hex:") else line)
+
+    return patterns
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to search many patterns on every key and value of some hives.")
+    parser.add_argument("hives", action="store", nargs="+", help="Hive files to search.")
+    parser.add_argument("-p", dest="patterns", action="append", default=list(),
+                        help="Text pattern, searched as ASCII and UTF-16LE without case. Can be repeated.")
+    parser.add_argument("-x", dest="hex_patterns", action="append", default=list(),
+                        help="Hexadecimal byte pattern. Can be repeated.")
+    parser.add_argument("-f", dest="patterns_file", action="store", default=None,
+                        help="File with a pattern per line, 'hex:' prefixes the byte patterns.")
+    parser.add_argument("--format", dest="format", action="store", choices=output.FORMATS, default=None,
+                        help="Write the hits in a machine readable format.")
+    parser.add_argument("-o", dest="output", action="store", default=None,
+                        help="Output file of the hits, the standard output by default.")
+
+    args = parser.parse_args()
+
+    search_patterns = args.patterns + [bytes.fromhex(pattern) for pattern in args.hex_patterns]
+    if args.patterns_file is not None:
+        search_patterns.extend(read_patterns(args.patterns_file))
+
+    if not search_patterns:
+        parser.error("No search patterns.")
+
+    hits = search_hives(args.hives, search_patterns)
+
+    if args.format is not None:
+        output.write_records(hits, args.format, args.output)
+
+    else:
+        for hit in hits:
+            print("[+] '{0}' ({1}) on {2}\\{3}".format(hit.pattern, hit.encoding, hit.hive, hit.key_path))
+            if hit.value_name is not None:
+                print("\t[-] Value: '{0}'".format(hit.value_name))
+            print("\t[-] Found on the {0} at offset {1}, key last written {2}\n".format(
+                hit.location.replace("_", " "), hit.offset, utils.get_iso_time(hit.last_written)))
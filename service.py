@@ -0,0 +1,304 @@
+import argparse
+import batch
+import collections
+import concurrent.futures
+import http.server
+import incremental
+import io
+import json
+import networkList
+import os
+import output
+import query
+import records
+import regf
+import registry
+import socketserver
+import sys
+import threading
+import urllib.parse
+import usbAttached
+import userLastPID
+import usersMRUList
+import utils
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+# Query results kept by the cache.
+DEFAULT_CACHE_SIZE = 256
+
+DEFAULT_PORT = 8731
+
+CONTENT_TYPES = {"jsonl": "application/x-ndjson", "csv": "text/csv", "columnar": "application/octet-stream"}
+
+# Record type, keys read (the user ones are formatted with the user sid) and
+# collector of each artifact.
+ARTIFACTS = {
+    "networks": (records.Network, networkList.KEY_PATHS,
+                 lambda user_sid, fields, where: networkList.network_list(fields, where)),
+    "usb": (records.UsbDevice, usbAttached.KEY_PATHS,
+            lambda user_sid, fields, where: usbAttached.prev_attached_usb(fields, where)),
+    "mru": (records.RecentDoc, usersMRUList.KEY_PATHS + utils.USER_KEY_PATHS, usersMRUList.recent_docs_records),
+    "lastpid": (records.LastProcess, userLastPID.KEY_PATHS + utils.USER_KEY_PATHS, userLastPID.last_pid_records),
+}
+
+
+class QueryError(Exception):
+    """ A query that can't be answered, with its HTTP status. """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def hive_identity():
+    """
+        Returns the identity of the registry in use: the path, sequence
+        number and last write time of every loaded hive, or 'live'.
+    """
+    backend = registry.get_backend()
+    if not isinstance(backend, regf.OfflineRegistry):
+        return "live"
+
+    return tuple(sorted((root.handle, name.upper(), hive.path, hive.primary_sequence, hive.last_written)
+                        for root in backend.roots.values() for name, hive in root.hives.values()))
+
+
+class Service:
+    """
+        Answers the collector queries of a registry that stays open. The
+        results are cached, keyed by the query and validated by the hive
+        identity and, on the live registry, by the last write time of the
+        keys read by the collector, so a repeated query doesn't extract the
+        records again.
+    """
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        """
+            @param cache_size: Query results kept by the cache.
+        """
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def user_sid(self, user):
+        """ Returns the sid of a user name or sid. """
+        if user.upper().startswith("S-1-"):
+            return user
+
+        try:
+            user_sid = utils.user2sid(user)
+        except FileNotFoundError:
+            user_sid = None
+
+        if user_sid is None:
+            raise QueryError(404, "Unknown user: {0}".format(user))
+
+        return user_sid
+
+    def query(self, path, parameters):
+        """
+            Returns the records of a query.
+            @param path: 'networks', 'usb', 'mru/<user>' or 'lastpid/<user>'.
+            @param parameters: Dict of lists of query parameters: 'fields', 'where' and 'format'.
+
+            @returns tuple: Content type, body and whether it was cached.
+        """
+        artifact, _, user = path.strip("/").partition("/")
+        if artifact not in ARTIFACTS or bool(user) != (artifact in ("mru", "lastpid")):
+            raise QueryError(404, "Unknown query: {0}".format(path))
+
+        record_type, key_paths, collector = ARTIFACTS[artifact]
+        user_sid = self.user_sid(urllib.parse.unquote(user)) if user else None
+        output_format = parameters.get("format", ["jsonl"])[-1]
+
+        if output_format not in CONTENT_TYPES:
+            raise QueryError(400, "Unknown format: {0}".format(output_format))
+
+        try:
+            fields = query.parse_fields(",".join(parameters.get("fields", list())))
+            where = query.parse_where(parameters.get("where"))
+            query.Query(record_type, fields, where)
+        except ValueError as e:
+            raise QueryError(400, str(e))
+
+        cache_key = (artifact, user_sid, tuple(fields or ()), tuple(sorted(parameters.get("where", list()))),
+                     output_format)
+        # The loaded hive files don't change, only the live registry keys have to be checked.
+        validator = hive_identity()
+        if validator == "live":
+            validator = (validator, incremental.paths_times(key_paths, user_sid))
+
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None and cached[0] == validator:
+                self._cache.move_to_end(cache_key)
+                self.hits += 1
+                return CONTENT_TYPES[output_format], cached[1], True
+            self.misses += 1
+
+        body = self._extract(collector, user_sid, fields, where, output_format)
+
+        with self._lock:
+            self._cache[cache_key] = (validator, body)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return CONTENT_TYPES[output_format], body, False
+
+    @staticmethod
+    def _extract(collector, user_sid, fields, where, output_format):
+        """ Runs a collector and returns its records, written in some format. """
+        stream = io.BytesIO() if output_format == "columnar" else io.StringIO()
+
+        try:
+            writer = output.get_writer(output_format, stream)
+            for record in collector(user_sid, fields, where):
+                writer.write(record)
+            writer.close()
+
+        # Collectors exit when they can't read a key.
+        except (FileNotFoundError, SystemExit) as e:
+            raise QueryError(404, "{0}: {1}".format(type(e).__name__, e))
+
+        # Any other error of a collector, or of its writer, is the server's.
+        except Exception as e:
+            raise QueryError(500, "{0}: {1}".format(type(e).__name__, e))
+
+        body = stream.getvalue()
+        return body if output_format == "columnar" else body.encode("utf-8")
+
+    def stats(self):
+        """ Returns the cache counters. """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """ HTTP requests of a Service: GET /networks?fields=name&where=name=Home """
+
+    service = None
+    verbose = False
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+
+        if url.path.strip("/") == "stats":
+            self._send(200, "application/json", json.dumps(self.service.stats()).encode("utf-8"))
+            return
+
+        try:
+            content_type, body, cached = self.service.query(url.path, urllib.parse.parse_qs(url.query))
+        except QueryError as e:
+            if e.status >= 500:
+                self._send(e.status, "application/json", json.dumps({"error": str(e)}).encode("utf-8"))
+            else:
+                self._send(e.status, "text/plain", str(e).encode("utf-8"))
+            return
+
+        self._send(200, content_type, body, {"X-Cache": "hit" if cached else "miss"})
+
+    def _send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or dict()).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # The clients of a Unix socket don't have an address.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+class _PoolMixIn:
+    """ Serves each request on a worker of a thread pool. """
+
+    pool = None
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class PoolHTTPServer(_PoolMixIn, http.server.HTTPServer):
+    pass
+
+
+class PoolUnixServer(_PoolMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+def make_server(service, address, workers=None, verbose=False):
+    """
+        Returns a server of the Service queries.
+        @param service: Service.
+        @param address: (host, port) tuple, or path of a Unix socket.
+        @param workers: Threads that serve the requests.
+        @param verbose: Log every request.
+    """
+    handler = type("Handler", (RequestHandler,), {"service": service, "verbose": verbose})
+
+    if isinstance(address, str):
+        if os.path.exists(address):
+            os.unlink(address)
+        server = PoolUnixServer(address, handler)
+    else:
+        server = PoolHTTPServer(address, handler)
+
+    server.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to serve the collector queries over HTTP.")
+    parser.add_argument("--hives", dest="hives", action="store", default=None,
+                        help="Directory with the hives collected from a host, the live registry by default.")
+    parser.add_argument("--host", dest="host", action="store", default="127.0.0.1", help="Listening address.")
+    parser.add_argument("-p", dest="port", action="store", type=int, default=DEFAULT_PORT, help="Listening port.")
+    parser.add_argument("--socket", dest="socket", action="store", default=None,
+                        help="Listen on a Unix socket instead of a TCP port.")
+    parser.add_argument("-j", dest="workers", action="store", type=int, default=None,
+                        help="Threads that serve the requests.")
+    parser.add_argument("--cache-size", dest="cache_size", action="store", type=int, default=DEFAULT_CACHE_SIZE,
+                        help="Query results kept by the cache.")
+    parser.add_argument("-v", dest="verbose", action="store_true", help="Log every request.")
+
+    args = parser.parse_args()
+
+    if args.hives is not None:
+        batch.load_host(batch.find_hives(args.hives))
+
+    listen_address = args.socket if args.socket is not None else (args.host, args.port)
+    http_server = make_server(Service(args.cache_size), listen_address, args.workers, args.verbose)
+
+    print("[*] Serving on {0}".format(listen_address), file=sys.stderr)
+
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        http_server.pool.shutdown()
+        if args.socket is not None:
+            os.unlink(args.socket)
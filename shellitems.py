@@ -0,0 +1,249 @@
+import collections
+import struct
+import utc
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+# Names of the shell folders found on the root folder shell items.
+KNOWN_FOLDERS = {
+    "20d04fe0-3aea-1069-a2d8-08002b30309d": "My Computer",
+    "59031a47-3f72-44a7-89c5-5595fe6b30ee": "Users Files",
+    "450d8fba-ad25-11d0-98a8-0800361b1103": "My Documents",
+    "208d2c60-3aea-1069-a2d7-08002b30309d": "My Network Places",
+    "f02c1a0d-be21-4350-88b0-7367fc96ef3c": "Network",
+    "645ff040-5081-101b-9f08-00aa002f954e": "Recycle Bin",
+    "031e4825-7b94-4dc3-b131-e946b44c8dd5": "Libraries",
+    "26ee0668-a00a-44d7-9371-beb064c98683": "Control Panel",
+    "b4bfcc3a-db2c-424c-b029-7fe99a87c641": "Desktop",
+    "374de290-123f-4565-9164-39c4925e467b": "Downloads",
+}
+
+ROOT_FOLDER = 0x1f
+VOLUME = 0x20
+FILE_ENTRY = 0x30
+FILE_ENTRY_UNICODE = 0x04
+FILE_ENTRY_EXTENSION = 0xbeef0004
+
+ShellItem = collections.namedtuple("ShellItem", ("class_type", "name", "file_size", "modified", "created",
+                                                 "accessed", "mft_reference", "extension_blocks"))
+ExtensionBlock = collections.namedtuple("ExtensionBlock", ("signature", "version", "offset", "size"))
+MruValue = collections.namedtuple("MruValue", ("name", "items", "path", "trailing_name"))
+
+_UINT16 = struct.Struct("<H")
+_FILE_ENTRY = struct.Struct("<BBIHHH")
+_EXTENSION_HEADER = struct.Struct("<HHI")
+_FAT_DATETIME = struct.Struct("<HH")
+
+
+def fat_to_filetime(date, time):
+    """
+        Converts a FAT date and time to a 64-bits Windows timestamp, or None.
+        @param date: FAT date.
+        @param time: FAT time.
+    """
+    year, month, day = 1980 + (date >> 9), (date >> 5) & 0x0f, date & 0x1f
+    hour, minute, second = time >> 11, (time >> 5) & 0x3f, (time & 0x1f) * 2
+
+    if date == 0 or not (1 <= month <= 12 and 1 <= day <= 31 and hour < 24 and minute < 60):
+        return None
+
+    seconds = ((utc.days_from_civil(year, month, day) * 24 + hour) * 60 + minute) * 60 + second
+    return seconds * 10000000 + utc.EPOCH_AS_FILETIME
+
+
+def _utf16_end(value, start, end):
+    """ Returns the offset of the UTF-16LE terminator between start and end. """
+    position = value.find(b"\x00\x00", start, end)
+    while position != -1 and (position - start) % 2:
+        position = value.find(b"\x00\x00", position + 1, end)
+
+    return position if position != -1 else end - (end - start) % 2
+
+
+def _utf16(value, view, start, end):
+    """
+        Decodes the null terminated UTF-16LE string found at some offset.
+        @returns tuple: The string and the offset after its terminator.
+    """
+    string_end = _utf16_end(value, start, end)
+    return str(view[start:string_end], "utf-16-le", "replace"), string_end + 2
+
+
+def _ascii(value, view, start, end):
+    """
+        Decodes the null terminated ASCII string found at some offset.
+        @returns tuple: The string and the offset after its terminator.
+    """
+    string_end = value.find(b"\x00", start, end)
+    string_end = end if string_end == -1 else string_end
+    return str(view[start:string_end], "latin-1"), string_end + 1
+
+
+def _file_entry_extension(value, view, start, end):
+    """
+        Parses a 0xbeef0004 extension block.
+        @returns tuple: Created and accessed timestamps, MFT reference and long name.
+    """
+    version = _UINT16.unpack_from(view, start + 2)[0]
+    created = fat_to_filetime(*_FAT_DATETIME.unpack_from(view, start + 8))
+    accessed = fat_to_filetime(*_FAT_DATETIME.unpack_from(view, start + 12))
+    mft_reference = None
+
+    name_offset = start + 18
+    if version >= 7 and start + 28 <= end:
+        mft_reference = struct.unpack_from("<Q", view, start + 20)[0]
+        name_offset += 18
+    if version >= 3:
+        name_offset += 2
+    if version >= 9:
+        name_offset += 4
+    if version >= 8:
+        name_offset += 4
+
+    long_name = None
+    if name_offset < end:
+        long_name = _utf16(value, view, name_offset, end)[0]
+
+    return created, accessed, mft_reference, long_name
+
+
+def _guid(view, start):
+    """ Returns the string version of a GUID. """
+    data1, data2, data3 = struct.unpack_from("<IHH", view, start)
+    data4 = bytes(view[start + 8:start + 16]).hex()
+    return "{0:08x}-{1:04x}-{2:04x}-{3}-{4}".format(data1, data2, data3, data4[:4], data4[4:])
+
+
+def parse_shell_item(value, view, start, end):
+    """
+        Parses a single shell item.
+        @param value: Bytes of the whole registry value.
+        @param view: Memoryview of the value.
+        @param start: Offset of the item data (after its size).
+        @param end: Offset of the end of the item.
+    """
+    class_type = view[start]
+    name = None
+    file_size = modified = created = accessed = mft_reference = None
+    extension_blocks = list()
+
+    if class_type == ROOT_FOLDER and end - start >= 18:
+        guid = _guid(view, start + 2)
+        name = KNOWN_FOLDERS.get(guid, "{" + guid + "}")
+
+    elif class_type & 0x70 == VOLUME and class_type & 0x01:
+        name = _ascii(value, view, start + 1, min(end, start + 21))[0]
+
+    elif class_type & 0x70 == FILE_ENTRY and end - start >= _FILE_ENTRY.size:
+        _, _, file_size, date, time, _ = _FILE_ENTRY.unpack_from(view, start)
+        modified = fat_to_filetime(date, time)
+
+        if class_type & FILE_ENTRY_UNICODE:
+            name, position = _utf16(value, view, start + _FILE_ENTRY.size, end)
+        else:
+            name, position = _ascii(value, view, start + _FILE_ENTRY.size, end)
+
+        # Extension blocks are 2-bytes aligned.
+        position += (position - start) % 2
+
+        while position + _EXTENSION_HEADER.size <= end:
+            size, version, signature = _EXTENSION_HEADER.unpack_from(view, position)
+            if size < _EXTENSION_HEADER.size or position + size > end:
+                break
+
+            extension_blocks.append(ExtensionBlock(signature, version, position, size))
+
+            if signature == FILE_ENTRY_EXTENSION and size >= 20:
+                created, accessed, mft_reference, long_name = \
+                    _file_entry_extension(value, view, position, position + size)
+                name = long_name or name
+
+            position += size
+
+    return ShellItem(class_type, name, file_size, modified, created, accessed, mft_reference, extension_blocks)
+
+
+def parse_id_list(value, view, start):
+    """
+        Parses a shell item ID list (PIDL).
+        @param value: Bytes of the whole registry value.
+        @param view: Memoryview of the value.
+        @param start: Offset of the first item.
+
+        @returns tuple: The shell items and the offset after the list terminator.
+    """
+    items = list()
+    position = start
+
+    while position + 2 <= len(value):
+        size = _UINT16.unpack_from(view, position)[0]
+
+        # An empty item ends the list.
+        if size == 0:
+            return items, position + 2
+
+        if size < 3 or position + size > len(value):
+            break
+
+        items.append(parse_shell_item(value, view, position + 2, position + size))
+        position += size
+
+    return items, len(value)
+
+
+def items_path(items):
+    """
+        Returns the path described by a list of shell items.
+        The root folders are only used when there isn't any volume.
+        @param items: Parsed shell items.
+    """
+    parts = list()
+
+    for item in items:
+        if item.name is None:
+            continue
+
+        if item.class_type & 0x70 == VOLUME:
+            parts = [item.name.rstrip("\\")]
+
+        elif item.class_type == ROOT_FOLDER and parts:
+            continue
+
+        else:
+            parts.append(item.name)
+
+    if len(parts) == 1 and parts[0].endswith(":"):
+        return parts[0] + "\\"
+
+    return "\\".join(parts)
+
+
+def parse_mru_value(value):
+    """
+        Parses a RecentDocs or LastVisitedPidlMRU value: an UTF-16LE name,
+        followed by a shell item ID list and, on RecentDocs, the name of the
+        shortcut. The value is read in a single pass, without copies.
+        @param value: Binary registry value.
+    """
+    if value is None:
+        return MruValue("", list(), "", None)
+
+    if isinstance(value, str):
+        return MruValue(value, list(), "", None)
+
+    if not isinstance(value, bytes):
+        value = bytes(value)
+
+    view = memoryview(value)
+    name, position = _utf16(value, view, 0, len(value))
+    items, position = parse_id_list(value, view, position)
+
+    trailing_name = None
+    if position + 2 <= len(value):
+        trailing_name = _utf16(value, view, position, len(value))[0] or None
+
+    return MruValue(name, items, items_path(items), trailing_name)
@@ -0,0 +1,212 @@
+import argparse
+import collections
+import json
+import networkList
+import output
+import records
+import regf
+import registry
+import sys
+import usbAttached
+import userLastPID
+import usersMRUList
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+# Mount point and collectors of each kind of hive.
+HIVES = {
+    "software": (registry.HKEY_LOCAL_MACHINE, "SOFTWARE", ("networks",)),
+    "system": (registry.HKEY_LOCAL_MACHINE, "SYSTEM", ("usb",)),
+    "ntuser": (registry.HKEY_USERS, None, ("mru", "lastpid")),
+}
+
+# Sid the NTUSER.DAT versions are mounted under, when it isn't given.
+DEFAULT_SID = "S-1-5-21-0-0-0-1000"
+
+# Records extracted from a version of a hive, and the pages they were read from.
+#   layout: Root offset, minor version and aliases of the hive.
+#   pages: Dict that maps the read pages to their digest.
+#   records: Dict that maps the JSON version of each record to the record.
+Extraction = collections.namedtuple("Extraction", ("layout", "pages", "records"))
+
+
+def get_collectors(kind, user_sid=DEFAULT_SID, software_loaded=False):
+    """
+        Returns the collectors that read a kind of hive: name and function
+        that returns their records, with every lazy field read.
+        @param kind: 'software', 'system' or 'ntuser'.
+        @param user_sid: Sid of the NTUSER.DAT hives.
+        @param software_loaded: A SOFTWARE hive is loaded next to the SYSTEM versions.
+    """
+    collectors = list()
+
+    if kind == "software":
+        collectors.append(("networks", lambda: [network.resolve() for network in networkList.network_list()]))
+
+    elif kind == "system":
+        # The device names are stored on the SOFTWARE hive.
+        fields = None if software_loaded else [name for name in records.UsbDevice._fields if name != "device_name"]
+        collectors.append(("usb", lambda: [device.resolve() for device in usbAttached.prev_attached_usb(fields)]))
+
+    else:
+        collectors.append(("mru", lambda: list(usersMRUList.recent_docs_records(user_sid))))
+        collectors.append(("lastpid", lambda: list(userLastPID.last_pid_records(user_sid))))
+
+    return collectors
+
+
+def record_data(record):
+    """ Returns the JSON version of a record, with its formatted fields. """
+    return json.dumps({name: output.format_field(value, field_type)
+                       for name, field_type, value in zip(record._fields, record.TYPES, record)},
+                      ensure_ascii=False, sort_keys=True)
+
+
+def hive_layout(hive):
+    """ Returns the base block fields and aliases that change the way a hive is read. """
+    return hive.root_offset, hive.minor_version, tuple(sorted(hive.aliases.items()))
+
+
+def is_unchanged(hive, extraction):
+    """
+        Returns whether the pages read by an extraction have the same contents
+        on another version of the hive, so its records are the same too.
+        @param hive: regf.Hive.
+        @param extraction: Extraction of a previous version.
+    """
+    if hive_layout(hive) != extraction.layout:
+        return False
+
+    return all(hive.page_digest(page) == digest for page, digest in extraction.pages.items())
+
+
+def extract(hive, collector, errors=None, error_name=None):
+    """
+        Runs a collector on a hive, and records the pages it reads.
+        @param hive: regf.Hive being read.
+        @param collector: Function that returns the records.
+        @param errors: Dict where the collector errors are stored.
+        @param error_name: Key of the errors dict.
+    """
+    hive.pages = set()
+
+    try:
+        found = collector()
+
+    # Collectors exit when they can't read a key.
+    except (Exception, SystemExit) as e:
+        found = list()
+        if errors is not None:
+            errors[error_name] = "{0}: {1}".format(type(e).__name__, e)
+
+    finally:
+        pages, hive.pages = hive.pages, None
+
+    return Extraction(hive_layout(hive), {page: hive.page_digest(page) for page in sorted(pages)},
+                      {record_data(record): record for record in found})
+
+
+def compare_snapshots(kind, paths, names=None, user_sid=DEFAULT_SID, software=None, system=None,
+                      stats=None, errors=None):
+    """
+        Runs the collectors of a kind of hive on several versions of it
+        (RegBack copies, shadow copies...), and yields where each record was
+        found. The pages read by each collector are hashed; when they are the
+        same on a later version, its records are reused instead of parsed.
+        @param kind: 'software', 'system' or 'ntuser'.
+        @param paths: Paths of the hive versions, from the oldest to the newest.
+        @param names: Names of the versions, their paths by default.
+        @param user_sid: Sid of the NTUSER.DAT hives.
+        @param software: SOFTWARE hive loaded next to the SYSTEM versions, for the device names.
+        @param system: SYSTEM hive loaded next to the other versions.
+        @param stats: Dict where the number of extracted and reused collector runs are stored.
+        @param errors: Dict where the collector errors of each version are stored.
+
+        @returns generator: RecordPresence records, in the order they were first found.
+    """
+    root, mount_name, _ = HIVES[kind]
+    names = list(names or paths)
+    stats = dict() if stats is None else stats
+    stats.update(extracted=0, reused=0)
+
+    offline = regf.OfflineRegistry()
+    previous_backend = registry.set_backend(offline)
+
+    try:
+        if software is not None and kind != "software":
+            offline.load(registry.HKEY_LOCAL_MACHINE, "SOFTWARE", software)
+        if system is not None and kind != "system":
+            offline.load(registry.HKEY_LOCAL_MACHINE, "SYSTEM", system)
+
+        collectors = get_collectors(kind, user_sid, software is not None)
+        extractions = {name: list() for name, _ in collectors}
+
+        # Versions of each record, by collector and record.
+        presence = dict()
+
+        for name, path in zip(names, paths):
+            # The index lookups don't read the cells of the parent keys, so they wouldn't be hashed.
+            hive = offline.load(root, mount_name or user_sid, path, index=False)
+
+            for collector_name, collector in collectors:
+                # The newest extractions are the most likely to match.
+                for extraction in reversed(extractions[collector_name]):
+                    if is_unchanged(hive, extraction):
+                        stats["reused"] += 1
+                        break
+                else:
+                    extraction = extract(hive, collector, errors, "{0} {1}".format(name, collector_name))
+                    extractions[collector_name].append(extraction)
+                    stats["extracted"] += 1
+
+                for data, record in extraction.records.items():
+                    presence.setdefault((collector_name, data), (record, list()))[1].append(name)
+
+    finally:
+        offline.close()
+        registry.set_backend(previous_backend)
+
+    for (collector_name, data), (record, versions) in presence.items():
+        yield records.RecordPresence(collector_name, type(record).__name__, versions[0], versions[-1], versions, data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to compare the artifacts of several versions of a hive.")
+    parser.add_argument("kind", action="store", choices=tuple(HIVES), help="Kind of the hive versions.")
+    parser.add_argument("paths", action="store", nargs="+", help="Hive versions, from the oldest to the newest.")
+    parser.add_argument("--software", dest="software", action="store", default=None,
+                        help="SOFTWARE hive loaded next to the SYSTEM versions, for the device names.")
+    parser.add_argument("--system", dest="system", action="store", default=None,
+                        help="SYSTEM hive loaded next to the other versions.")
+    parser.add_argument("--sid", dest="sid", action="store", default=DEFAULT_SID,
+                        help="Sid the NTUSER.DAT versions are mounted under.")
+    parser.add_argument("--format", dest="format", action="store", choices=output.FORMATS, default=None,
+                        help="Write the records in a machine readable format.")
+    parser.add_argument("-o", dest="output", action="store", default=None,
+                        help="Output file of the records, the standard output by default.")
+
+    args = parser.parse_args()
+    run_stats = dict()
+    run_errors = dict()
+
+    found_records = compare_snapshots(args.kind, args.paths, None, args.sid, args.software, args.system,
+                                      run_stats, run_errors)
+
+    if args.format is not None:
+        output.write_records(found_records, args.format, args.output)
+
+    else:
+        for presence in found_records:
+            print("[*] {0}: {1}".format(presence.record, presence.data))
+            print("\t[+] First seen: {0}\tLast seen: {1}\tVersions: {2}/{3}\n".format(
+                presence.first_seen, presence.last_seen, len(presence.versions), len(args.paths)))
+
+    for source, error in run_errors.items():
+        print("[!!] {0} failed: {1}".format(source, error), file=sys.stderr)
+
+    print("[*] Collector runs: {0} parsed, {1} reused".format(run_stats["extracted"], run_stats["reused"]),
+          file=sys.stderr)
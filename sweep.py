@@ -0,0 +1,637 @@
+import argparse
+import batch
+import collections
+import json
+import multiprocessing
+import os
+import output
+import queue
+import records
+import registry
+import socket
+import socketserver
+import statistics
+import sys
+import threading
+import time
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+ARTIFACTS = ("networks", "usb", "mru", "lastpid")
+
+DEFAULT_PORT = 8732
+
+# Records sent on each message of a worker.
+BATCH_SIZE = 256
+
+# A host running this many times longer than the median host is a straggler.
+DEFAULT_STRAGGLER_FACTOR = 3.0
+
+# Hosts finished before the stragglers are looked for.
+MIN_FINISHED = 3
+
+# Times a host is dispatched again after its worker disconnected.
+MAX_ATTEMPTS = 3
+
+# Seconds the hosts left wait for a worker once every worker disconnected.
+DEFAULT_ORPHAN_TIMEOUT = 60.0
+
+# Seconds an idle worker waits before asking again for work.
+_POLL_INTERVAL = 0.2
+
+
+def send_message(stream, message):
+    """
+        Writes a message to a connection: a JSON object per line.
+        @param stream: Binary file of the socket.
+        @param message: Dict with a 'type' key.
+    """
+    stream.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+def receive_message(stream):
+    """ Reads a message of a connection, None when it was closed. """
+    line = stream.readline()
+    return json.loads(line) if line else None
+
+
+def host_cost(hives):
+    """ Returns the size of the hive files of a host, used to balance the shards. """
+    paths = [hives["software"], hives["system"]] + list(hives["users"].values())
+    return sum(os.path.getsize(path) for path in paths if path is not None)
+
+
+def relative_hives(hives, root):
+    """ Returns the hives of find_hives, relative to the root of the hosts. """
+    def relative(path):
+        return None if path is None else os.path.relpath(path, root)
+
+    return {"software": relative(hives["software"]), "system": relative(hives["system"]),
+            "users": {profile_name: relative(path) for profile_name, path in hives["users"].items()}}
+
+
+def absolute_hives(hives, root):
+    """ Returns the hives of a task, on the root of the hosts seen by a worker. """
+    def absolute(path):
+        return None if path is None else os.path.join(root, path)
+
+    return {"software": absolute(hives["software"]), "system": absolute(hives["system"]),
+            "users": {profile_name: absolute(path) for profile_name, path in hives["users"].items()}}
+
+
+def host_collectors(users, artifacts=ARTIFACTS):
+    """
+        Returns the collectors run on a host: name and function that returns
+        its records.
+        @param users: Loaded user sids, returned by batch.load_host.
+        @param artifacts: Names of the collectors.
+    """
+    # The collectors are imported here, so the coordinator doesn't load them.
+    import networkList
+    import usbAttached
+    import userLastPID
+    import usersMRUList
+
+    collectors = list()
+
+    if "networks" in artifacts:
+        collectors.append(("networks", networkList.network_list))
+    if "usb" in artifacts:
+        collectors.append(("usb", usbAttached.prev_attached_usb))
+
+    for user_sid in users:
+        if "mru" in artifacts:
+            collectors.append(("mru " + user_sid, lambda user_sid=user_sid: usersMRUList.recent_docs_records(user_sid)))
+        if "lastpid" in artifacts:
+            collectors.append(("lastpid " + user_sid,
+                               lambda user_sid=user_sid: userLastPID.last_pid_records(user_sid)))
+
+    return collectors
+
+
+def sweep_host(host, hives, artifacts, stream):
+    """
+        Runs the collectors on a host and streams its records, in batches, and
+        its errors to the coordinator.
+        @param host: Host name.
+        @param hives: Hives returned by find_hives.
+        @param artifacts: Names of the collectors.
+        @param stream: Binary file of the coordinator socket.
+    """
+    import snapshots
+
+    try:
+        users = batch.load_host(hives)
+    except Exception as e:
+        send_message(stream, {"type": "error", "host": host, "source": "host",
+                              "error": "{0}: {1}".format(type(e).__name__, e)})
+        return
+
+    pending = list()
+
+    try:
+        with registry.cached():
+            for name, collector in host_collectors(users, artifacts):
+                try:
+                    for record in collector():
+                        pending.append([name.partition(" ")[0], type(record).__name__, snapshots.record_data(record)])
+
+                        if len(pending) >= BATCH_SIZE:
+                            send_message(stream, {"type": "records", "host": host, "records": pending})
+                            pending = list()
+
+                # Collectors exit when they can't read a key.
+                except (Exception, SystemExit) as e:
+                    send_message(stream, {"type": "error", "host": host, "source": name,
+                                          "error": "{0}: {1}".format(type(e).__name__, e)})
+
+    finally:
+        registry.get_backend().close()
+
+    if pending:
+        send_message(stream, {"type": "records", "host": host, "records": pending})
+
+
+def run_worker(address, node=None, root=None):
+    """
+        Runs the hosts dispatched by a coordinator until it's done.
+        @param address: (host, port) tuple of the coordinator.
+        @param node: Name of the worker node, the host name by default.
+        @param root: Root of the hosts on this node, the coordinator one by default.
+
+        @returns int: Number of hosts run.
+    """
+    hosts_run = 0
+
+    with socket.create_connection(address) as connection:
+        reader = connection.makefile("rb")
+        writer = connection.makefile("wb")
+
+        send_message(writer, {"type": "hello", "node": node or socket.gethostname(), "pid": os.getpid()})
+        writer.flush()
+
+        welcome = receive_message(reader)
+        root = root or welcome["root"]
+
+        while True:
+            message = receive_message(reader)
+            if message is None or message["type"] == "done":
+                break
+
+            start = time.perf_counter()
+            sweep_host(message["host"], absolute_hives(message["hives"], root), message["artifacts"], writer)
+
+            send_message(writer, {"type": "finished", "host": message["host"],
+                                  "seconds": time.perf_counter() - start})
+            writer.flush()
+            hosts_run += 1
+
+    return hosts_run
+
+
+class Coordinator:
+    """
+        Dispatches the hosts of a sweep to the worker nodes, and merges the
+        records they stream back.
+
+        The hosts are sharded across the nodes connected when the sweep
+        starts, balancing the size of their hives. Each worker takes the
+        largest hosts of its node first; when its node is out of work, it
+        steals a host from the node with the most work left, and when every
+        queue is empty, it runs a backup copy of a straggler. The records of
+        a host are merged once, from the first copy that finishes.
+    """
+
+    def __init__(self, hosts, root, artifacts=ARTIFACTS, min_workers=1,
+                 straggler_factor=DEFAULT_STRAGGLER_FACTOR, orphan_timeout=DEFAULT_ORPHAN_TIMEOUT):
+        """
+            @param hosts: (host name, hives) tuples returned by batch.find_hosts.
+            @param root: Root directory of the hosts.
+            @param artifacts: Names of the collectors.
+            @param min_workers: Workers connected before the hosts are sharded.
+            @param straggler_factor: Times longer than the median host a straggler runs.
+            @param orphan_timeout: Seconds the hosts left wait for a worker once every
+                worker disconnected, before they fail.
+        """
+        self.root = root
+        self.artifacts = tuple(artifacts)
+        self.min_workers = min_workers
+        self.straggler_factor = straggler_factor
+        self.orphan_timeout = orphan_timeout
+
+        self.hives = {host: relative_hives(hives, root) for host, hives in hosts}
+        self.costs = {host: host_cost(hives) for host, hives in hosts}
+
+        # Hosts waiting on each node, the largest ones first.
+        self.queues = collections.OrderedDict()
+        # Start time of each copy of the running hosts, by worker.
+        self.running = dict()
+        self.attempts = collections.Counter()
+        self.durations = dict()
+        self.failed = set()
+        self.errors = dict()
+        self.nodes = dict()
+
+        self.workers = 0
+        self.sharded = False
+        self.start = None
+        self.elapsed = None
+
+        # Merged records, and None when every host is finished.
+        self.results = queue.Queue()
+        self._condition = threading.Condition()
+        # Fails the hosts left when no worker joins again.
+        self._orphan_timer = None
+
+    def is_finished(self):
+        return len(self.durations) + len(self.failed) >= len(self.hives)
+
+    def _node(self, node):
+        """ Returns the counters of a node. """
+        return self.nodes.setdefault(node, {"workers": 0, "hosts": 0, "records": 0, "seconds": 0.0,
+                                            "stolen": 0, "backups": 0, "discarded": 0})
+
+    def join(self, node):
+        """ Adds a worker of a node, and shards the hosts once enough workers joined. """
+        with self._condition:
+            self.workers += 1
+            self._node(node)["workers"] += 1
+            self.queues.setdefault(node, collections.deque())
+
+            if self._orphan_timer is not None:
+                self._orphan_timer.cancel()
+                self._orphan_timer = None
+
+            if not self.sharded and self.workers >= self.min_workers:
+                self._shard()
+            self._condition.notify_all()
+
+    def _shard(self):
+        """ Splits the hosts across the nodes, the largest host to the node with the least work. """
+        loads = {node: 0 for node in self.queues}
+
+        for host in sorted(self.hives, key=lambda host: (-self.costs[host], host)):
+            node = min(loads, key=lambda node: (loads[node], node))
+            self.queues[node].append(host)
+            loads[node] += self.costs[host]
+
+        self.sharded = True
+        self.start = time.perf_counter()
+
+    def _steal(self, node):
+        """ Takes a host from the back of the node with the most work left. """
+        victims = [victim for victim, hosts in self.queues.items() if hosts]
+        if not victims:
+            return None
+
+        victim = max(victims, key=lambda victim: sum(self.costs[host] for host in self.queues[victim]))
+        self._node(node)["stolen"] += 1
+        return self.queues[victim].pop()
+
+    def _straggler(self, node):
+        """ Returns a running host that takes much longer than the median, to run a backup copy of it. """
+        if len(self.durations) < MIN_FINISHED:
+            return None
+
+        limit = self.straggler_factor * statistics.median(self.durations.values())
+        now = time.perf_counter()
+
+        for host, copies in self.running.items():
+            if len(copies) == 1 and now - min(copies.values()) > limit:
+                self._node(node)["backups"] += 1
+                return host
+
+        return None
+
+    def next_host(self, node, worker):
+        """
+            Returns the next host of a worker, waiting while the other
+            workers may still need help, or None when the sweep is done.
+            @param node: Node of the worker.
+            @param worker: Identifier of the worker.
+        """
+        with self._condition:
+            while True:
+                if self.sharded:
+                    own = self.queues.setdefault(node, collections.deque())
+                    host = own.popleft() if own else self._steal(node) or self._straggler(node)
+
+                    if host is not None:
+                        self.running.setdefault(host, dict())[worker] = time.perf_counter()
+                        self.attempts[host] += 1
+                        return host
+
+                    if self.is_finished():
+                        return None
+
+                self._condition.wait(_POLL_INTERVAL)
+
+    def finish(self, node, worker, host, found, errors):
+        """
+            Merges the records of a finished host, unless another copy of it finished first.
+            @param node: Node of the worker.
+            @param worker: Identifier of the worker.
+            @param host: Host name.
+            @param found: Records of the host, as HostRecord.
+            @param errors: Dict of the collector errors of the host.
+        """
+        with self._condition:
+            started = self.running.get(host, dict()).pop(worker, None)
+            counters = self._node(node)
+
+            if host in self.durations:
+                counters["discarded"] += 1
+            else:
+                self.durations[host] = time.perf_counter() - started
+                self.running.pop(host, None)
+
+                counters["hosts"] += 1
+                counters["records"] += len(found)
+                counters["seconds"] += self.durations[host]
+
+                for source, error in errors.items():
+                    self.errors["{0} {1}".format(host, source)] = error
+                for record in found:
+                    self.results.put(record)
+
+            self._check_finished()
+            self._condition.notify_all()
+
+    def leave(self, node, worker, host=None):
+        """
+            Removes a worker, and queues again the host it was running.
+            @param host: Host the worker didn't finish, if any.
+        """
+        with self._condition:
+            self.workers -= 1
+            self._node(node)["workers"] -= 1
+
+            if host is not None and host not in self.durations:
+                copies = self.running.get(host, dict())
+                copies.pop(worker, None)
+
+                if not copies:
+                    self.running.pop(host, None)
+                    if self.attempts[host] < MAX_ATTEMPTS:
+                        self.queues.setdefault(node, collections.deque()).appendleft(host)
+                    else:
+                        self.failed.add(host)
+                        self.errors["{0} host".format(host)] = "Its workers disconnected {0} times".format(
+                            self.attempts[host])
+
+            # Nobody would run the hosts left, and merged_records would wait for them forever.
+            if self.workers == 0 and self.sharded and not self.is_finished() and self._orphan_timer is None:
+                self._orphan_timer = threading.Timer(self.orphan_timeout, self._fail_orphans)
+                self._orphan_timer.daemon = True
+                self._orphan_timer.start()
+
+            self._check_finished()
+            self._condition.notify_all()
+
+    def _fail_orphans(self):
+        """ Fails the hosts left, when no worker joined since every worker disconnected. """
+        with self._condition:
+            if self.workers or self._orphan_timer is None:
+                return
+            self._orphan_timer = None
+
+            for hosts in self.queues.values():
+                while hosts:
+                    host = hosts.popleft()
+                    self.failed.add(host)
+                    self.errors["{0} host".format(host)] = "No worker connected for {0}s to run it".format(
+                        self.orphan_timeout)
+
+            self._check_finished()
+            self._condition.notify_all()
+
+    def _check_finished(self):
+        if self.elapsed is None and self.sharded and self.is_finished():
+            self.elapsed = time.perf_counter() - self.start
+            self.results.put(None)
+
+    def merged_records(self):
+        """ Yields the HostRecord records as the hosts finish, until the sweep is done. """
+        if self.hives:
+            yield from iter(self.results.get, None)
+
+    def report(self):
+        """
+            Returns the throughput of each node and the stragglers of the sweep.
+            @returns dict: elapsed, nodes (counters and hosts and records per second) and
+                stragglers (hosts and nodes much slower than the median).
+        """
+        with self._condition:
+            elapsed = self.elapsed
+            if elapsed is None:
+                elapsed = time.perf_counter() - self.start if self.start is not None else 0.0
+            median = statistics.median(self.durations.values()) if self.durations else 0.0
+            nodes = dict()
+
+            for node, counters in self.nodes.items():
+                nodes[node] = dict(counters, hosts_per_second=counters["hosts"] / elapsed if elapsed else 0.0,
+                                   records_per_second=counters["records"] / elapsed if elapsed else 0.0,
+                                   seconds_per_host=counters["seconds"] / counters["hosts"] if counters["hosts"]
+                                   else None)
+
+            slow_hosts = [(host, seconds) for host, seconds in sorted(self.durations.items(), key=lambda item: -item[1])
+                          if median and seconds > self.straggler_factor * median]
+            slow_nodes = [node for node, counters in nodes.items()
+                          if counters["seconds_per_host"] is not None and median
+                          and counters["seconds_per_host"] > self.straggler_factor * median]
+
+            return {"elapsed": elapsed, "median_host_seconds": median, "nodes": nodes,
+                    "straggler_hosts": slow_hosts, "straggler_nodes": slow_nodes}
+
+
+class WorkerHandler(socketserver.StreamRequestHandler):
+    """ Connection of a worker: dispatches its hosts and reads back their records. """
+
+    coordinator = None
+
+    def handle(self):
+        hello = receive_message(self.rfile)
+        if hello is None or hello.get("type") != "hello":
+            return
+
+        node = hello["node"]
+        worker = "{0}:{1}:{2}".format(node, hello.get("pid"), self.client_address[1])
+        coordinator = self.coordinator
+        host = None
+
+        send_message(self.wfile, {"type": "welcome", "root": coordinator.root})
+        coordinator.join(node)
+
+        try:
+            while True:
+                host = coordinator.next_host(node, worker)
+                if host is None:
+                    send_message(self.wfile, {"type": "done"})
+                    break
+
+                send_message(self.wfile, {"type": "task", "host": host, "hives": coordinator.hives[host],
+                                          "artifacts": coordinator.artifacts})
+                self.wfile.flush()
+
+                found, errors = self._read_host(host)
+                coordinator.finish(node, worker, host, found, errors)
+                host = None
+
+        except (OSError, ValueError):
+            pass
+
+        finally:
+            coordinator.leave(node, worker, host)
+
+    def _read_host(self, host):
+        """ Reads the records and errors of a host until it's finished. """
+        found = list()
+        errors = dict()
+
+        while True:
+            message = receive_message(self.rfile)
+            if message is None:
+                raise ConnectionResetError("The worker disconnected while running {0}".format(host))
+
+            if message["type"] == "records":
+                found.extend(records.HostRecord(host, *fields) for fields in message["records"])
+            elif message["type"] == "error":
+                errors[message["source"]] = message["error"]
+            elif message["type"] == "finished":
+                return found, errors
+
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_server(coordinator, address):
+    """
+        Returns the server the workers connect to.
+        @param coordinator: Coordinator.
+        @param address: (host, port) tuple, port 0 picks a free one.
+    """
+    handler = type("Handler", (WorkerHandler,), {"coordinator": coordinator})
+    return CoordinatorServer(address, handler)
+
+
+def sweep(coordinator, address, local_workers=0):
+    """
+        Serves the workers of a sweep, and yields the merged records as the
+        hosts finish.
+        @param coordinator: Coordinator of the sweep.
+        @param address: (host, port) tuple the workers connect to, port 0 picks a free one.
+        @param local_workers: Worker processes started on this machine, each one as its own node.
+
+        @returns generator: HostRecord records.
+    """
+    server = make_server(coordinator, address)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    processes = [multiprocessing.Process(target=run_worker, args=(server.server_address, "local-{0}".format(inx)))
+                 for inx in range(local_workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        yield from coordinator.merged_records()
+
+    finally:
+        server.shutdown()
+        server.server_close()
+        for process in processes:
+            process.join()
+
+
+def print_report(report, errors):
+    """ Prints the per node throughput, the stragglers and the errors of a sweep. """
+    print("[*] Sweep finished in {0:.3f}s, median host {1:.3f}s".format(report["elapsed"],
+                                                                       report["median_host_seconds"]),
+          file=sys.stderr)
+
+    for node, counters in sorted(report["nodes"].items()):
+        print("\t[+] {0}: {1} hosts ({2:.2f}/s), {3} records ({4:.0f}/s), {5} stolen, {6} backups".format(
+            node, counters["hosts"], counters["hosts_per_second"], counters["records"],
+            counters["records_per_second"], counters["stolen"], counters["backups"]), file=sys.stderr)
+
+    for host, seconds in report["straggler_hosts"]:
+        print("[!!] Straggler host: {0} ({1:.3f}s)".format(host, seconds), file=sys.stderr)
+    for node in report["straggler_nodes"]:
+        print("[!!] Straggler node: {0}".format(node), file=sys.stderr)
+
+    for source, error in errors.items():
+        print("[!!] {0} failed: {1}".format(source, error), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to sweep many host collections with several worker nodes.")
+    modes = parser.add_subparsers(dest="mode", metavar="mode")
+    modes.required = True
+
+    coordinator_parser = modes.add_parser("coordinator", help="Dispatch the hosts and merge their records.")
+    coordinator_parser.add_argument("root", action="store", help="Directory with a sub directory of hives per host.")
+    coordinator_parser.add_argument("--host", dest="host", action="store", default="127.0.0.1",
+                                    help="Listening address.")
+    coordinator_parser.add_argument("-p", dest="port", action="store", type=int, default=DEFAULT_PORT,
+                                    help="Listening port.")
+    coordinator_parser.add_argument("-w", dest="workers", action="store", type=int, default=1,
+                                    help="Workers connected before the hosts are sharded.")
+    coordinator_parser.add_argument("-l", dest="local", action="store", type=int, default=0,
+                                    help="Worker processes started on this machine, each one as its own node.")
+    coordinator_parser.add_argument("-a", dest="artifacts", action="store", nargs="+", choices=ARTIFACTS,
+                                    default=ARTIFACTS, help="Collectors to run, all of them by default.")
+    coordinator_parser.add_argument("--straggler-factor", dest="straggler_factor", action="store", type=float,
+                                    default=DEFAULT_STRAGGLER_FACTOR,
+                                    help="Times longer than the median host a straggler runs.")
+    coordinator_parser.add_argument("--orphan-timeout", dest="orphan_timeout", action="store", type=float,
+                                    default=DEFAULT_ORPHAN_TIMEOUT,
+                                    help="Seconds the hosts left wait for a worker once every worker disconnected.")
+    coordinator_parser.add_argument("--report", dest="report", action="store", default=None,
+                                    help="JSON file where the node throughput and the stragglers are written.")
+    coordinator_parser.add_argument("--format", dest="format", action="store", choices=output.FORMATS,
+                                    default="jsonl", help="Format of the merged records.")
+    coordinator_parser.add_argument("-o", dest="output", action="store", default=None,
+                                    help="Output file of the merged records, the standard output by default.")
+
+    worker_parser = modes.add_parser("worker", help="Run the hosts dispatched by a coordinator.")
+    worker_parser.add_argument("coordinator", action="store", help="Address of the coordinator, host:port.")
+    worker_parser.add_argument("-j", dest="jobs", action="store", type=int, default=1,
+                               help="Worker processes of this node.")
+    worker_parser.add_argument("-n", dest="node", action="store", default=None,
+                               help="Name of this node, the host name by default.")
+    worker_parser.add_argument("--root", dest="root", action="store", default=None,
+                               help="Where the host collections are mounted on this node, "
+                                    "the coordinator root by default.")
+
+    args = parser.parse_args()
+
+    if args.mode == "worker":
+        coordinator_host, _, coordinator_port = args.coordinator.rpartition(":")
+        worker_args = ((coordinator_host, int(coordinator_port)), args.node, args.root)
+        workers = [multiprocessing.Process(target=run_worker, args=worker_args) for _ in range(args.jobs)]
+
+        for worker_process in workers:
+            worker_process.start()
+        for worker_process in workers:
+            worker_process.join()
+
+        sys.exit(0)
+
+    sweep_coordinator = Coordinator(batch.find_hosts(args.root), args.root, args.artifacts,
+                                    max(args.workers, args.local), args.straggler_factor, args.orphan_timeout)
+
+    print("[*] Sweeping {0} hosts on {1}:{2}, waiting for {3} workers".format(
+        len(sweep_coordinator.hives), args.host, args.port, sweep_coordinator.min_workers), file=sys.stderr)
+    output.write_records(sweep(sweep_coordinator, (args.host, args.port), args.local), args.format, args.output)
+
+    sweep_report = sweep_coordinator.report()
+    print_report(sweep_report, sweep_coordinator.errors)
+
+    if args.report is not None:
+        with open(args.report, "w", encoding="utf-8") as report_file:
+            json.dump(sweep_report, report_file, indent=4)
@@ -0,0 +1,34 @@
+import unittest
+
+import query
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+class ParseWhereTest(unittest.TestCase):
+
+    def test_range_bounds(self):
+        where = query.parse_where(["last_written>=2021-01-01", "last_written<2022-01-01"])
+        self.assertEqual((where["last_written"].after, where["last_written"].before), ("2021-01-01", "2022-01-01"))
+
+    def test_first_operator_splits(self):
+        self.assertEqual(query.parse_where(["name=a<b"]), {"name": "a<b"})
+
+    def test_equal_then_range(self):
+        with self.assertRaises(ValueError):
+            query.parse_where(["name=a", "name>=b"])
+
+    def test_range_then_equal(self):
+        with self.assertRaises(ValueError):
+            query.parse_where(["name<b", "name=a,c"])
+
+    def test_invalid_condition(self):
+        with self.assertRaises(ValueError):
+            query.parse_where(["name"])
+
+
+if __name__ == "__main__":
+    unittest.main()
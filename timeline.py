@@ -0,0 +1,318 @@
+import argparse
+import batch
+import concurrent.futures
+import heapq
+import json
+import networkList
+import os
+import output
+import platform
+import query
+import records
+import registry
+import sys
+import tempfile
+import usbAttached
+import userLastPID
+import usersMRUList
+import utc
+import utils
+
+
+__author__ = "pacmanator"
+__email__ = "mrpacmanator at gmail dot com"
+__version__ = "v1.0"
+
+
+ARTIFACTS = ("networks", "usb", "mru", "lastpid")
+
+# Run files read at the same time by a merge, so the open files don't grow with the number of runs.
+MERGE_FAN_IN = 64
+
+# Only the most recent entry of a MRU list was written at the key last write time.
+_MOST_RECENT = query.Range(None, 1)
+
+
+def event_key(event):
+    """ Sort key of the timeline events. """
+    return event.timestamp, event.host, event.user or "", event.artifact, event.detail or ""
+
+
+def network_events(host):
+    """
+        Yields the first and last connection of each network.
+        @param host: Host name of the events.
+    """
+    for network in networkList.network_list():
+        detail = "{0} ({1})".format(network.name, network.mac_address)
+
+        if network.first_connected is not None:
+            yield records.TimelineEvent(utc.get_filetime(network.first_connected), host, None,
+                                        "network.first_connected", detail)
+        if network.last_connected is not None:
+            yield records.TimelineEvent(utc.get_filetime(network.last_connected), host, None,
+                                        "network.last_connected", detail)
+
+
+def usb_events(host):
+    """
+        Yields the first time each USB storage device was attached.
+        @param host: Host name of the events.
+    """
+    fields = ("first_attached", "friendly_name", "device_name", "disk_id")
+
+    for device in usbAttached.prev_attached_usb(fields):
+        if device.first_attached is not None:
+            yield records.TimelineEvent(device.first_attached, host, None, "usb.first_attached",
+                                        "{0} ({1}, disk {2})".format(device.friendly_name, device.device_name,
+                                                                     device.disk_id))
+
+
+def recent_doc_events(host, user_sid, user_name):
+    """
+        Yields the most recent file opened of each extension.
+        @param host: Host name of the events.
+        @param user_sid: User sid.
+        @param user_name: User name of the events.
+    """
+    for doc in usersMRUList.recent_docs_records(user_sid, ("filename", "last_accessed"), {"position": _MOST_RECENT}):
+        yield records.TimelineEvent(doc.last_accessed, host, user_name, "mru.last_accessed",
+                                    "{0} ({1})".format(doc.filename, doc.extension))
+
+
+def last_pid_events(host, user_sid, user_name):
+    """
+        Yields the most recent process of the LastVisitedPidlMRU list.
+        @param host: Host name of the events.
+        @param user_sid: User sid.
+        @param user_name: User name of the events.
+    """
+    for process in userLastPID.last_pid_records(user_sid, ("process_name", "folder", "last_written"),
+                                                {"position": _MOST_RECENT}):
+        yield records.TimelineEvent(process.last_written, host, user_name, "lastpid.last_written",
+                                    "{0}: {1}".format(process.process_name, process.folder))
+
+
+def host_runs(host, users=None, artifacts=ARTIFACTS, errors=None):
+    """
+        Yields the events of the loaded registry, as a sorted list per
+        artifact and user. Each list is read when the previous one was
+        consumed.
+        @param host: Host name of the events.
+        @param users: Dict that maps the user sids to their names, the users of the registry by default.
+        @param artifacts: Names of the collectors.
+        @param errors: Dict where the errors of each collector are stored, None to raise them.
+    """
+    sources = list()
+
+    if "networks" in artifacts:
+        sources.append(("networks", network_events, (host,)))
+    if "usb" in artifacts:
+        sources.append(("usb", usb_events, (host,)))
+
+    if "mru" in artifacts or "lastpid" in artifacts:
+        if users is None:
+            users = {user_sid: utils.get_system_user_name(user_sid) or user_sid for user_sid in utils.users_list()}
+
+        for user_sid, user_name in users.items():
+            if "mru" in artifacts:
+                sources.append(("mru " + user_sid, recent_doc_events, (host, user_sid, user_name)))
+            if "lastpid" in artifacts:
+                sources.append(("lastpid " + user_sid, last_pid_events, (host, user_sid, user_name)))
+
+    for name, source, args in sources:
+        try:
+            events = sorted(source(*args), key=event_key)
+
+        # Collectors exit when they can't read a key.
+        except (Exception, SystemExit) as e:
+            if errors is None:
+                raise
+            errors["{0} {1}".format(host, name)] = "{0}: {1}".format(type(e).__name__, e)
+            continue
+
+        yield events
+
+
+def write_run(events, path):
+    """ Writes a sorted run of events to a file, a JSON list per line. """
+    with open(path, "w", encoding="utf-8") as run_file:
+        for event in events:
+            run_file.write(json.dumps(list(event), ensure_ascii=False))
+            run_file.write("\n")
+
+
+def read_run(path):
+    """ Yields the events of a run file. """
+    with open(path, encoding="utf-8") as run_file:
+        for line in run_file:
+            yield records.TimelineEvent(*json.loads(line))
+
+
+def spill_runs(host, directory, users=None, artifacts=ARTIFACTS, errors=None):
+    """
+        Writes the sorted runs of the loaded registry to files, a single run
+        is kept in memory at a time.
+        @param host: Host name of the events.
+        @param directory: Directory of the run files.
+        @param users: Dict that maps the user sids to their names, the users of the registry by default.
+        @param artifacts: Names of the collectors.
+        @param errors: Dict where the errors of each collector are stored, None to raise them.
+
+        @returns list: The run file paths.
+    """
+    paths = list()
+
+    for inx, events in enumerate(host_runs(host, users, artifacts, errors)):
+        if events:
+            paths.append(os.path.join(directory, "{0}.{1}.run".format(host, inx)))
+            write_run(events, paths[-1])
+
+    return paths
+
+
+def _spill_host(host, hives, artifacts, directory):
+    """
+        Writes the sorted runs of a host collection to files.
+        @returns tuple: The run file paths and the collector errors.
+    """
+    errors = dict()
+
+    try:
+        users = batch.load_host(hives)
+    except Exception as e:
+        errors[host] = "{0}: {1}".format(type(e).__name__, e)
+        return list(), errors
+
+    try:
+        with registry.cached():
+            paths = spill_runs(host, directory, users, artifacts, errors)
+    finally:
+        registry.get_backend().close()
+
+    return paths, errors
+
+
+def merge(runs):
+    """
+        Merges some sorted runs of events into a single sorted stream, only
+        the head of each run is kept in memory.
+        @param runs: Iterables of events, each one sorted by event_key.
+    """
+    return heapq.merge(*runs, key=event_key)
+
+
+def merge_runs(paths, directory, fan_in=MERGE_FAN_IN):
+    """
+        Merges groups of run files into larger runs until at most fan_in of
+        them are left, so they can be merged with a bounded number of open files.
+        @param paths: Paths of the run files, removed once they're merged.
+        @param directory: Directory of the merged run files.
+        @param fan_in: Run files merged at the same time.
+
+        @returns list: Paths of the runs left.
+    """
+    paths = list(paths)
+    level = 0
+
+    while len(paths) > fan_in:
+        merged = list()
+
+        for start in range(0, len(paths), fan_in):
+            group = paths[start:start + fan_in]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+
+            merged.append(os.path.join(directory, "merge.{0}.{1}.run".format(level, start // fan_in)))
+            write_run(merge([read_run(path) for path in group]), merged[-1])
+
+            for path in group:
+                os.remove(path)
+
+        paths = merged
+        level += 1
+
+    return paths
+
+
+def timeline(artifacts=ARTIFACTS, host=None):
+    """
+        Yields the events of the loaded registry, sorted by time. The sorted
+        runs are written to temporary files and merged while they're read,
+        as hosts_timeline does.
+        @param artifacts: Names of the collectors.
+        @param host: Host name of the events, the name of this machine by default.
+    """
+    with tempfile.TemporaryDirectory(prefix="timeline") as directory:
+        with registry.cached():
+            paths = spill_runs(host or platform.node(), directory, artifacts=artifacts)
+
+        yield from merge([read_run(path) for path in merge_runs(paths, directory)])
+
+
+def hosts_timeline(root, artifacts=ARTIFACTS, jobs=None, errors=None):
+    """
+        Yields the events of every host collection of a directory tree, sorted
+        by time. Each host is read by a worker process, which writes its
+        sorted runs to temporary files; the runs are merged while they're
+        read, at most MERGE_FAN_IN files at a time, so neither the memory nor
+        the open files grow with the number of hosts.
+        @param root: Directory tree of per-host hive collections.
+        @param artifacts: Names of the collectors.
+        @param jobs: Number of worker processes, the number of CPUs by default.
+        @param errors: Dict where the errors of each host and collector are stored.
+    """
+    errors = dict() if errors is None else errors
+
+    with tempfile.TemporaryDirectory(prefix="timeline") as directory:
+        paths = list()
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [(host, pool.submit(_spill_host, host, hives, artifacts, directory))
+                       for host, hives in batch.find_hosts(root)]
+
+            for host, future in futures:
+                try:
+                    host_paths, host_errors = future.result()
+                    paths.extend(host_paths)
+                    errors.update(host_errors)
+
+                # The worker process died.
+                except Exception as e:
+                    errors[host] = "{0}: {1}".format(type(e).__name__, e)
+
+        yield from merge([read_run(path) for path in merge_runs(paths, directory)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to print a timeline of every artifact, sorted by time.")
+    parser.add_argument("root", action="store", nargs="?", default=None,
+                        help="Directory with a sub directory of collected hives per host, the live registry by default.")
+    parser.add_argument("-a", dest="artifacts", action="store", nargs="+", choices=ARTIFACTS, default=ARTIFACTS,
+                        help="Collectors to run, all of them by default.")
+    parser.add_argument("-j", dest="jobs", action="store", type=int, default=None,
+                        help="Number of worker processes, the number of CPUs by default.")
+    parser.add_argument("--format", dest="format", action="store", choices=output.FORMATS, default=None,
+                        help="Write the events in a machine readable format.")
+    parser.add_argument("-o", dest="output", action="store", default=None,
+                        help="Output file of the events, the standard output by default.")
+
+    args = parser.parse_args()
+    timeline_errors = dict()
+
+    if args.root is None:
+        events = timeline(tuple(args.artifacts))
+    else:
+        events = hosts_timeline(args.root, tuple(args.artifacts), args.jobs, timeline_errors)
+
+    if args.format is not None:
+        output.write_records(events, args.format, args.output)
+
+    else:
+        for event in events:
+            print("{0}\t{1}\t{2}\t{3}\t{4}".format(utils.get_iso_time(event.timestamp), event.host,
+                                                   event.user or "-", event.artifact, event.detail))
+
+    for source, error in timeline_errors.items():
+        print("[!!] {0} failed: {1}".format(source, error), file=sys.stderr)
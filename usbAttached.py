@@ -1,5 +1,10 @@
+import argparse
+import output
+import query
+import records
+import registry as reg
+import sys
 import utils
-import winreg as reg
 
 
 __author__ = "pacmanator"
@@ -7,6 +12,14 @@ __email__ = "mrpacmanator at gmail dot com"
 __version__ = "v1.0"
 
 
+# Keys read by the collector: (root key, path, levels of subkeys).
+KEY_PATHS = [(reg.HKEY_LOCAL_MACHINE, "SYSTEM\\CurrentControlSet\\Enum\\USBSTOR", 2),
+             (reg.HKEY_LOCAL_MACHINE, "SYSTEM\\CurrentControlSet\\Enum\\STORAGE\\Volume", 1),
+             (reg.HKEY_LOCAL_MACHINE, "SYSTEM\\CurrentControlSet\\Control\\DeviceClasses\\"
+                                      "{53f56307-b6bf-11d0-94f2-00a0c91efb8b}", 1),
+             (reg.HKEY_LOCAL_MACHINE, "SOFTWARE\\Microsoft\\Windows Portable Devices\\Devices", 1)]
+
+
 def enum_usb():
     """
         Enumerates the USB drives stored on the registry.
@@ -36,98 +49,215 @@ def get_disk_id(key):
         return reg.QueryValueEx(device_parameters_key, "DiskId")[0]
 
 
-def get_device_class_guid(instance_id):
+class SubkeyIndex:
+    """
+        Index of the subkey names of a registry key, built in a single pass.
+        The names are indexed by the '#' separated tokens of the device paths,
+        and by every run of their '&' separated parts, so a device instance id
+        is found, or missed, without enumerating the key again.
+    """
+
+    def __init__(self, path):
+        """
+            @param path: HKLM path of the key to index.
+        """
+        self.names = list()
+        self.tokens = dict()
+
+        with reg.OpenKeyEx(reg.HKEY_LOCAL_MACHINE, path) as key:
+            for key_inx in range(reg.QueryInfoKey(key)[0]):
+                self.add(reg.EnumKey(key, key_inx))
+
+    def add(self, key_name):
+        """
+            Adds a subkey name to the index.
+            @param key_name: Subkey name.
+        """
+        name_inx = len(self.names)
+        self.names.append(key_name)
+
+        for token in key_name.split("#"):
+            parts = token.split("&")
+
+            # An instance id is found inside a token, as in '7&2a8b3c4&0&AA0000000001&0'.
+            for start in range(len(parts)):
+                for end in range(start + 1, len(parts) + 1):
+                    inxs = self.tokens.setdefault("&".join(parts[start:end]), list())
+                    if not inxs or inxs[-1] != name_inx:
+                        inxs.append(name_inx)
+
+    def find(self, instance_id, *substrings):
+        """
+            Returns the first subkey name that contains the instance id and
+            every provided substring, or None.
+            @param instance_id: Device instance id.
+            @param substrings: Other strings the key name must contain.
+        """
+        for name_inx in self.tokens.get(instance_id, list()):
+            key_name = self.names[name_inx]
+            if all(substring in key_name for substring in substrings):
+                return key_name
+
+        return None
+
+
+def get_index(indexes, path):
+    """
+        Returns the index of a key, building it the first time it's requested.
+        @param indexes: Dict of the already built indexes, None to not keep it.
+        @param path: HKLM path of the key to index.
+    """
+    if indexes is None:
+        return SubkeyIndex(path)
+
+    if path not in indexes:
+        indexes[path] = SubkeyIndex(path)
+
+    return indexes[path]
+
+
+def get_device_class_guid(instance_id, indexes=None):
     """
         Get the USB device class guid.
         @param instance_id: The device instance id.
+        @param indexes: Dict of subkey indexes shared between the devices.
     """
     path = "SYSTEM\\CurrentControlSet\\Enum\\STORAGE\\Volume"
+    key_name = get_index(indexes, path).find(instance_id)
 
-    with reg.OpenKeyEx(reg.HKEY_LOCAL_MACHINE, path) as key:
-        for key_inx in range(reg.QueryInfoKey(key)[0]):
-            key_name = reg.EnumKey(key, key_inx)
-
-            if instance_id in key_name:
-                # This is where the GUID begins.
-                guid_inx = key_name.rfind("{")
-                return key_name[guid_inx:]
+    if key_name is not None:
+        # This is where the GUID begins.
+        guid_inx = key_name.rfind("{")
+        return key_name[guid_inx:]
 
 
-def get_first_attached_date(device_class_guid, instance_id):
+def get_first_attached_date(device_class_guid, instance_id, indexes=None):
     """
-        Get the first time a USB drive was attached to the system.
+        Get the first time a USB drive was attached to the system, as
+        a 64-bits Windows timestamp.
         @param device_class_guid: The device guid.
         @param instance_id: Device serial number or instance id.
+        @param indexes: Dict of subkey indexes shared between the devices.
     """
     path = "SYSTEM\\CurrentControlSet\\Control\\DeviceClasses\\{0}".format(device_class_guid)
+    key_name = get_index(indexes, path).find(instance_id, device_class_guid)
 
-    with reg.OpenKeyEx(reg.HKEY_LOCAL_MACHINE, path) as key:
-        # Iterate over the registry keys.
-        for key_inx in range(reg.QueryInfoKey(key)[0]):
-            key_name = reg.EnumKey(key, key_inx)
+    if key_name is not None:
+        # Open the device registry key.
+        with reg.OpenKeyEx(reg.HKEY_LOCAL_MACHINE, "{0}\\{1}".format(path, key_name)) as device_key:
+            # Last accessed time.
+            return reg.QueryInfoKey(device_key)[2]
 
-            if (device_class_guid in key_name) and (instance_id in key_name):
-                # Open the device registry key.
-                with reg.OpenKeyEx(key, key_name) as device_key:
-                    # Store last accessed time.
-                    windows_time = reg.QueryInfoKey(device_key)[2]
-                    return utils.get_time(windows_time)
 
-
-def get_device_name(instance_id):
+def get_device_name(instance_id, indexes=None):
     """
         Get the device name.
         @param instance_id: Instance id of the device.
+        @param indexes: Dict of subkey indexes shared between the devices.
     """
     path = "SOFTWARE\\Microsoft\\Windows Portable Devices\\Devices"
-    with reg.OpenKeyEx(reg.HKEY_LOCAL_MACHINE, path) as key:
-        for inx in range(reg.QueryInfoKey(key)[0]):
-            key_name = reg.EnumKey(key, inx)
+    key_name = get_index(indexes, path).find(instance_id)
+
+    if key_name is not None:
+        with reg.OpenKeyEx(reg.HKEY_LOCAL_MACHINE, "{0}\\{1}".format(path, key_name)) as sub_key:
+            return reg.QueryValueEx(sub_key, "FriendlyName")[0]
 
-            if instance_id in key_name:
-                with reg.OpenKeyEx(key, key_name) as sub_key:
-                    return reg.QueryValueEx(sub_key, "FriendlyName")[0]
-                
 
-def prev_attached_usb():
+def usb_device(sub_key, indexes=None, device_query=None):
     """
-        Returns information about the previously connected
-        usb drives.
+        Returns the information of a previously connected usb drive.
+        @param sub_key: HKLM path of the device instance key.
+        @param indexes: Dict of subkey indexes shared between the devices.
+        @param device_query: query.Query of the fields to read, every field by default.
+
+        @returns UsbDevice: The device, or None if it doesn't meet the query conditions.
     """
-    for sub_key in enum_usb():
-        # Additional information of the connected USB storage device.
-        extra = list()
+    device_query = device_query or query.Query(records.UsbDevice)
 
-        with reg.OpenKeyEx(reg.HKEY_LOCAL_MACHINE, sub_key) as usb:
-            instance_id_inx = sub_key.rfind("\\") + 1
-            sys_gen_inx = sub_key.rfind("&")
-            instance_id = sub_key[instance_id_inx:sys_gen_inx]
+    # Additional information of the connected USB storage device.
+    extra = list()
 
-            if sys_gen_inx > 0:
-                extra.append("Device doesn't have a serial number")
-            
-            # Names.
-            friendly_name = reg.QueryValueEx(usb, "FriendlyName")[0]
-            device_name = get_device_name(instance_id)
+    # The lookups on other keys are made when their fields are first read,
+    # and they share the subkey indexes.
+    if indexes is None:
+        indexes = dict()
 
-            # IDs.
-            container_id = reg.QueryValueEx(usb, "ContainerID")[0]
-            class_guid = reg.QueryValueEx(usb, "ClassGUID")[0]
-            disk_id = get_disk_id(usb)
-            device_class_guid = get_device_class_guid(instance_id)
+    def read_value(key, field, value_name):
+        if not device_query.wants(field):
+            return None
+        return reg.QueryValueEx(key, value_name)[0]
 
-            # Extras.
-            mfg = reg.QueryValueEx(usb, "Mfg")[0]
-            driver = reg.QueryValueEx(usb, "Driver")[0]
-            windows_time = get_first_attached_date(device_class_guid, instance_id)
+    with reg.OpenKeyEx(reg.HKEY_LOCAL_MACHINE, sub_key) as usb:
+        instance_id_inx = sub_key.rfind("\\") + 1
+        sys_gen_inx = sub_key.rfind("&")
+        instance_id = sub_key[instance_id_inx:sys_gen_inx]
 
-            yield device_name, windows_time, friendly_name, container_id,\
-                  class_guid, disk_id, device_class_guid, mfg, driver, extra
+        if sys_gen_inx > 0:
+            extra.append("Device doesn't have a serial number")
 
+        if not device_query.accepts("extra", extra):
+            return None
 
-if __name__ == "__main__":
+        # Names.
+        friendly_name = read_value(usb, "friendly_name", "FriendlyName")
+        if not device_query.accepts("friendly_name", friendly_name):
+            return None
+
+        device_name = None
+        if device_query.wants("device_name"):
+            device_name = records.Lazy(get_device_name, instance_id, indexes)
+
+        # IDs.
+        container_id = read_value(usb, "container_id", "ContainerID")
+        class_guid = read_value(usb, "class_guid", "ClassGUID")
+        if not (device_query.accepts("container_id", container_id) and device_query.accepts("class_guid", class_guid)):
+            return None
+
+        disk_id = get_disk_id(usb) if device_query.wants("disk_id") else None
+        class_guid_lookup = records.Lazy(get_device_class_guid, instance_id, indexes)
+
+        # Extras.
+        mfg = read_value(usb, "mfg", "Mfg")
+        driver = read_value(usb, "driver", "Driver")
+
+        windows_time = None
+        if device_query.wants("first_attached"):
+            windows_time = records.Lazy(lambda: get_first_attached_date(class_guid_lookup.resolve(), instance_id,
+                                                                        indexes))
+
+        device_class_guid = class_guid_lookup if device_query.wants("device_class_guid") else None
+
+        device = records.UsbDevice(device_name, windows_time, friendly_name, container_id,
+                                   class_guid, disk_id, device_class_guid, mfg, driver, extra)
+
+        # The conditions of the lazy fields are checked last.
+        return device if device_query.match(device) else None
+
+
+def prev_attached_usb(fields=None, where=None):
+    """
+        Returns information about the previously connected
+        usb drives.
+        @param fields: Names of the fields to read, every field by default.
+        @param where: Dict that maps field names to conditions (see query.Query).
+    """
+    device_query = query.Query(records.UsbDevice, fields, where)
+
+    # Subkey indexes of the keys searched for every device.
+    indexes = dict()
+
+    for sub_key in enum_usb():
+        device = usb_device(sub_key, indexes, device_query)
+
+        if device is not None:
+            yield device
+
+
+def print_usb_devices():
+    """ Prints the previously attached usb devices. """
     for info in prev_attached_usb():
-        print("\n[*] Device name: {0} \tFirst date attached: {1}\n".format(info[0], info[1]))
+        first_attached = utils.get_time(info[1]) if info[1] is not None else None
+        print("\n[*] Device name: {0} \tFirst date attached: {1}\n".format(info[0], first_attached))
         print("\t[+] Device friendly name: {0}".format(info[2]))
         print("\t[+] Container ID: {0}\n".format(info[3]))
 
@@ -140,3 +270,16 @@ if __name__ == "__main__":
 
         for extra_info in info[9]:
             print("\t[+] Extra information: {0}\n".format(extra_info))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python script to print a list of the previously attached usb devices.")
+    output.add_arguments(parser)
+
+    args = parser.parse_args()
+
+    if args.format is not None:
+        output.write_records(prev_attached_usb(query.parse_fields(args.fields), query.parse_where(args.where)), args.format, args.output)
+        sys.exit()
+
+    print_usb_devices()
@@ -1,7 +1,12 @@
 import argparse
+import itertools
+import output
+import query
+import records
+import registry as reg
+import shellitems
 import sys
 import utils
-import winreg as reg
 
 
 __author__ = "pacmanator"
@@ -9,10 +14,15 @@ __email__ = "mrpacmanator at gmail dot com"
 __version__ = "v1.0"
 
 
+# Keys read by the collector for each user sid: (root key, path, levels of subkeys).
+KEY_PATHS = [(reg.HKEY_USERS, "{0}\\SOFTWARE\\Microsoft\\Windows\\CurrentVersion"
+                              "\\Explorer\\ComDlg32\\LastVisitedPidlMRU", 0)]
+
+
 def get_process_name(proc_name):
     """
         Get the exe process.
-        @param proc_name: Sanitized name of the process.
+        @param proc_name: Name of the process.
     """
     indexOfExe = proc_name.lower().find(".exe")
 
@@ -22,46 +32,112 @@ def get_process_name(proc_name):
         return "{0} not an exe process.".format(proc_name)
 
 
-def last_pid(user_sid, verbose):
+def last_pid_records(user_sid, fields=None, where=None, limit=None):
     """
-        This function returns the last visited process ID by
-        some user.
+        Yields a LastProcess record per process of the last visited
+        processes of some user.
         @param user_sid: User sid.
-        @param verbose: Print raw information of the process.
+        @param fields: Names of the fields to read, every field by default.
+        @param where: Dict that maps field names to conditions (see query.Query).
+        @param limit: Number of the most recent processes read, all of them by default.
     """
+    process_query = query.Query(records.LastProcess, fields, where)
+
+    if not process_query.accepts("user_sid", user_sid):
+        return
+
     path = "{0}\\SOFTWARE\\Microsoft\\Windows\\CurrentVersion".format(user_sid)
     path += "\\Explorer\\ComDlg32\\LastVisitedPidlMRU"
 
-    # Last time the key was modified.
-    last_write_time = 0
+    # The values are only read for these fields.
+    value_fields = ("process_name", "folder", "data")
 
     try:
-        processes = list()
         with reg.OpenKeyEx(reg.HKEY_USERS, path, 0, reg.KEY_READ) as key:
 
-            last_write_time = utils.get_time(reg.QueryInfoKey(key)[2])
+            # Last time the key was modified.
+            last_write_time = reg.QueryInfoKey(key)[2]
+            if not process_query.accepts("last_written", last_write_time):
+                return
+
+            mru_list_ex = reg.QueryValueEx(key, "MRUListEx")[0]
 
-            for mru_inx in utils.parse_mru_inx(reg.QueryValueEx(key, "MRUListEx")[0]):
-                # Remove not readable chars from the registry value.
+            for position, mru_inx in enumerate(itertools.islice(utils.iter_mru_inx(mru_list_ex), limit)):
+                if not process_query.accepts("position", position):
+                    continue
 
-                if verbose:
-                    process_data = utils.remove_chars(reg.QueryValueEx(key, str(mru_inx))[0])
-                    process_name = get_process_name(process_data)
-                    processes.append("{0}\n\t\t[-]Verbose data: {1}\n".format(process_name, process_data))
-                else:
-                    process_data = utils.remove_chars(reg.QueryValueEx(key, str(mru_inx))[0])
-                    processes.append(get_process_name(process_data))
+                process_name = folder = process_data = None
+
+                if any(process_query.wants(field) for field in value_fields):
+                    process_value = reg.QueryValueEx(key, str(mru_inx))[0]
+
+                    # The process name is followed by the last folder it visited.
+                    process = shellitems.parse_mru_value(process_value)
+                    process_name = get_process_name(process.name)
+                    folder = process.path
+
+                    # Remove not readable chars from the registry value.
+                    if process_query.wants("data"):
+                        process_data = utils.remove_chars(process_value)
+
+                record = records.LastProcess(user_sid, position, process_name, folder, process_data, last_write_time)
+                if process_query.match(record):
+                    yield record
 
     except FileNotFoundError:
         pass
 
+
+def last_pid(user_sid, verbose, limit=None):
+    """
+        This function returns the last visited process ID by
+        some user.
+        @param user_sid: User sid.
+        @param verbose: Print raw information of the process.
+        @param limit: Number of the most recent processes read, all of them by default.
+    """
+    # Last time the key was modified.
+    last_write_time = 0
+
+    processes = list()
+    for process in last_pid_records(user_sid, limit=limit):
+        last_write_time = utils.get_time(process.last_written)
+
+        if verbose:
+            processes.append("{0}\n\t\t[-]Last visited folder: {1}\n\t\t[-]Verbose data: {2}\n".format(
+                process.process_name, process.folder, process.data))
+        else:
+            processes.append(process.process_name)
+
     return last_write_time, processes
 
 
-def print_all_users_lpids(verbose):
-    for user_sid in utils.users_list():
+def user_records(user_name, fields=None, where=None, limit=None, user_sids=None):
+    """
+        Yields the LastProcess records of a single user, or of every user.
+        @param user_name: User name, None for every user.
+        @param fields: Names of the fields to read, every field by default.
+        @param where: Dict that maps field names to conditions (see query.Query).
+        @param limit: Number of the most recent processes read, all of them by default.
+        @param user_sids: Sids of every user, when they were already listed.
+    """
+    if user_name is None:
+        for user_sid in (utils.users_list() if user_sids is None else user_sids):
+            yield from last_pid_records(user_sid, fields, where, limit)
+        return
+
+    user_id = utils.user2sid(user_name)
+    if user_id is None:
+        print("Error: User doesn't exists", file=sys.stderr)
+        sys.exit()
+
+    yield from last_pid_records(user_id, fields, where, limit)
+
+
+def print_all_users_lpids(verbose, limit=None, user_sids=None):
+    for user_sid in (utils.users_list() if user_sids is None else user_sids):
         user_name = utils.get_user_name(user_sid)[1]
-        processes_info = last_pid(user_sid, verbose=verbose)
+        processes_info = last_pid(user_sid, verbose=verbose, limit=limit)
 
         if len(processes_info[1]) == 0:
             print("[!!] Looks like user {0} doesn't have a last PID list.\n".format(user_name))
@@ -82,14 +158,14 @@ def print_all_users_lpids(verbose):
             newline_countdown += 1
 
 
-def print_single_user_lpd(user_name, verbose):
+def print_single_user_lpd(user_name, verbose, limit=None):
 
     user_id = utils.user2sid(user_name)
     if user_id is None:
         print("Error: User doesn't exists", file=sys.stderr)
         sys.exit()
 
-    processes_info = last_pid(user_id, verbose=verbose)
+    processes_info = last_pid(user_id, verbose=verbose, limit=limit)
 
     if len(processes_info[1]) == 0:
         print("[!!] Looks like user {0} doesn't have a last PID list.\n".format(user_name))
@@ -114,10 +190,19 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Python script to print a list of the last processes executed by some user.")
     parser.add_argument("-v", dest="verbose", action="store_true", help="Print a raw version of the key value.")
     parser.add_argument("-u", dest="user", action="store", help="User name to get the last processes from.")
+    parser.add_argument("--limit", dest="limit", action="store", type=int, default=None,
+                        help="Number of the most recent processes read, all of them by default.")
+    output.add_arguments(parser)
 
     args = parser.parse_args()
 
-    if args.user is None:
-        print_all_users_lpids(args.verbose)
-    else:
-        print_single_user_lpd(args.user, args.verbose)
+    # The profile keys are read once for every user.
+    with reg.cached():
+        if args.format is not None:
+            records_query = (query.parse_fields(args.fields), query.parse_where(args.where))
+            output.write_records(user_records(args.user, *records_query, args.limit), args.format, args.output)
+
+        elif args.user is None:
+            print_all_users_lpids(args.verbose, args.limit)
+        else:
+            print_single_user_lpd(args.user, args.verbose, args.limit)
@@ -1,6 +1,12 @@
+import argparse
+import itertools
+import output
+import query
+import records
+import registry as reg
+import shellitems
 import sys
 import utils
-import winreg as reg
 
 
 __author__ = "pacmanator"
@@ -8,133 +14,238 @@ __email__ = "mrpacmanator at gmail dot com"
 __version__ = "v1.0"
 
 
-def get_filename(filename, file_extension):
+# Keys read by the collector for each user sid: (root key, path, levels of subkeys).
+KEY_PATHS = [(reg.HKEY_USERS, "{0}\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\RecentDocs", 1)]
+
+
+def iter_recent_files(file_extension_key, limit=None):
     """
-        Returns the filename of the provided RecentDocs key value.
-        @param filename: The name of the file.
-        @param file_extension: The file extension.
+        Yields the recently opened files of a file extension, from the most
+        recent to the oldest one, as each value is read.
+        @param file_extension_key: Open key of the MRU file extension.
+        @param limit: Number of the most recent files read, all of them by default.
     """
-    # Index where the file extension begins.
-    file_extension_inx = filename.lower().find(file_extension.lower())
-    return filename[:file_extension_inx + len(file_extension)]
+    # MRU files indexes.
+    mru_list_ex = reg.QueryValueEx(file_extension_key, "MRUListEx")[0]
+
+    for file_index in itertools.islice(utils.iter_mru_inx(mru_list_ex), limit):
+        # I have no idea how to call this variable...
+        mru_unit = reg.QueryValueEx(file_extension_key, str(file_index))[0]
+
+        # The value starts with the UTF-16LE file name.
+        yield shellitems.parse_mru_value(mru_unit).name
 
 
-def get_recent_docs(key, file_extension):
+def get_recent_docs(key, file_extension, limit=None):
     """
         Get the recently opened files, based on its file extension.
+        The extension key is opened once, while the files are read.
         @param key: Hive key.
         @param file_extension: The MRU file extension.
-    """
-    # Recent files.
-    recent_docs = list()
+        @param limit: Number of the most recent files read, all of them by default.
 
+        @returns generator: (file, last accessed date) tuples.
+    """
     with reg.OpenKeyEx(key, file_extension) as file_extension_key:
-        # MRU files indexes.
-        mru_list_ex = reg.QueryValueEx(file_extension_key, "MRUListEx")[0]
-
         # Get the last time this key was modified.
-        last_accessed_key_date = utils.get_time(reg.QueryInfoKey(file_extension_key)[2])
+        last_accessed_key_date = reg.QueryInfoKey(file_extension_key)[2]
 
-        for file_index in utils.parse_mru_inx(mru_list_ex):
-            # I have no idea how to call this variable...
-            mru_unit = reg.QueryValueEx(file_extension_key, str(file_index))[0]
+        for file in iter_recent_files(file_extension_key, limit):
+            yield file, last_accessed_key_date
 
-            # Remove all unreadable characters from the filename.
-            filename = get_filename(utils.remove_chars(mru_unit), file_extension)
-            recent_docs.append(filename)
-    
-        return recent_docs, last_accessed_key_date
 
+def iter_recent_docs(mru_key, limit=None):
+    """
+        Yields the recently opened files of each file extension, as each
+        extension subkey is read. The files of an extension are read before
+        the next extension, while its key is open.
+        @param mru_key: Open RecentDocs key of a user.
+        @param limit: Number of the most recent files read per extension, all of them by default.
 
-def recent_docs(user_sid):
-    """ This function prints the most recent documents used by a
-        a registered user on the windows hive key.
+        @returns generator: (file extension, (files, last accessed date)) tuples.
     """
-    # Recent documnent HKEY path of each user.
-    mru_path = user_sid + "\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\RecentDocs"
+    for ext in range(reg.QueryInfoKey(mru_key)[0]):
+        file_extension = reg.EnumKey(mru_key, ext)
+
+        # Skip the folder subkey.
+        if file_extension == "Folder":
+            continue
 
-    # Last modified date of the root key.
-    root_last_modified_date = 0
+        with reg.OpenKeyEx(mru_key, file_extension) as file_extension_key:
+            last_accessed_date = reg.QueryInfoKey(file_extension_key)[2]
+            yield file_extension, (iter_recent_files(file_extension_key, limit), last_accessed_date)
 
-    # Most recentrly used file extensions.
-    files = dict()
+
+def recent_docs(user_sid, limit=None):
+    """ This function returns the most recent documents used by a
+        a registered user on the windows hive key. The RecentDocs key is
+        opened once, while the extensions are read.
+        @param limit: Number of the most recent files read per extension, all of them by default.
+
+        @returns generator: (file extension, (files, last accessed date), last modified
+                            date of the root key) tuples, see iter_recent_docs.
+    """
+    # Recent documnent HKEY path of each user.
+    mru_path = user_sid + "\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\RecentDocs"
 
     # If the user doesn't have the previous sub key, then it
     # has no history of 'Recent Opened' files.
     try:
-
         with reg.OpenKeyEx(reg.HKEY_USERS, mru_path) as mru_key:
-            num_sub_keys = reg.QueryInfoKey(mru_key)[0]
+            root_last_modified_date = reg.QueryInfoKey(mru_key)[2]
+
+            for file_extension, value in iter_recent_docs(mru_key, limit):
+                yield file_extension, value, root_last_modified_date
+
+    except FileNotFoundError:
+        pass
 
-            # Enumerates all the recent files extensions and saves them on a list.
-            files_extensions = [reg.EnumKey(mru_key, ext) for ext in range(0, num_sub_keys)]
-            root_last_modified_date = utils.get_time(reg.QueryInfoKey(mru_key)[2])
 
-            for file_extension in files_extensions:
+def recent_docs_records(user_sid, fields=None, where=None, limit=None):
+    """
+        Yields a RecentDoc record per recently opened file of a user.
+        The extension subkeys and the values that don't meet the conditions
+        aren't read.
+        @param user_sid: User sid.
+        @param fields: Names of the fields to read, every field by default.
+        @param where: Dict that maps field names to conditions (see query.Query).
+        @param limit: Number of the most recent files read per extension, all of them by default.
+    """
+    doc_query = query.Query(records.RecentDoc, fields, where)
+
+    if not doc_query.accepts("user_sid", user_sid):
+        return
+
+    mru_path = user_sid + "\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\RecentDocs"
+
+    try:
+        with reg.OpenKeyEx(reg.HKEY_USERS, mru_path) as mru_key:
+            # The extension subkeys are enumerated as they're read.
+            for ext in range(reg.QueryInfoKey(mru_key)[0]):
+                file_extension = reg.EnumKey(mru_key, ext)
+
                 # Skip the folder subkey.
-                if file_extension == "Folder":
+                if file_extension == "Folder" or not doc_query.accepts("extension", file_extension):
                     continue
 
-                files[file_extension] = get_recent_docs(mru_key, file_extension)
+                with reg.OpenKeyEx(mru_key, file_extension) as file_extension_key:
+                    last_accessed_date = reg.QueryInfoKey(file_extension_key)[2]
+                    if not doc_query.accepts("last_accessed", last_accessed_date):
+                        continue
+
+                    mru_list_ex = reg.QueryValueEx(file_extension_key, "MRUListEx")[0]
+
+                    for position, file_index in enumerate(itertools.islice(utils.iter_mru_inx(mru_list_ex), limit)):
+                        if not doc_query.accepts("position", position):
+                            continue
+
+                        filename = None
+                        if doc_query.wants("filename"):
+                            mru_unit = reg.QueryValueEx(file_extension_key, str(file_index))[0]
+                            filename = shellitems.parse_mru_value(mru_unit).name
+
+                            if not doc_query.accepts("filename", filename):
+                                continue
+
+                        yield records.RecentDoc(user_sid, file_extension, position, filename, last_accessed_date)
 
     except FileNotFoundError:
         pass
 
-    return files, root_last_modified_date
 
+def print_user_mru(user_sid, title, limit=None):
+    """
+        Prints the recently opened files of a user, as each file extension is read.
+        @param user_sid: User sid.
+        @param title: User shown on the header.
+        @param limit: Number of the most recent files read per extension, all of them by default.
 
-def print_all_users_mru():
-    for user_sid in utils.users_list():
+        @returns bool: Whether the user has a 'most recent files' history.
+    """
+    mru_path = user_sid + "\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\RecentDocs"
+    found = False
 
-        mru_user_data = recent_docs(user_sid)
+    try:
+        with reg.OpenKeyEx(reg.HKEY_USERS, mru_path) as mru_key:
+            for key, value in iter_recent_docs(mru_key, limit):
+                files, last_accessed_date = value[0], value[1]
 
-        if len(mru_user_data[0]) == 0:
-            print("It seems that {0} doesn't have a 'most recent files' history.".format(user_sid))
-            continue
+                if not found:
+                    print("[*] Showing MRU docs of user {0}".format(title))
+                    print("[+] Last modified date of the root key:", utils.get_time(reg.QueryInfoKey(mru_key)[2]))
+                    found = True
+
+                print("\n\t[+] Showing files for extention: {0}".format(key))
+                print("\t[!!] Files are shown from the most recent to the oldest one.")
+                print("\t[+] Last accessed date: {0}".format(utils.get_time(last_accessed_date)))
 
-        print("[*] Showing MRU docs of user {0}".format(user_sid))
-        print("[+] Last modified date of the root key:", mru_user_data[1])
+                for file in files:
+                    print("\t\t[-] File:", file)
 
-        for key, value in mru_user_data[0].items():
-            files, last_accessed_date = value[0], value[1]
+    except FileNotFoundError:
+        pass
+
+    if not found:
+        print("It seems that {0} doesn't have a 'most recent files' history.".format(user_sid))
+
+    return found
 
-            print("\n\t[+] Showing files for extention: {0}".format(key))
-            print("\t[!!] Files are shown from the most recent to the oldest one.")
-            print("\t[+] Last accessed date: {0}".format(last_accessed_date))
-            for file in files:
-                print("\t\t[-] File:", file)
 
+def print_all_users_mru(limit=None, user_sids=None):
+    for user_sid in (utils.users_list() if user_sids is None else user_sids):
+        print_user_mru(user_sid, user_sid, limit)
 
-def print_single_user_mru(user_name):
+
+def print_single_user_mru(user_name, limit=None):
     user_id = utils.user2sid(user_name)
 
     if user_id is None:
         print("Error: User doesn't exists", file=sys.stderr)
         sys.exit()
 
-    mru_user_data = recent_docs(user_id)
+    return print_user_mru(user_id, "'{0}' -> id: {1}".format(user_name, user_id), limit)
 
-    if len(mru_user_data[0]) == 0:
-        print("It seems that {0} doesn't have a 'most recent files' history.".format(user_id))
-        return False
 
-    print("[*] Showing MRU docs of user '{0}' -> id: {1}".format(user_name, user_id))
-    print("[+] Last modified date of the root key:", mru_user_data[1])
+def user_records(user_name, fields=None, where=None, limit=None, user_sids=None):
+    """
+        Yields the RecentDoc records of a single user, or of every user.
+        @param user_name: User name, None for every user.
+        @param fields: Names of the fields to read, every field by default.
+        @param where: Dict that maps field names to conditions (see query.Query).
+        @param limit: Number of the most recent files read per extension, all of them by default.
+        @param user_sids: Sids of every user, when they were already listed.
+    """
+    if user_name is None:
+        for user_sid in (utils.users_list() if user_sids is None else user_sids):
+            yield from recent_docs_records(user_sid, fields, where, limit)
+        return
 
-    for key, value in mru_user_data[0].items():
-        files, last_accessed_date = value[0], value[1]
+    user_id = utils.user2sid(user_name)
 
-        print("\n\t[+] Showing files for extention: {0}".format(key))
-        print("\t[!!] Files are shown from the most recent to the oldest one.")
-        print("\t[+] Last accessed date: {0}".format(last_accessed_date))
+    if user_id is None:
+        print("Error: User doesn't exists", file=sys.stderr)
+        sys.exit()
 
-        for file in files:
-            print("\t\t[-] File:", file)
+    yield from recent_docs_records(user_id, fields, where, limit)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print_all_users_mru()
+    parser = argparse.ArgumentParser(description="Python script to print the most recent opened files of some user.")
+    parser.add_argument("user", action="store", nargs="?", default=None, help="User name to get the recent files from.")
+    parser.add_argument("--limit", dest="limit", action="store", type=int, default=None,
+                        help="Number of the most recent files read per extension, all of them by default.")
+    output.add_arguments(parser)
+
+    args = parser.parse_args()
+
+    # The profile keys are read once for every user.
+    with reg.cached():
+        if args.format is not None:
+            records_query = (query.parse_fields(args.fields), query.parse_where(args.where))
+            output.write_records(user_records(args.user, *records_query, args.limit), args.format, args.output)
+
+        elif args.user is None:
+            print_all_users_mru(args.limit)
 
-    else:
-        print_single_user_mru(sys.argv[1])
+        else:
+            print_single_user_mru(args.user, args.limit)
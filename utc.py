@@ -1,15 +1,26 @@
+import struct
 import sys
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# FILETIME of 1970-01-01.
+EPOCH_AS_FILETIME = 116444736000000000
+
+_SYSTEMTIME = struct.Struct("<8H")
+_FILETIME = struct.Struct("<Q")
+
 
 def get_be_time(encoded_date):
     """
-        Returns a reversed list. 
+        Returns a reversed list.
         @param encoded_date: NetworkList encoded time value.
     """
-    # Divides the provided value into a four sized element.
-    time_units_hex_le = [encoded_date[inx:inx + 2] for inx in range(0, 16, 2)]
-    # Reverse the list and the bytes.
-    return [time_units_hex_le[inx].hex()[-2:] + time_units_hex_le[inx].hex()[:2] for inx in range(0, 8)]
+    # The big endian hex string of each 16-bits time unit.
+    return ["{0:04x}".format(unit) for unit in _SYSTEMTIME.unpack_from(encoded_date)]
 
 
 def get_time_units(encoded_date):
@@ -17,24 +28,25 @@ def get_time_units(encoded_date):
         Returns a list of the date in the microsoft 'networkList' Registry value. 
         @param encoded_date: NetworkList encoded time value.
     """
-    time_units = []
-    time_units_hex_be = get_be_time(encoded_date)
-
-    # Iterates through the values of the Big-Endian order list.
-    for i in range(len(time_units_hex_be)):
+    # Year, month, week day, day, hour, minute, second and millisecond.
+    return list(_SYSTEMTIME.unpack_from(encoded_date))
 
-        j = 3
-        result = 0
 
-        for digit in time_units_hex_be[i]:
-            # Transforms from hexadecimal to decimal.
-            result += int(digit, base=16) * (16 ** j)
-            j -= 1
+def days_from_civil(year, month, day):
+    """
+        Returns the number of days since 1970-01-01 of a date.
+        It works with ints and with NumPy arrays.
+    """
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
 
-        # Appends the result to a list.
-        time_units.append(result)
+    # Months counted from March, so the leap day is the last day of the year.
+    shifted_month = (month + 9) % 12
 
-    return time_units
+    day_of_year = (153 * shifted_month + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
 
 
 def get_month(month_value):
@@ -97,3 +109,88 @@ def get_utc(encoded_date):
     time = format_time(time_units)
 
     return format_date_time(date, time)
+
+
+def get_filetime(encoded_date):
+    """
+        Converts a NetworkList encoded time to a 64-bits Windows timestamp.
+        @param encoded_date: NetworkList encoded time value.
+    """
+    year, month, _, day, hour, minute, second, millisecond = _SYSTEMTIME.unpack_from(encoded_date)
+
+    seconds = ((days_from_civil(year, month, day) * 24 + hour) * 60 + minute) * 60 + second
+    return (seconds * 1000 + millisecond) * 10000 + EPOCH_AS_FILETIME
+
+
+def _decoded(microseconds, datetime64, as_numpy):
+    """
+        Returns decoded times in the type asked for: a list of ints by
+        default, whether NumPy is installed or not.
+        @param microseconds: Microseconds since 1970-01-01, a list or a NumPy int64 array.
+    """
+    if not datetime64 and not as_numpy:
+        return microseconds.tolist() if numpy is not None and isinstance(microseconds, numpy.ndarray) \
+            else microseconds
+
+    if numpy is None:
+        raise ImportError("NumPy is needed to return NumPy arrays.")
+
+    microseconds = numpy.asarray(microseconds, dtype=numpy.int64)
+    return microseconds.astype("datetime64[us]") if datetime64 else microseconds
+
+
+def decode_filetimes(buffer, datetime64=False, as_numpy=False):
+    """
+        Decodes a buffer of consecutive 64-bits Windows timestamps in a single pass,
+        vectorized when NumPy is installed.
+        @param buffer: Bytes-like object, 8 bytes per timestamp.
+        @param datetime64: Return a NumPy datetime64[us] array.
+        @param as_numpy: Return a NumPy int64 array.
+
+        @returns list: Microseconds since 1970-01-01, unless a NumPy array is asked for.
+    """
+    count = len(buffer) // _FILETIME.size
+
+    if numpy is not None:
+        filetimes = numpy.frombuffer(buffer, dtype="<u8", count=count).astype(numpy.int64)
+        return _decoded((filetimes - EPOCH_AS_FILETIME) // 10, datetime64, as_numpy)
+
+    microseconds = [(filetime - EPOCH_AS_FILETIME) // 10
+                    for (filetime,) in _FILETIME.iter_unpack(memoryview(buffer)[:count * _FILETIME.size])]
+
+    return _decoded(microseconds, datetime64, as_numpy)
+
+
+def decode_systemtimes(buffer, datetime64=False, as_numpy=False):
+    """
+        Decodes a buffer of consecutive NetworkList encoded times (16 bytes
+        SYSTEMTIME structures) in a single pass, vectorized when NumPy is installed.
+        @param buffer: Bytes-like object, 16 bytes per time value.
+        @param datetime64: Return a NumPy datetime64[us] array.
+        @param as_numpy: Return a NumPy int64 array.
+
+        @returns list: Microseconds since 1970-01-01, unless a NumPy array is asked for.
+    """
+    count = len(buffer) // _SYSTEMTIME.size
+
+    if numpy is not None:
+        units = numpy.frombuffer(buffer, dtype="<u2", count=count * 8).reshape(-1, 8).astype(numpy.int64)
+        days = days_from_civil(units[:, 0], units[:, 1], units[:, 3])
+        seconds = ((days * 24 + units[:, 4]) * 60 + units[:, 5]) * 60 + units[:, 6]
+        return _decoded((seconds * 1000 + units[:, 7]) * 1000, datetime64, as_numpy)
+
+    microseconds = list()
+    for year, month, _, day, hour, minute, second, millisecond in \
+            _SYSTEMTIME.iter_unpack(memoryview(buffer)[:count * _SYSTEMTIME.size]):
+        seconds = ((days_from_civil(year, month, day) * 24 + hour) * 60 + minute) * 60 + second
+        microseconds.append((seconds * 1000 + millisecond) * 1000)
+
+    return _decoded(microseconds, datetime64, as_numpy)
+
+
+def systemtimes_to_filetimes(buffer):
+    """
+        Converts a buffer of NetworkList encoded times to 64-bits Windows timestamps.
+        @param buffer: Bytes-like object, 16 bytes per time value.
+    """
+    return [int(microseconds) * 10 + EPOCH_AS_FILETIME for microseconds in decode_systemtimes(buffer)]
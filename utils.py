@@ -1,5 +1,10 @@
+import array
 import datetime
-import winreg as reg
+import hashlib
+import itertools
+import math
+import registry as reg
+import sys
 
 
 __author__ = "pacmanator"
@@ -7,6 +12,16 @@ __email__ = "mrpacmanator at gmail dot com"
 __version__ = "v1.0"
 
 
+# Keys read to list the users: (root key, path, levels of subkeys).
+KEY_PATHS = [(reg.HKEY_LOCAL_MACHINE, "SOFTWARE\\Microsoft\\Windows NT\\CurrentVersion\\ProfileList", 1)]
+
+# Keys read to get the name of each user sid.
+USER_KEY_PATHS = [(reg.HKEY_USERS, "{0}\\Volatile Environment", 0)]
+
+
+# Index that ends the MRUListEx values.
+MRU_LIST_END = 0xFFFFFFFF
+
 # Not readable characters to name a file or directory
 NOT_READABLE_CHARS = [chr(character) for character in range(0, 32)]
 NOT_READABLE_CHARS += [chr(character) for character in range(33, 40)]
@@ -14,28 +29,47 @@ NOT_READABLE_CHARS += ["*", ">", "<", "\"", ":", "?", "\\", "/", "|"]
 NOT_READABLE_CHARS += ["^", "=", "@", "}", "{", ";", "[", "]", "+"]
 
 
+# Translation tables that delete the not readable characters, the bytes
+# bigger than 127 aren't ASCII characters so they're deleted too.
+NOT_READABLE_BYTES = bytes(ord(character) for character in NOT_READABLE_CHARS) + bytes(range(128, 256))
+NOT_READABLE_TABLE = dict.fromkeys(ord(character) for character in NOT_READABLE_CHARS)
+
+
+def utf16_prefix_size(key_value):
+    """
+        Returns the size of the UTF-16LE string (without its terminator) at the
+        beginning of a binary value, or 0 if it doesn't start with one.
+        @param key_value: Binary registry value.
+    """
+    # The first character must be readable and its high byte must be zero,
+    # like the file names stored on the MRU values.
+    if len(key_value) < 2 or key_value[1] != 0 or key_value[0] < 0x20:
+        return 0
+
+    end = key_value.find(b"\x00\x00")
+    while end != -1 and end % 2:
+        end = key_value.find(b"\x00\x00", end + 1)
+
+    return end if end != -1 else len(key_value) & ~1
+
+
 def remove_chars(key_value):
     """ This function removes the not readable characters and
         the not allowed files characters from a string.
+        If a binary value starts with an UTF-16LE string, like the MRU
+        values, that string is decoded so its non ASCII characters are kept.
     """
-    filename = list()
-    for byte in key_value:
+    if isinstance(key_value, str):
+        return key_value.translate(NOT_READABLE_TABLE)
 
-        try:
-            char = chr(byte).encode('utf-8')
-            readable_char = chr(ord(char))
-
-            if not (readable_char in NOT_READABLE_CHARS):
-                filename.append(readable_char)
-            else:
-                continue
+    key_value = bytes(key_value)
+    utf16_size = utf16_prefix_size(key_value)
 
-        # Some windows registry keys has a two-bytes value
-        # this exception skips that encoding error.
-        except TypeError:
-            continue
+    if utf16_size == 0:
+        return key_value.translate(None, NOT_READABLE_BYTES).decode("ascii")
 
-    return "".join(filename)
+    filename = key_value[:utf16_size].decode("utf-16-le", "ignore").translate(NOT_READABLE_TABLE)
+    return filename + key_value[utf16_size + 2:].translate(None, NOT_READABLE_BYTES).decode("ascii")
 
 
 def user2sid(user_name):
@@ -74,6 +108,15 @@ def get_time(windows_time):
     return "{0} UTC".format(time.ctime())
 
 
+def get_iso_time(windows_time):
+    """
+        Converts a windows time to an ISO 8601 UTC time.
+        @param windows_time: 64-bits Windows timestamp.
+    """
+    time = datetime.datetime(1601,1,1) + datetime.timedelta(microseconds=windows_time//10)
+    return "{0}Z".format(time.isoformat())
+
+
 def users_list():
     """ 
         Returns the sid of non-system users.
@@ -101,23 +144,66 @@ def users_list():
     return users
 
 
-def parse_mru_inx(mru_list_ex):
+def iter_mru_inx(mru_list_ex):
+    """
+        Yields the indexes of a MRUListEx value, from the most recent entry
+        to the oldest one, until its 0xFFFFFFFF terminator.
+        @param mru_list_ex: MRUListEx value, an array of little endian double words.
+    """
+    if not mru_list_ex:
+        return
+
+    view = memoryview(mru_list_ex)
+    indexes = view[:len(view) & ~3].cast("I")
+
+    if sys.byteorder == "big":
+        indexes = array.array("I", indexes)
+        indexes.byteswap()
+
+    for index in indexes:
+        if index == MRU_LIST_END:
+            return
+        yield index
+
+
+def parse_mru_inx(mru_list_ex, limit=None):
     """
         Return an index of the most recently opened files.
         @param mru_list_ex: MRUListEx value.
+        @param limit: Number of the most recent indexes returned, all of them by default.
     """
-    # MRU files index.
-    file_inx = list()
+    return list(itertools.islice(iter_mru_inx(mru_list_ex), limit))
 
-    # Iterates through the whole MRUListEx value in bytes chunks.
-    for inx in range(0, len(mru_list_ex) - 4, 4):
-        # Divides de MRUListEx into chunks of 4 bytes.
-        chunk = mru_list_ex[inx:inx + 4]
 
-        # Adds the hexadecimal values of the provided MRUListEx chunk.
-        file_inx.append(sum([chunk[inx]  for inx in range(4)]))
+class BloomFilter:
+    """
+        Set of strings with a bounded memory, for the deduplication of huge
+        inputs: its size depends on its capacity and error rate, not on the
+        added strings. A string is never reported as new twice, but a new
+        string is reported as already added at the error rate.
+    """
 
-    return file_inx
+    def __init__(self, capacity, error_rate=0.001):
+        """
+            @param capacity: Number of strings added before the error rate grows.
+            @param error_rate: Probability that a new string is reported as already added.
+        """
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Every bit position is derived from the two halves of a single digest.
+        digest = hashlib.blake2b(str(item).encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + inx * second) % self.size for inx in range(self.hashes)]
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
 
 
 def get_normal_user_name(user_sid):